@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# bench_config_load.py
+# Copyright (C) 2014 LEAP
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Micro-benchmark for loading the configs of a provider.
+
+Loads each config of an already bootstrapped provider with the plain
+BaseConfig.load, which validates on every load, and with the shared
+validators of leap.bitmask.config.validatedconfig.
+
+Usage:
+    bench_config_load.py <provider domain> [loads]
+"""
+import os
+import sys
+import time
+
+from leap.bitmask.config.providerconfig import ProviderConfig
+from leap.bitmask.services.eip.eipconfig import EIPConfig
+from leap.bitmask.services.mail.smtpconfig import SMTPConfig
+from leap.bitmask.services.soledad.soledadconfig import SoledadConfig
+from leap.bitmask.util import get_path_prefix
+from leap.common.config.baseconfig import BaseConfig
+
+CONFIGS = (
+    (ProviderConfig, "provider.json"),
+    (EIPConfig, "eip-service.json"),
+    (SMTPConfig, "smtp-service.json"),
+    (SoledadConfig, "soledad-service.json"),
+)
+
+
+def _time_loads(load, config_class, path, api_version, loads):
+    """
+    Return the average time of a load, in microseconds.
+    """
+    start = time.time()
+    for _ in xrange(loads):
+        config = config_class()
+        if config_class is not ProviderConfig:
+            config.set_api_version(api_version)
+        if not load(config, path):
+            raise RuntimeError("Could not load %s" % (path,))
+    return (time.time() - start) / loads * 1e6
+
+
+def main():
+    if len(sys.argv) < 2:
+        print __doc__
+        sys.exit(1)
+
+    domain = sys.argv[1]
+    loads = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    provider_path = os.path.join("leap", "providers", domain)
+    provider_config = ProviderConfig()
+    if not provider_config.load(os.path.join(provider_path, "provider.json")):
+        print "No provider.json for %s, bootstrap it first." % (domain,)
+        sys.exit(1)
+    api_version = provider_config.get_api_version()
+
+    print "%-16s %12s %12s %8s" % ("config", "base (us)", "cached (us)",
+                                   "speedup")
+    for config_class, name in CONFIGS:
+        path = os.path.join(provider_path, name)
+        if not os.path.isfile(os.path.join(get_path_prefix(), path)):
+            print "%-16s %12s" % (config_class.__name__, "missing")
+            continue
+
+        base = _time_loads(BaseConfig.load, config_class, path,
+                           api_version, loads)
+        cached = _time_loads(config_class.load, config_class, path,
+                             api_version, loads)
+        print "%-16s %12.1f %12.1f %7.1fx" % (config_class.__name__, base,
+                                              cached, base / cached)
+
+
+if __name__ == "__main__":
+    main()
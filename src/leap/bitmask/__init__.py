@@ -19,6 +19,7 @@ Init file for leap.bitmask
 
 Initializes version and app info.
 """
+import os
 import re
 
 from pkg_resources import parse_version
@@ -55,10 +56,16 @@ __short_version__ = "unknown"
 
 try:
     from leap.bitmask._version import get_versions
-    __version__ = get_versions()['version']
-    __version_hash__ = get_versions()['full']
+    from leap.bitmask.util import versioncache
+    # src/leap/bitmask -> the root of the source tree, if running from one
+    _root = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         os.pardir, os.pardir, os.pardir)
+    _versions = versioncache.get_versions(os.path.normpath(_root),
+                                          get_versions)
+    __version__ = _versions['version']
+    __version_hash__ = _versions['full']
     IS_RELEASE_VERSION = _is_release_version(__version__)
-    del get_versions
+    del get_versions, versioncache, _root, _versions
 except ImportError:
     #running on a tree that has not run
     #the setup.py setver
@@ -46,20 +46,14 @@ import os
 
 from functools import partial
 
-from PySide import QtCore, QtGui
-
 from leap.bitmask import __version__ as VERSION
 from leap.bitmask.util import leap_argparse
 from leap.bitmask.util import log_silencer, LOG_FORMAT
-from leap.bitmask.util.leap_log_handler import LeapLogHandler
+from leap.bitmask.util.startup_profiler import profiler
+from leap.bitmask.util.startup_profiler import finish_on_first_paint
 from leap.bitmask.util.streamtologger import StreamToLogger
 from leap.bitmask.platform_init import IS_WIN
-from leap.bitmask.services.mail import plumber
 from leap.common.events import server as event_server
-from leap.mail import __version__ as MAIL_VERSION
-
-from twisted.internet import reactor
-from twisted.internet.task import LoopingCall
 
 import codecs
 codecs.register(lambda name: codecs.lookup('utf-8')
@@ -89,7 +83,8 @@ def sigterm_handler(*args, **kwargs):
     mainwindow.quit()
 
 
-def add_logger_handlers(debug=False, logfile=None, replace_stdout=True):
+def add_logger_handlers(debug=False, logfile=None, replace_stdout=True,
+                        gui=True):
     """
     Create the logger and attach the handlers.
 
@@ -97,6 +92,9 @@ def add_logger_handlers(debug=False, logfile=None, replace_stdout=True):
     :type debug: bool
     :param logfile: the file name of where we should to save the logs
     :type logfile: str
+    :param gui: whether to attach the handler for the logs window, that
+                needs Qt.
+    :type gui: bool
     :return: the new logger with the attached handlers.
     :rtype: logging.Logger
     """
@@ -132,11 +130,13 @@ def add_logger_handlers(debug=False, logfile=None, replace_stdout=True):
     logger.debug('Console handler plugged!')
 
     # LEAP custom handler
-    leap_handler = LeapLogHandler()
-    leap_handler.setLevel(level)
-    leap_handler.addFilter(silencer)
-    logger.addHandler(leap_handler)
-    logger.debug('Leap handler plugged!')
+    if gui:
+        from leap.bitmask.util.leap_log_handler import LeapLogHandler
+        leap_handler = LeapLogHandler()
+        leap_handler.setLevel(level)
+        leap_handler.addFilter(silencer)
+        logger.addHandler(leap_handler)
+        logger.debug('Leap handler plugged!')
 
     # File handler
     if logfile is not None:
@@ -173,6 +173,22 @@ def replace_stdout_stderr_with_logging(logger):
         log.startLogging(sys.stdout)
 
 
+def get_mail_version():
+    """
+    Return the version of leap.mail, without importing it if possible, only
+    the mail users need it loaded.
+
+    :rtype: str
+    """
+    import pkg_resources
+    try:
+        return pkg_resources.get_distribution("leap.mail").version
+    except pkg_resources.DistributionNotFound:
+        # a bundle, without the package metadata.
+        from leap.mail import __version__ as MAIL_VERSION
+        return MAIL_VERSION
+
+
 def do_display_version(opts):
     """
     Display version and exit.
@@ -180,7 +196,7 @@ def do_display_version(opts):
     # TODO move to a different module: commands?
     if opts.version:
         print "Bitmask version: %s" % (VERSION,)
-        print "leap.mail version: %s" % (MAIL_VERSION,)
+        print "leap.mail version: %s" % (get_mail_version(),)
         sys.exit(0)
 
 
@@ -189,6 +205,10 @@ def do_mail_plumbing(opts):
     Analize options and do mailbox plumbing if requested.
     """
     # TODO move to a different module: commands?
+    if not (opts.repair or opts.import_maildir):
+        return
+
+    from leap.bitmask.services.mail import plumber
     if opts.repair:
         plumber.repair_account(opts.acct)
         sys.exit(0)
@@ -203,9 +223,29 @@ def main():
     Starts the main event loop and launches the main window.
     """
     # TODO move boilerplate outa here!
-    _, opts = leap_argparse.init_leapc_args()
+    with profiler.phase("parse_args"):
+        _, opts = leap_argparse.init_leapc_args()
     do_display_version(opts)
 
+    if opts.backend_daemon:
+        # We are the backend of a frozen bundle started with
+        # --backend-process, see BackendProxy. There is no Qt in here.
+        from leap.bitmask.backend_ipc import run_daemon
+        run_daemon()
+        return
+
+    if opts.profile_startup is not None:
+        profiler.enable(opts.profile_startup)
+
+    if not opts.headless:
+        # Qt runs the main loop, with the reactor interleaved in it. It has
+        # to be installed before anything imports the reactor.
+        with profiler.phase("install_reactor"):
+            from leap.bitmask.util import qtreactor
+            qtreactor.install()
+
+    from twisted.internet import reactor, threads
+
     standalone = opts.standalone
     offline = opts.offline
     bypass_checks = getattr(opts, 'danger', False)
@@ -227,6 +267,10 @@ def main():
     flags.API_VERSION_CHECK = opts.api_version_check
     flags.OPENVPN_VERBOSITY = opts.openvpn_verb
     flags.SKIP_WIZARD_CHECKS = opts.skip_wizard_checks
+    flags.BACKEND_PROCESS = opts.backend_process
+    flags.LATENCY_REPORT = opts.latency_report
+    flags.HEADLESS = opts.headless
+    flags.TWISTED_FETCHER = opts.twisted_fetcher
 
     flags.CA_CERT_FILE = opts.ca_cert_file
 
@@ -237,48 +281,85 @@ def main():
         # We don't want too much clutter on the comand mode
         # this could be more generic with a Command class.
         replace_stdout = False
-    logger = add_logger_handlers(debug, logfile, replace_stdout)
+    with profiler.phase("logging"):
+        logger = add_logger_handlers(debug, logfile, replace_stdout,
+                                     gui=not flags.HEADLESS)
 
     # ok, we got logging in place, we can satisfy mail plumbing requests
     # and show logs there. it normally will exit there if we got that path.
     do_mail_plumbing(opts)
 
-    try:
-        event_server.ensure_server(event_server.SERVER_PORT)
-    except Exception as e:
-        # We don't even have logger configured in here
-        print "Could not ensure server: %r" % (e,)
+    with profiler.phase("event_server"):
+        try:
+            event_server.ensure_server(event_server.SERVER_PORT)
+        except Exception as e:
+            # We don't even have logger configured in here
+            print "Could not ensure server: %r" % (e,)
+
+    if flags.LATENCY_REPORT is not None:
+        from leap.bitmask.util.latency import install_report_handler
+        install_report_handler(flags.LATENCY_REPORT)
+
+    # twisted resolves the hosts through the same cache as the requests.
+    from leap.bitmask.util import dnscache
+    dnscache.install()
 
     PLAY_NICE = os.environ.get("LEAP_NICE")
     if PLAY_NICE and PLAY_NICE.isdigit():
         nice = os.nice(int(PLAY_NICE))
         logger.info("Setting NICE: %s" % nice)
 
+    # The providers are indexed while the rest loads, so that listing them
+    # from the GUI is a lookup in memory. See config/providerindex.py
+    from leap.bitmask.config import providerindex
+    providers_index = providerindex.get_index()
+    providers_index.scan_in_background()
+    reactor.callWhenRunning(providers_index.watch)
+
+    # The files of the configured providers are revalidated in the
+    # background, so the logins find them fresh. See provider/refresher.py
+    def start_refresher():
+        # imported here, it loads the bootstrappers and requests.
+        from leap.bitmask.provider import refresher
+        refresher.start()
+    reactor.callWhenRunning(start_refresher)
+
+    if flags.HEADLESS:
+        from leap.bitmask import headless
+        # there is no window to paint, the backend is up from here on.
+        profiler.finish()
+        headless.run(bypass_checks, opts.control_socket)
+        sys.exit(0)
+
+    with profiler.phase("import_qt"):
+        from PySide import QtCore, QtGui
+
     # And then we import all the other stuff
     # I think it's safe to import at the top by now -- kali
-    from leap.bitmask.gui import locale_rc
-    from leap.bitmask.gui import twisted_main
-    from leap.bitmask.gui.mainwindow import MainWindow
-    from leap.bitmask.platform_init import IS_MAC
-    from leap.bitmask.platform_init.locks import we_are_the_one_and_only
-    from leap.bitmask.util.requirement_checker import check_requirements
+    with profiler.phase("import_gui"):
+        from leap.bitmask.gui import locale_rc
+        from leap.bitmask.gui import twisted_main
+        from leap.bitmask.gui.mainwindow import MainWindow
+        from leap.bitmask.platform_init import IS_MAC
+        from leap.bitmask.platform_init.locks import we_are_the_one_and_only
+        from leap.bitmask.util.requirement_checker import check_requirements
 
     # pylint: avoid unused import
     assert(locale_rc)
 
     # TODO move to a different module: commands?
-    if not we_are_the_one_and_only():
+    with profiler.phase("single_instance_lock"):
+        the_one_and_only = we_are_the_one_and_only()
+    if not the_one_and_only:
         # Bitmask is already running
         logger.warning("Tried to launch more than one instance "
                        "of Bitmask. Raising the existing "
                        "one instead.")
         sys.exit(1)
 
-    check_requirements()
-
     logger.info('~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~')
     logger.info('Bitmask version %s', VERSION)
-    logger.info('leap.mail version %s', MAIL_VERSION)
+    logger.info('leap.mail version %s', get_mail_version())
     logger.info('~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~')
 
     logger.info('Starting app')
@@ -290,17 +371,18 @@ def main():
         sys.argv.append("-style")
         sys.argv.append("Cleanlooks")
 
-    app = QtGui.QApplication(sys.argv)
+    with profiler.phase("qapplication"):
+        app = QtGui.QApplication(sys.argv)
 
-    # To test:
-    # $ LANG=es ./app.py
-    locale = QtCore.QLocale.system().name()
-    qtTranslator = QtCore.QTranslator()
-    if qtTranslator.load("qt_%s" % locale, ":/translations"):
-        app.installTranslator(qtTranslator)
-    appTranslator = QtCore.QTranslator()
-    if appTranslator.load("%s.qm" % locale[:2], ":/translations"):
-        app.installTranslator(appTranslator)
+        # To test:
+        # $ LANG=es ./app.py
+        locale = QtCore.QLocale.system().name()
+        qtTranslator = QtCore.QTranslator()
+        if qtTranslator.load("qt_%s" % locale, ":/translations"):
+            app.installTranslator(qtTranslator)
+        appTranslator = QtCore.QTranslator()
+        if appTranslator.load("%s.qm" % locale[:2], ":/translations"):
+            app.installTranslator(appTranslator)
 
     # Needed for initializing qsettings it will write
     # .config/leap/leap.conf top level app settings in a platform
@@ -318,10 +400,22 @@ def main():
     #timer.timeout.connect(lambda: None)
     # XXX ---------------------------------------------------------
 
-    window = MainWindow(
-        lambda: twisted_main.quit(app),
-        bypass_checks=bypass_checks,
-        start_hidden=start_hidden)
+    with profiler.phase("mainwindow"):
+        window = MainWindow(
+            lambda: twisted_main.quit(app),
+            bypass_checks=bypass_checks,
+            start_hidden=start_hidden)
+
+    if profiler.enabled:
+        if start_hidden:
+            # nothing gets painted until the user asks for the window.
+            profiler.finish()
+        else:
+            finish_on_first_paint(window)
+
+    # Nothing depends on the requirements check, it only logs. It runs out
+    # of the main thread once the loop is up, and is cached across runs.
+    reactor.callWhenRunning(threads.deferToThread, check_requirements)
 
     sigint_window = partial(sigint_handler, window, logger=logger)
     signal.signal(signal.SIGINT, sigint_window)
@@ -337,15 +431,15 @@ def main():
     #tx_app = leap_services()
     #assert(tx_app)
 
-    l = LoopingCall(QtCore.QCoreApplication.processEvents, 0, 10)
-    l.start(0.01)
-
     # SIGTERM can't be handled the same way SIGINT is, since it's
     # caught by twisted. See _handleSignals method in
     # twisted/internet/base.py#L1150. So, addSystemEventTrigger
     # reactor's method is used.
     reactor.addSystemEventTrigger('before', 'shutdown', sigterm_window)
-    reactor.run()
+
+    # The reactor runs inside the Qt main loop, see util/qtreactor.py
+    qtreactor.interleave(app)
+    app.exec_()
 
 if __name__ == "__main__":
     main()
@@ -21,22 +21,23 @@ import logging
 import os
 import time
 
-from functools import partial
-from Queue import Queue, Empty
-from threading import Condition
+from collections import deque
+from Queue import Empty
+from threading import Condition, Lock
 
 from twisted.internet import reactor
-from twisted.internet import threads, defer
-from twisted.internet.task import LoopingCall
+from twisted.internet import defer
 from twisted.python import log
 
 import zope.interface
 import zope.proxy
 
+from leap.bitmask.config import configcache
 from leap.bitmask.config.providerconfig import ProviderConfig
 from leap.bitmask.crypto.srpauth import SRPAuth
 from leap.bitmask.crypto.srpregister import SRPRegister
 from leap.bitmask.platform_init import IS_LINUX
+from leap.bitmask.provider import get_provider_path
 from leap.bitmask.provider.providerbootstrapper import ProviderBootstrapper
 from leap.bitmask.services import get_supported
 from leap.bitmask.services.eip import eipconfig
@@ -47,24 +48,41 @@ from leap.bitmask.services.eip import vpnlauncher, vpnprocess
 from leap.bitmask.services.eip import linuxvpnlauncher, darwinvpnlauncher
 from leap.bitmask.services.eip import get_vpn_launcher
 
-from leap.bitmask.services.mail.imapcontroller import IMAPController
 from leap.bitmask.services.mail.smtpbootstrapper import SMTPBootstrapper
 from leap.bitmask.services.mail.smtpconfig import SMTPConfig
 
-from leap.bitmask.services.soledad.soledadbootstrapper import \
-    SoledadBootstrapper
+from leap.bitmask.signaler import EventSignaler
+
+from leap.bitmask.util import get_path_prefix
+from leap.bitmask.util import latency, querycache, threadpools
+from leap.bitmask.util.lazyimport import lazy_import
 
 from leap.common import certs as leap_certs
 
-from leap.keymanager import openpgp
-from leap.keymanager.errors import KeyAddressMismatch, KeyFingerprintMismatch
+# These pull in soledad, the keymanager and leap.mail, only the mail
+# components need them. See util/lazyimport.py
+imapcontroller = lazy_import("leap.bitmask.services.mail.imapcontroller")
+soledadbootstrapper = lazy_import(
+    "leap.bitmask.services.soledad.soledadbootstrapper")
+openpgp = lazy_import("leap.keymanager.openpgp")
+keymanager_errors = lazy_import("leap.keymanager.errors")
+soledad_client = lazy_import("leap.soledad.client")
 
-from leap.soledad.client import NoStorageSecret, PassphraseTooShort
+logger = logging.getLogger(__name__)
 
-# Frontend side
-from PySide import QtCore
 
-logger = logging.getLogger(__name__)
+def _provider_files(domain):
+    """
+    Return the absolute paths of the config files of a provider, the
+    results of the queries about it depend on them.
+
+    :param domain: the domain of the provider.
+    :type domain: str
+
+    :rtype: list of str
+    """
+    return [os.path.join(get_path_prefix(), get_provider_path(domain)),
+            eipconfig.get_eipconfig_path(domain, relative=False)]
 
 
 class ILEAPComponent(zope.interface.Interface):
@@ -155,6 +173,7 @@ class Provider(object):
                                                            bypass_checks)
         self._download_provider_defer = None
         self._provider_config = ProviderConfig()
+        self._cache = querycache.QueryCache()
 
     def setup_provider(self, provider):
         """
@@ -178,6 +197,7 @@ class Provider(object):
         """
         d = self._download_provider_defer
         if d is not None:
+            self._provider_bootstrapper.cancel_requests()
             d.cancel()
 
     def bootstrap(self, provider):
@@ -215,6 +235,18 @@ class Provider(object):
         :param domain: the provider to get the services from.
         :type domain: str
 
+        :rtype: list of str
+        """
+        return self._cache.get(("services", domain), _provider_files(domain),
+                               self._load_services, domain)
+
+    def _load_services(self, domain):
+        """
+        Loads the provider config and returns its list of services.
+
+        :param domain: the provider to get the services from.
+        :type domain: str
+
         :rtype: list of str
         """
         services = []
@@ -271,9 +303,10 @@ class Provider(object):
         Signals:
             prov_get_details -> ProviderConfigLight
         """
-        self._signaler.signal(
-            self._signaler.PROV_GET_DETAILS,
-            self._provider_config.get_light_config(domain, lang))
+        details = self._cache.get(
+            ("details", domain, lang), _provider_files(domain),
+            self._provider_config.get_light_config, domain, lang)
+        self._signaler.signal(self._signaler.PROV_GET_DETAILS, details)
 
 
 class Register(object):
@@ -305,7 +338,7 @@ class Register(object):
         :param password: the password for the username
         :type password: unicode
 
-        :returns: the defer for the operation running in a thread.
+        :returns: the defer for the registration.
         :rtype: twisted.internet.defer.Deferred
         """
         config = ProviderConfig.get_provider_config(domain)
@@ -313,8 +346,7 @@ class Register(object):
         if config is not None:
             srpregister = SRPRegister(signaler=self._signaler,
                                       provider_config=config)
-            return threads.deferToThread(
-                partial(srpregister.register_user, username, password))
+            return srpregister.register_user_deferred(username, password)
         else:
             if self._signaler is not None:
                 self._signaler.signal(self._signaler.SRP_REGISTRATION_FAILED)
@@ -341,6 +373,7 @@ class EIP(object):
         self._eip_bootstrapper = EIPBootstrapper(signaler)
         self._eip_setup_defer = None
         self._provider_config = ProviderConfig()
+        self._cache = querycache.QueryCache()
 
         self._vpn = vpnprocess.VPN(signaler=signaler)
 
@@ -376,6 +409,7 @@ class EIP(object):
         """
         d = self._eip_setup_defer
         if d is not None:
+            self._eip_bootstrapper.cancel_requests()
             d.cancel()
 
     def _start_eip(self, restart=False):
@@ -386,11 +420,10 @@ class EIP(object):
         :type restart: bool
         """
         provider_config = self._provider_config
-        eip_config = eipconfig.EIPConfig()
         domain = provider_config.get_domain()
 
-        loaded = eipconfig.load_eipconfig_if_needed(
-            provider_config, eip_config, domain)
+        eip_config = self._load_eip_config(provider_config, domain)
+        loaded = eip_config is not None
 
         if not self._can_start(domain):
             if self._signaler is not None:
@@ -457,7 +490,8 @@ class EIP(object):
         """
         Stop the service.
         """
-        return threads.deferToThread(self._do_stop, shutdown, restart)
+        return threadpools.defer_to_pool(threadpools.EIP, self._do_stop,
+                                         shutdown, restart)
 
     def _wait_for_firewall_down(self):
         """
@@ -562,26 +596,60 @@ class EIP(object):
                     self._signaler.EIP_UNINITIALIZED_PROVIDER)
             return
 
-        eip_config = eipconfig.EIPConfig()
-        provider_config = ProviderConfig.get_provider_config(domain)
-
-        api_version = provider_config.get_api_version()
-        eip_config.set_api_version(api_version)
-        eip_loaded = eip_config.load(eipconfig.get_eipconfig_path(domain))
+        gateways = self._cache.get(("gateways", domain),
+                                   _provider_files(domain),
+                                   self._load_gateways_list, domain)
 
         # check for other problems
-        if not eip_loaded or provider_config is None:
+        if gateways is None:
             if self._signaler is not None:
                 self._signaler.signal(
                     self._signaler.EIP_GET_GATEWAYS_LIST_ERROR)
             return
 
-        gateways = eipconfig.VPNGatewaySelector(eip_config).get_gateways_list()
-
         if self._signaler is not None:
             self._signaler.signal(
                 self._signaler.EIP_GET_GATEWAYS_LIST, gateways)
 
+    def _load_eip_config(self, provider_config, domain):
+        """
+        Return the eip config of a provider, shared through the config
+        cache.
+
+        :param provider_config: the loaded config of the provider.
+        :type provider_config: ProviderConfig or None
+        :param domain: the domain of the provider.
+        :type domain: str
+
+        :rtype: EIPConfig or None if it can't be loaded.
+        """
+        if provider_config is None:
+            return None
+
+        return configcache.load(eipconfig.EIPConfig,
+                                eipconfig.get_eipconfig_path(domain),
+                                provider_config.get_api_version())
+
+    def _load_gateways_list(self, domain):
+        """
+        Loads the configs for the given provider and returns its list of
+        gateways.
+
+        :param domain: the domain to get the gateways.
+        :type domain: str
+
+        :returns: the list of gateways, or None if the configs can't be
+                  loaded.
+        :rtype: list of unicode or None
+        """
+        provider_config = ProviderConfig.get_provider_config(domain)
+        eip_config = self._load_eip_config(provider_config, domain)
+
+        if eip_config is None:
+            return None
+
+        return eipconfig.VPNGatewaySelector(eip_config).get_gateways_list()
+
     def _can_start(self, domain):
         """
         Returns True if it has everything that is needed to run EIP,
@@ -590,12 +658,9 @@ class EIP(object):
         :param domain: the domain for the provider to check
         :type domain: str
         """
-        eip_config = eipconfig.EIPConfig()
         provider_config = ProviderConfig.get_provider_config(domain)
-
-        api_version = provider_config.get_api_version()
-        eip_config.set_api_version(api_version)
-        eip_loaded = eip_config.load(eipconfig.get_eipconfig_path(domain))
+        eip_config = self._load_eip_config(provider_config, domain)
+        eip_loaded = eip_config is not None
 
         launcher = get_vpn_launcher()
         if not os.path.isfile(launcher.OPENVPN_BIN_PATH):
@@ -633,7 +698,14 @@ class EIP(object):
             eip_can_start
             eip_cannot_start
         """
-        if self._can_start(domain):
+        launcher = get_vpn_launcher()
+        # the certificate may not exist yet.
+        paths = _provider_files(domain) + [
+            launcher.OPENVPN_BIN_PATH,
+            eipconfig.get_client_cert_path(domain)]
+
+        if self._cache.get(("can_start", domain), paths,
+                           self._can_start, domain):
             if self._signaler is not None:
                 self._signaler.signal(self._signaler.EIP_CAN_START)
         else:
@@ -663,9 +735,22 @@ class Soledad(object):
         self._soledad_proxy = soledad_proxy
         self._keymanager_proxy = keymanager_proxy
         self._signaler = signaler
-        self._soledad_bootstrapper = SoledadBootstrapper(signaler)
+        self._bootstrapper = None
         self._soledad_defer = None
 
+    @property
+    def _soledad_bootstrapper(self):
+        """
+        The soledad bootstrapper, created on first use so soledad is only
+        loaded if the user has mail.
+
+        :rtype: SoledadBootstrapper
+        """
+        if self._bootstrapper is None:
+            self._bootstrapper = soledadbootstrapper.SoledadBootstrapper(
+                self._signaler)
+        return self._bootstrapper
+
     def bootstrap(self, username, domain, password):
         """
         Bootstrap Soledad with the user credentials.
@@ -683,7 +768,8 @@ class Soledad(object):
         """
         provider_config = ProviderConfig.get_provider_config(domain)
         if provider_config is not None:
-            self._soledad_defer = threads.deferToThread(
+            self._soledad_defer = threadpools.defer_to_pool(
+                threadpools.SOLEDAD,
                 self._soledad_bootstrapper.run_soledad_setup_checks,
                 provider_config, username, password,
                 download_if_needed=True)
@@ -755,9 +841,9 @@ class Soledad(object):
         :param failure: failure object containing problem.
         :type failure: twisted.python.failure.Failure
         """
-        if failure.check(NoStorageSecret):
+        if failure.check(soledad_client.NoStorageSecret):
             logger.error("No storage secret for password change in Soledad.")
-        if failure.check(PassphraseTooShort):
+        if failure.check(soledad_client.PassphraseTooShort):
             logger.error("Passphrase too short.")
 
         if self._signaler is not None:
@@ -773,8 +859,9 @@ class Soledad(object):
         :returns: a defer to interact with.
         :rtype: twisted.internet.defer.Deferred
         """
-        d = threads.deferToThread(self._soledad_proxy.change_passphrase,
-                                  new_password)
+        d = threadpools.defer_to_pool(threadpools.SOLEDAD,
+                                      self._soledad_proxy.change_passphrase,
+                                      new_password)
         d.addCallback(self._change_password_ok)
         d.addErrback(self._change_password_error)
 
@@ -827,7 +914,8 @@ class Keymanager(object):
         try:
             public_key, private_key = keymanager.parse_openpgp_ascii_key(
                 new_key)
-        except (KeyAddressMismatch, KeyFingerprintMismatch) as e:
+        except (keymanager_errors.KeyAddressMismatch,
+                keymanager_errors.KeyFingerprintMismatch) as e:
             logger.error(repr(e))
             signal = self._signaler.KEYMANAGER_IMPORT_DATAMISMATCH
             self._signaler.signal(signal)
@@ -923,11 +1011,23 @@ class Mail(object):
         self._signaler = signaler
         self._soledad_proxy = soledad_proxy
         self._keymanager_proxy = keymanager_proxy
-        self._imap_controller = IMAPController(self._soledad_proxy,
-                                               self._keymanager_proxy)
+        self._imap = None
         self._smtp_bootstrapper = SMTPBootstrapper()
         self._smtp_config = SMTPConfig()
 
+    @property
+    def _imap_controller(self):
+        """
+        The imap controller, created on first use so leap.mail is only
+        loaded if the user has mail.
+
+        :rtype: IMAPController
+        """
+        if self._imap is None:
+            self._imap = imapcontroller.IMAPController(
+                self._soledad_proxy, self._keymanager_proxy)
+        return self._imap
+
     def start_smtp_service(self, full_user_id, download_if_needed=False):
         """
         Start the SMTP service.
@@ -941,8 +1041,8 @@ class Mail(object):
         :returns: a defer to interact with.
         :rtype: twisted.internet.defer.Deferred
         """
-        return threads.deferToThread(
-            self._smtp_bootstrapper.start_smtp_service,
+        return threadpools.defer_to_pool(
+            threadpools.MAIL, self._smtp_bootstrapper.start_smtp_service,
             self._keymanager_proxy, full_user_id, download_if_needed)
 
     def start_imap_service(self, full_user_id, offline=False):
@@ -957,8 +1057,8 @@ class Mail(object):
         :returns: a defer to interact with.
         :rtype: twisted.internet.defer.Deferred
         """
-        return threads.deferToThread(
-            self._imap_controller.start_imap_service,
+        return threadpools.defer_to_pool(
+            threadpools.MAIL, self._imap_controller.start_imap_service,
             full_user_id, offline)
 
     def stop_smtp_service(self):
@@ -968,15 +1068,22 @@ class Mail(object):
         :returns: a defer to interact with.
         :rtype: twisted.internet.defer.Deferred
         """
-        return threads.deferToThread(self._smtp_bootstrapper.stop_smtp_service)
+        return threadpools.defer_to_pool(
+            threadpools.MAIL, self._smtp_bootstrapper.stop_smtp_service)
 
     def _stop_imap_service(self):
         """
         Stop imap and wait until the service is stopped to signal that is done.
         """
+        if self._imap is None:
+            # it never started, don't load leap.mail just to stop it.
+            self._signaler.signal(self._signaler.IMAP_STOPPED)
+            return
+
         cv = Condition()
         cv.acquire()
-        threads.deferToThread(self._imap_controller.stop_imap_service, cv)
+        threadpools.defer_to_pool(
+            threadpools.MAIL, self._imap_controller.stop_imap_service, cv)
         logger.debug('Waiting for imap service to stop.')
         cv.wait(self.SERVICE_STOP_TIMEOUT)
         logger.debug('IMAP stopped')
@@ -989,7 +1096,8 @@ class Mail(object):
         :returns: a defer to interact with.
         :rtype: twisted.internet.defer.Deferred
         """
-        return threads.deferToThread(self._stop_imap_service)
+        return threadpools.defer_to_pool(threadpools.MAIL,
+                                         self._stop_imap_service)
 
 
 class Authenticate(object):
@@ -1042,6 +1150,7 @@ class Authenticate(object):
         """
         d = self._login_defer
         if d is not None:
+            self._srp_auth.cancel_requests()
             d.cancel()
 
     def change_password(self, current_password, new_password):
@@ -1100,353 +1209,114 @@ class Authenticate(object):
         self._signaler.signal(signal)
 
 
-class Signaler(QtCore.QObject):
+class CommandQueue(object):
     """
-    Signaler object, handles converting string commands to Qt signals.
-
-    This is intended for the separation in frontend/backend, this will
-    live in the frontend.
+    Thread safe queue for the backend commands, with a lane for the urgent
+    ones (cancel, stop) so they don't wait behind slow commands.
     """
 
-    ####################
-    # These will only exist in the frontend
-    # Signals for the ProviderBootstrapper
-    prov_name_resolution = QtCore.Signal(object)
-    prov_https_connection = QtCore.Signal(object)
-    prov_download_provider_info = QtCore.Signal(object)
-
-    prov_download_ca_cert = QtCore.Signal(object)
-    prov_check_ca_fingerprint = QtCore.Signal(object)
-    prov_check_api_certificate = QtCore.Signal(object)
-
-    prov_problem_with_provider = QtCore.Signal(object)
-
-    prov_unsupported_client = QtCore.Signal(object)
-    prov_unsupported_api = QtCore.Signal(object)
-
-    prov_get_all_services = QtCore.Signal(object)
-    prov_get_supported_services = QtCore.Signal(object)
-    prov_get_details = QtCore.Signal(object)
-
-    prov_cancelled_setup = QtCore.Signal(object)
-
-    # Signals for SRPRegister
-    srp_registration_finished = QtCore.Signal(object)
-    srp_registration_failed = QtCore.Signal(object)
-    srp_registration_taken = QtCore.Signal(object)
-
-    # Signals for EIP bootstrapping
-    eip_config_ready = QtCore.Signal(object)
-    eip_client_certificate_ready = QtCore.Signal(object)
-
-    eip_cancelled_setup = QtCore.Signal(object)
-
-    # Signals for SRPAuth
-    srp_auth_ok = QtCore.Signal(object)
-    srp_auth_error = QtCore.Signal(object)
-    srp_auth_server_error = QtCore.Signal(object)
-    srp_auth_connection_error = QtCore.Signal(object)
-    srp_auth_bad_user_or_password = QtCore.Signal(object)
-    srp_logout_ok = QtCore.Signal(object)
-    srp_logout_error = QtCore.Signal(object)
-    srp_password_change_ok = QtCore.Signal(object)
-    srp_password_change_error = QtCore.Signal(object)
-    srp_password_change_badpw = QtCore.Signal(object)
-    srp_not_logged_in_error = QtCore.Signal(object)
-    srp_status_logged_in = QtCore.Signal(object)
-    srp_status_not_logged_in = QtCore.Signal(object)
-
-    # Signals for EIP
-    eip_connected = QtCore.Signal(object)
-    eip_disconnected = QtCore.Signal(object)
-    eip_connection_died = QtCore.Signal(object)
-    eip_connection_aborted = QtCore.Signal(object)
-    eip_stopped = QtCore.Signal(object)
-
-    # EIP problems
-    eip_no_polkit_agent_error = QtCore.Signal(object)
-    eip_no_tun_kext_error = QtCore.Signal(object)
-    eip_no_pkexec_error = QtCore.Signal(object)
-    eip_openvpn_not_found_error = QtCore.Signal(object)
-    eip_openvpn_already_running = QtCore.Signal(object)
-    eip_alien_openvpn_already_running = QtCore.Signal(object)
-    eip_vpn_launcher_exception = QtCore.Signal(object)
-
-    eip_get_gateways_list = QtCore.Signal(object)
-    eip_get_gateways_list_error = QtCore.Signal(object)
-    eip_uninitialized_provider = QtCore.Signal(object)
-    eip_get_initialized_providers = QtCore.Signal(object)
-
-    # signals from parsing openvpn output
-    eip_network_unreachable = QtCore.Signal(object)
-    eip_process_restart_tls = QtCore.Signal(object)
-    eip_process_restart_ping = QtCore.Signal(object)
-
-    # signals from vpnprocess.py
-    eip_state_changed = QtCore.Signal(dict)
-    eip_status_changed = QtCore.Signal(dict)
-    eip_process_finished = QtCore.Signal(int)
-    eip_tear_fw_down = QtCore.Signal(object)
-
-    # signals whether the needed files to start EIP exist or not
-    eip_can_start = QtCore.Signal(object)
-    eip_cannot_start = QtCore.Signal(object)
-
-    # Signals for Soledad
-    soledad_bootstrap_failed = QtCore.Signal(object)
-    soledad_bootstrap_finished = QtCore.Signal(object)
-    soledad_offline_failed = QtCore.Signal(object)
-    soledad_offline_finished = QtCore.Signal(object)
-    soledad_invalid_auth_token = QtCore.Signal(object)
-    soledad_cancelled_bootstrap = QtCore.Signal(object)
-    soledad_password_change_ok = QtCore.Signal(object)
-    soledad_password_change_error = QtCore.Signal(object)
-
-    # Keymanager signals
-    keymanager_export_ok = QtCore.Signal(object)
-    keymanager_export_error = QtCore.Signal(object)
-    keymanager_keys_list = QtCore.Signal(object)
-
-    keymanager_import_ioerror = QtCore.Signal(object)
-    keymanager_import_datamismatch = QtCore.Signal(object)
-    keymanager_import_missingkey = QtCore.Signal(object)
-    keymanager_import_addressmismatch = QtCore.Signal(object)
-    keymanager_import_ok = QtCore.Signal(object)
-
-    keymanager_key_details = QtCore.Signal(object)
-
-    # mail related signals
-    imap_stopped = QtCore.Signal(object)
-
-    # This signal is used to warn the backend user that is doing something
-    # wrong
-    backend_bad_call = QtCore.Signal(object)
-
-    ####################
-    # These will exist both in the backend AND the front end.
-    # The frontend might choose to not "interpret" all the signals
-    # from the backend, but the backend needs to have all the signals
-    # it's going to emit defined here
-    PROV_NAME_RESOLUTION_KEY = "prov_name_resolution"
-    PROV_HTTPS_CONNECTION_KEY = "prov_https_connection"
-    PROV_DOWNLOAD_PROVIDER_INFO_KEY = "prov_download_provider_info"
-    PROV_DOWNLOAD_CA_CERT_KEY = "prov_download_ca_cert"
-    PROV_CHECK_CA_FINGERPRINT_KEY = "prov_check_ca_fingerprint"
-    PROV_CHECK_API_CERTIFICATE_KEY = "prov_check_api_certificate"
-    PROV_PROBLEM_WITH_PROVIDER_KEY = "prov_problem_with_provider"
-    PROV_UNSUPPORTED_CLIENT = "prov_unsupported_client"
-    PROV_UNSUPPORTED_API = "prov_unsupported_api"
-    PROV_CANCELLED_SETUP = "prov_cancelled_setup"
-    PROV_GET_ALL_SERVICES = "prov_get_all_services"
-    PROV_GET_SUPPORTED_SERVICES = "prov_get_supported_services"
-    PROV_GET_DETAILS = "prov_get_details"
-
-    SRP_REGISTRATION_FINISHED = "srp_registration_finished"
-    SRP_REGISTRATION_FAILED = "srp_registration_failed"
-    SRP_REGISTRATION_TAKEN = "srp_registration_taken"
-    SRP_AUTH_OK = "srp_auth_ok"
-    SRP_AUTH_ERROR = "srp_auth_error"
-    SRP_AUTH_SERVER_ERROR = "srp_auth_server_error"
-    SRP_AUTH_CONNECTION_ERROR = "srp_auth_connection_error"
-    SRP_AUTH_BAD_USER_OR_PASSWORD = "srp_auth_bad_user_or_password"
-    SRP_LOGOUT_OK = "srp_logout_ok"
-    SRP_LOGOUT_ERROR = "srp_logout_error"
-    SRP_PASSWORD_CHANGE_OK = "srp_password_change_ok"
-    SRP_PASSWORD_CHANGE_ERROR = "srp_password_change_error"
-    SRP_PASSWORD_CHANGE_BADPW = "srp_password_change_badpw"
-    SRP_NOT_LOGGED_IN_ERROR = "srp_not_logged_in_error"
-    SRP_STATUS_LOGGED_IN = "srp_status_logged_in"
-    SRP_STATUS_NOT_LOGGED_IN = "srp_status_not_logged_in"
-
-    EIP_CONFIG_READY = "eip_config_ready"
-    EIP_CLIENT_CERTIFICATE_READY = "eip_client_certificate_ready"
-    EIP_CANCELLED_SETUP = "eip_cancelled_setup"
-
-    EIP_CONNECTED = "eip_connected"
-    EIP_DISCONNECTED = "eip_disconnected"
-    EIP_CONNECTION_DIED = "eip_connection_died"
-    EIP_CONNECTION_ABORTED = "eip_connection_aborted"
-    EIP_STOPPED = "eip_stopped"
-
-    EIP_NO_POLKIT_AGENT_ERROR = "eip_no_polkit_agent_error"
-    EIP_NO_TUN_KEXT_ERROR = "eip_no_tun_kext_error"
-    EIP_NO_PKEXEC_ERROR = "eip_no_pkexec_error"
-    EIP_OPENVPN_NOT_FOUND_ERROR = "eip_openvpn_not_found_error"
-    EIP_OPENVPN_ALREADY_RUNNING = "eip_openvpn_already_running"
-    EIP_ALIEN_OPENVPN_ALREADY_RUNNING = "eip_alien_openvpn_already_running"
-    EIP_VPN_LAUNCHER_EXCEPTION = "eip_vpn_launcher_exception"
-
-    EIP_GET_GATEWAYS_LIST = "eip_get_gateways_list"
-    EIP_GET_GATEWAYS_LIST_ERROR = "eip_get_gateways_list_error"
-    EIP_UNINITIALIZED_PROVIDER = "eip_uninitialized_provider"
-    EIP_GET_INITIALIZED_PROVIDERS = "eip_get_initialized_providers"
-
-    EIP_NETWORK_UNREACHABLE = "eip_network_unreachable"
-    EIP_PROCESS_RESTART_TLS = "eip_process_restart_tls"
-    EIP_PROCESS_RESTART_PING = "eip_process_restart_ping"
-
-    EIP_STATE_CHANGED = "eip_state_changed"
-    EIP_STATUS_CHANGED = "eip_status_changed"
-    EIP_PROCESS_FINISHED = "eip_process_finished"
-    EIP_TEAR_FW_DOWN = "eip_tear_fw_down"
-
-    EIP_CAN_START = "eip_can_start"
-    EIP_CANNOT_START = "eip_cannot_start"
-
-    SOLEDAD_BOOTSTRAP_FAILED = "soledad_bootstrap_failed"
-    SOLEDAD_BOOTSTRAP_FINISHED = "soledad_bootstrap_finished"
-    SOLEDAD_OFFLINE_FAILED = "soledad_offline_failed"
-    SOLEDAD_OFFLINE_FINISHED = "soledad_offline_finished"
-    SOLEDAD_INVALID_AUTH_TOKEN = "soledad_invalid_auth_token"
-
-    SOLEDAD_PASSWORD_CHANGE_OK = "soledad_password_change_ok"
-    SOLEDAD_PASSWORD_CHANGE_ERROR = "soledad_password_change_error"
-
-    SOLEDAD_CANCELLED_BOOTSTRAP = "soledad_cancelled_bootstrap"
-
-    KEYMANAGER_EXPORT_OK = "keymanager_export_ok"
-    KEYMANAGER_EXPORT_ERROR = "keymanager_export_error"
-    KEYMANAGER_KEYS_LIST = "keymanager_keys_list"
-
-    KEYMANAGER_IMPORT_IOERROR = "keymanager_import_ioerror"
-    KEYMANAGER_IMPORT_DATAMISMATCH = "keymanager_import_datamismatch"
-    KEYMANAGER_IMPORT_MISSINGKEY = "keymanager_import_missingkey"
-    KEYMANAGER_IMPORT_ADDRESSMISMATCH = "keymanager_import_addressmismatch"
-    KEYMANAGER_IMPORT_OK = "keymanager_import_ok"
-    KEYMANAGER_KEY_DETAILS = "keymanager_key_details"
-
-    IMAP_STOPPED = "imap_stopped"
-
-    BACKEND_BAD_CALL = "backend_bad_call"
+    URGENT = "urgent"
+    NORMAL = "normal"
 
     def __init__(self):
+        self._lanes = {
+            self.URGENT: deque(),
+            self.NORMAL: deque(),
+        }
+        self._lock = Lock()
+
+    def put(self, cmd, lane=NORMAL, collapse=False):
+        """
+        Add a command at the end of a lane.
+
+        :param cmd: the command, in the form:
+                    (component, method, signalback, *args)
+        :type cmd: tuple
+        :param lane: the lane for the command, URGENT or NORMAL.
+        :type lane: str
+        :param collapse: if True, the command is not added when an identical
+                         one is already waiting in the lane.
+        :type collapse: bool
+
+        :returns: whether the command was added.
+        :rtype: bool
         """
-        Constructor for the Signaler
-        """
-        QtCore.QObject.__init__(self)
-        self._signals = {}
-
-        signals = [
-            self.PROV_NAME_RESOLUTION_KEY,
-            self.PROV_HTTPS_CONNECTION_KEY,
-            self.PROV_DOWNLOAD_PROVIDER_INFO_KEY,
-            self.PROV_DOWNLOAD_CA_CERT_KEY,
-            self.PROV_CHECK_CA_FINGERPRINT_KEY,
-            self.PROV_CHECK_API_CERTIFICATE_KEY,
-            self.PROV_PROBLEM_WITH_PROVIDER_KEY,
-            self.PROV_UNSUPPORTED_CLIENT,
-            self.PROV_UNSUPPORTED_API,
-            self.PROV_CANCELLED_SETUP,
-            self.PROV_GET_ALL_SERVICES,
-            self.PROV_GET_SUPPORTED_SERVICES,
-            self.PROV_GET_DETAILS,
-
-            self.SRP_REGISTRATION_FINISHED,
-            self.SRP_REGISTRATION_FAILED,
-            self.SRP_REGISTRATION_TAKEN,
-
-            self.EIP_CONFIG_READY,
-            self.EIP_CLIENT_CERTIFICATE_READY,
-            self.EIP_CANCELLED_SETUP,
-
-            self.EIP_CONNECTED,
-            self.EIP_DISCONNECTED,
-            self.EIP_CONNECTION_DIED,
-            self.EIP_CONNECTION_ABORTED,
-            self.EIP_STOPPED,
-
-            self.EIP_NO_POLKIT_AGENT_ERROR,
-            self.EIP_NO_TUN_KEXT_ERROR,
-            self.EIP_NO_PKEXEC_ERROR,
-            self.EIP_OPENVPN_NOT_FOUND_ERROR,
-            self.EIP_OPENVPN_ALREADY_RUNNING,
-            self.EIP_ALIEN_OPENVPN_ALREADY_RUNNING,
-            self.EIP_VPN_LAUNCHER_EXCEPTION,
-
-            self.EIP_GET_GATEWAYS_LIST,
-            self.EIP_GET_GATEWAYS_LIST_ERROR,
-            self.EIP_UNINITIALIZED_PROVIDER,
-            self.EIP_GET_INITIALIZED_PROVIDERS,
-
-            self.EIP_NETWORK_UNREACHABLE,
-            self.EIP_PROCESS_RESTART_TLS,
-            self.EIP_PROCESS_RESTART_PING,
-
-            self.EIP_STATE_CHANGED,
-            self.EIP_STATUS_CHANGED,
-            self.EIP_PROCESS_FINISHED,
-
-            self.EIP_CAN_START,
-            self.EIP_CANNOT_START,
-
-            self.SRP_AUTH_OK,
-            self.SRP_AUTH_ERROR,
-            self.SRP_AUTH_SERVER_ERROR,
-            self.SRP_AUTH_CONNECTION_ERROR,
-            self.SRP_AUTH_BAD_USER_OR_PASSWORD,
-            self.SRP_LOGOUT_OK,
-            self.SRP_LOGOUT_ERROR,
-            self.SRP_PASSWORD_CHANGE_OK,
-            self.SRP_PASSWORD_CHANGE_ERROR,
-            self.SRP_PASSWORD_CHANGE_BADPW,
-            self.SRP_NOT_LOGGED_IN_ERROR,
-            self.SRP_STATUS_LOGGED_IN,
-            self.SRP_STATUS_NOT_LOGGED_IN,
-
-            self.SOLEDAD_BOOTSTRAP_FAILED,
-            self.SOLEDAD_BOOTSTRAP_FINISHED,
-            self.SOLEDAD_OFFLINE_FAILED,
-            self.SOLEDAD_OFFLINE_FINISHED,
-            self.SOLEDAD_INVALID_AUTH_TOKEN,
-            self.SOLEDAD_CANCELLED_BOOTSTRAP,
-
-            self.SOLEDAD_PASSWORD_CHANGE_OK,
-            self.SOLEDAD_PASSWORD_CHANGE_ERROR,
-
-            self.KEYMANAGER_EXPORT_OK,
-            self.KEYMANAGER_EXPORT_ERROR,
-            self.KEYMANAGER_KEYS_LIST,
-
-            self.KEYMANAGER_IMPORT_IOERROR,
-            self.KEYMANAGER_IMPORT_DATAMISMATCH,
-            self.KEYMANAGER_IMPORT_MISSINGKEY,
-            self.KEYMANAGER_IMPORT_ADDRESSMISMATCH,
-            self.KEYMANAGER_IMPORT_OK,
-            self.KEYMANAGER_KEY_DETAILS,
-
-            self.IMAP_STOPPED,
-
-            self.BACKEND_BAD_CALL,
-        ]
-
-        for sig in signals:
-            self._signals[sig] = getattr(self, sig)
-
-    def signal(self, key, data=None):
-        """
-        Emits a Qt signal based on the key provided, with the data if provided.
-
-        :param key: string identifying the signal to emit
-        :type key: str
-        :param data: object to send with the data
-        :type data: object
-
-        NOTE: The data object will be a serialized str in the backend,
-        and an unserialized object in the frontend, but for now we
-        just care about objects.
-        """
-        # Right now it emits Qt signals. The backend version of this
-        # will do zmq.send_multipart, and the frontend version will be
-        # similar to this
-
-        # for some reason emitting 'None' gives a segmentation fault.
-        if data is None:
-            data = ''
+        with self._lock:
+            queue = self._lanes[lane]
+            if collapse and any(pending == cmd for _, pending in queue):
+                return False
+            queue.append((time.time(), cmd))
+            return True
 
-        try:
-            self._signals[key].emit(data)
-        except KeyError:
-            log.err("Unknown key for signal %s!" % (key,))
+    def get(self, lane=NORMAL):
+        """
+        Remove and return the oldest command of a lane.
+
+        :param lane: the lane to get the command from, URGENT or NORMAL.
+        :type lane: str
+
+        :returns: the time the command was enqueued and the command.
+        :rtype: tuple (float, tuple)
+        :raises Empty: if there are no commands in the lane.
+        """
+        with self._lock:
+            try:
+                return self._lanes[lane].popleft()
+            except IndexError:
+                raise Empty()
+
+    def empty(self, lane=NORMAL):
+        """
+        Return whether a lane has no commands.
+
+        :rtype: bool
+        """
+        with self._lock:
+            return len(self._lanes[lane]) == 0
+
+    def discard(self, component, methods):
+        """
+        Remove the pending commands of a component for the given methods.
+
+        :param component: the key of the component.
+        :type component: str
+        :param methods: the methods of the commands to remove.
+        :type methods: tuple of str
+
+        :returns: the number of commands removed.
+        :rtype: int
+        """
+        with self._lock:
+            lane = self._lanes[self.NORMAL]
+            kept = deque(item for item in lane
+                         if item[1][0] != component or
+                         item[1][1] not in methods)
+            removed = len(lane) - len(kept)
+            self._lanes[self.NORMAL] = kept
+        return removed
+
+
+class PendingCommand(object):
+    """
+    Marker for a command that is being dispatched: its method has been
+    called but it didn't return its defer yet.
+
+    It's tracked like the ongoing defers, so a cancel that comes in that
+    window is not lost: it's recorded here and applied to the defer once it
+    exists.
+    """
+
+    def __init__(self):
+        # whether the backend was stopped while dispatching
+        self.cancelled = False
+        # the urgent commands that superseded this one while dispatching
+        self.superseded_by = []
+
+    def cancel(self):
+        """
+        Flag the command to have its defer cancelled once it's returned.
+        """
+        self.cancelled = True
 
 
 class Backend(object):
@@ -1457,18 +1327,56 @@ class Backend(object):
     PASSED_KEY = "passed"
     ERROR_KEY = "error"
 
-    def __init__(self, bypass_checks=False):
+    # Commands that don't wait in the queue: they run in the reactor thread
+    # as soon as they arrive. Each one supersedes the given methods of its
+    # component, their pending commands are dropped and their ongoing defers
+    # are cancelled.
+    URGENT_COMMANDS = {
+        ("provider", "cancel_setup_provider"): ("setup_provider", "bootstrap"),
+        ("authenticate", "cancel_login"): ("login",),
+        ("eip", "cancel_setup_eip"): ("setup_eip",),
+        ("eip", "stop"): ("start",),
+        ("eip", "terminate"): ("start",),
+        ("soledad", "cancel_bootstrap"): ("bootstrap",),
+    }
+
+    # Idempotent queries, a query that is identical to one still waiting in
+    # the queue is dropped, the pending one will signal the answer for both.
+    COLLAPSIBLE_COMMANDS = frozenset([
+        ("eip", "can_start"),
+        ("eip", "get_gateways_list"),
+        ("provider", "get_all_services"),
+        ("provider", "get_details"),
+        ("authenticate", "get_logged_in_status"),
+    ])
+
+    def __init__(self, bypass_checks=False, signaler=None):
         """
         Constructor for the backend.
+
+        :param bypass_checks: Set to true if the app should bypass
+                              first round of checks for CA
+                              certificates at bootstrap
+        :type bypass_checks: bool
+        :param signaler: Object in charge of handling communication
+                         back to the frontend, an EventSignaler is created
+                         if none is given.
+        :type signaler: AbstractSignaler
         """
         # Components map for the commands received
         self._components = {}
 
-        # Ongoing defers that will be cancelled at stop time
-        self._ongoing_defers = []
+        # Ongoing defers that will be cancelled at stop time, by component:
+        # {component: {defer: method}}
+        # A PendingCommand stands in for the defer while the method runs.
+        self._ongoing_defers = {}
+        self._ongoing_lock = Lock()
 
-        # Signaler object to translate commands into Qt signals
-        self._signaler = Signaler()
+        # Signaler object to translate commands into signals for the
+        # frontend
+        if signaler is None:
+            signaler = EventSignaler()
+        self._signaler = signaler
 
         # Objects needed by several components, so we make a proxy and pass
         # them around
@@ -1489,14 +1397,18 @@ class Backend(object):
                             self._keymanager_proxy,
                             self._signaler))
 
-        # We have a looping call on a thread executing all the
-        # commands in queue. Right now this queue is an actual Queue
-        # object, but it'll become the zmq recv_multipart queue
-        self._lc = LoopingCall(threads.deferToThread, self._worker)
-
         # Temporal call_queue for worker, will be replaced with
-        # recv_multipart os something equivalent in the loopingcall
-        self._call_queue = Queue()
+        # recv_multipart os something equivalent.
+        # Enqueuing a command wakes the dispatcher up on the reactor, which
+        # drains the queue in a thread. There is no polling, so an idle
+        # backend does not wake up at all.
+        self._call_queue = CommandQueue()
+
+        # Whether the backend is accepting commands to dispatch
+        self._running = False
+
+        # Whether there is a worker draining the queue right now
+        self._dispatching = False
 
     @property
     def signaler(self):
@@ -1507,14 +1419,15 @@ class Backend(object):
 
     def start(self):
         """
-        Starts the looping call
+        Starts dispatching the queued commands.
         """
         logger.debug("Starting worker...")
-        self._lc.start(0.01)
+        self._running = True
+        self._wakeup()
 
     def stop(self):
         """
-        Stops the looping call and tries to cancel all the defers.
+        Stops the dispatcher and tries to cancel all the defers.
         """
         reactor.callLater(2, self._stop)
 
@@ -1523,14 +1436,17 @@ class Backend(object):
         Delayed stopping of worker. Called from `stop`.
         """
         logger.debug("Stopping worker...")
-        if self._lc.running:
-            self._lc.stop()
+        if self._running:
+            self._running = False
         else:
-            logger.warning("Looping call is not running, cannot stop")
+            logger.warning("Worker is not running, cannot stop")
 
         logger.debug("Cancelling ongoing defers...")
-        while len(self._ongoing_defers) > 0:
-            d = self._ongoing_defers.pop()
+        with self._ongoing_lock:
+            defers = [d for ongoing in self._ongoing_defers.itervalues()
+                      for d in ongoing]
+            self._ongoing_defers.clear()
+        for d in defers:
             d.cancel()
         logger.debug("Defers cancelled.")
 
@@ -1558,45 +1474,252 @@ class Backend(object):
         """
         self._signaler.signal(signal)
 
-    def _worker(self):
+    def _enqueue(self, cmd):
         """
-        Worker method, called from a different thread and as a part of
-        a looping call
+        Put a command in the call queue and wake the dispatcher up.
+
+        This is thread safe, it can be called from the reactor thread or
+        from any other one.
+
+        :param cmd: the command, in the form:
+                    (component, method, signalback, *args)
+        :type cmd: tuple
         """
-        try:
-            # this'll become recv_multipart
-            cmd = self._call_queue.get(block=False)
+        if cmd[:2] in self.URGENT_COMMANDS:
+            lane = CommandQueue.URGENT
+        else:
+            lane = CommandQueue.NORMAL
+
+        collapse = cmd[:2] in self.COLLAPSIBLE_COMMANDS
+
+        # this'll become send_multipart
+        if not self._call_queue.put(cmd, lane, collapse):
+            logger.debug("%s.%s already queued, collapsed" % cmd[:2])
+            return
+        reactor.callFromThread(self._wakeup)
+
+    def _wakeup(self):
+        """
+        Run the urgent commands right away, and start draining the rest of
+        the call queue in a thread, unless it's already being drained or the
+        backend is not running.
+
+        This should only be called from the reactor thread.
+        """
+        if not self._running:
+            return
+
+        self._run_urgent()
 
+        if self._dispatching or self._call_queue.empty():
+            return
+
+        self._dispatching = True
+        d = threadpools.defer_to_pool(threadpools.BACKEND, self._worker)
+        d.addErrback(logger.error)
+        d.addBoth(self._dispatch_done)
+
+    def _run_urgent(self):
+        """
+        Run the commands in the urgent lane, ahead of the ones waiting for
+        the worker. The pending and ongoing commands that each one
+        supersedes are dropped first, so a cancel can't be overtaken by the
+        very command it cancels.
+
+        This should only be called from the reactor thread.
+        """
+        while True:
+            try:
+                enqueued_at, cmd = self._call_queue.get(CommandQueue.URGENT)
+            except Empty:
+                return
+
+            component = cmd[0]
+            methods = self.URGENT_COMMANDS[cmd[:2]]
+            dropped = self._call_queue.discard(component, methods)
+            if dropped:
+                logger.debug("%s.%s dropped %d pending commands" % (
+                    component, cmd[1], dropped))
+            self._cancel_ongoing(cmd)
+
+            latency.backend_stats.record(component, cmd[1], latency.QUEUED,
+                                         time.time() - enqueued_at)
+            self._run_command(cmd)
+
+    def _cancel_ongoing(self, cmd):
+        """
+        Cancel the ongoing defers of the commands that an urgent command
+        supersedes.
+
+        The commands still being dispatched have no defer yet, the urgent
+        command is recorded on them and run again once they return it. See
+        `_run_command`.
+
+        :param cmd: the urgent command, in the form:
+                    (component, method, signalback, *args)
+        :type cmd: tuple
+        """
+        methods = self.URGENT_COMMANDS[cmd[:2]]
+        defers = []
+        with self._ongoing_lock:
+            ongoing = self._ongoing_defers.get(cmd[0], {})
+            for d, method in ongoing.iteritems():
+                if method not in methods:
+                    continue
+                if isinstance(d, PendingCommand):
+                    d.superseded_by.append(cmd)
+                else:
+                    defers.append(d)
+        for d in defers:
+            d.cancel()
+
+    def _add_pending(self, cmd):
+        """
+        Track a command that is about to be dispatched.
+
+        This should be called with the `_ongoing_lock` held.
+
+        :param cmd: the command, in the form:
+                    (component, method, signalback, *args)
+        :type cmd: tuple
+
+        :returns: the marker for the command.
+        :rtype: PendingCommand
+        """
+        pending = PendingCommand()
+        ongoing = self._ongoing_defers.setdefault(cmd[0], {})
+        ongoing[pending] = cmd[1]
+        return pending
+
+    def _dispatch_done(self, _):
+        """
+        Callback for the worker once it's done draining the queue. If some
+        command arrived in the meantime, it starts draining again.
+        """
+        self._dispatching = False
+        self._wakeup()
+
+    def _worker(self):
+        """
+        Worker method, called from a different thread. It runs every command
+        in the queue, in order, until the queue is empty.
+        """
+        while self._running:
+            # The command is taken from the queue and tracked as pending in
+            # one step, so an urgent command that comes in between finds it
+            # either in the queue or in the ongoing ones.
+            with self._ongoing_lock:
+                try:
+                    # this'll become recv_multipart
+                    enqueued_at, cmd = self._call_queue.get()
+                except Empty:
+                    # If it's just empty we don't have anything else to do.
+                    return
+                pending = self._add_pending(cmd)
+
+            latency.backend_stats.record(cmd[0], cmd[1], latency.QUEUED,
+                                         time.time() - enqueued_at)
+            self._run_command(cmd, pending)
+
+    def _run_command(self, cmd, pending=None):
+        """
+        Run a single command, and keep track of the defer returned (if any).
+
+        :param cmd: the command, in the form:
+                    (component, method, signalback, *args)
+        :type cmd: tuple
+        :param pending: the marker the command is tracked with until its
+                        defer is returned, one is added if not given.
+        :type pending: PendingCommand
+        """
+        if pending is None:
+            with self._ongoing_lock:
+                pending = self._add_pending(cmd)
+
+        d = None
+        try:
             # cmd is: component, method, signalback, *args
             func = getattr(self._components[cmd[0]], cmd[1])
-            d = func(*cmd[3:])
+            started = time.time()
+            try:
+                d = func(*cmd[3:])
+            finally:
+                # Tracked before adding the callbacks, the defer may have
+                # already fired.
+                with self._ongoing_lock:
+                    ongoing = self._ongoing_defers.setdefault(cmd[0], {})
+                    ongoing.pop(pending, None)
+                    if d is not None:
+                        ongoing[d] = cmd[1]
+            latency.backend_stats.record(cmd[0], cmd[1], latency.CALL,
+                                         time.time() - started)
             if d is not None:  # d may be None if a defer chain is cancelled.
+                d.addBoth(self._command_fired, cmd[0], cmd[1], started)
                 # A call might not have a callback signal, but if it does,
                 # we add it to the chain
                 if cmd[2] is not None:
                     d.addCallbacks(self._signal_back, logger.error, cmd[2])
-                d.addCallbacks(self._done_action, logger.error,
-                               callbackKeywords={"d": d})
                 d.addErrback(logger.error)
-                self._ongoing_defers.append(d)
-        except Empty:
-            # If it's just empty we don't have anything to do.
-            pass
+                d.addBoth(self._done_action, cmd[0], d)
         except defer.CancelledError:
             logger.debug("defer cancelled somewhere (CancelledError).")
         except Exception as e:
             # But we log the rest
             logger.exception("Unexpected exception: {0!r}".format(e))
 
-    def _done_action(self, _, d):
+        self._apply_late_cancels(pending, d)
+
+    def _apply_late_cancels(self, pending, d):
+        """
+        Apply to the defer of a command the cancels that came while it was
+        being dispatched, before the defer existed.
+
+        The urgent commands run again, now that the component knows about
+        the defer they should cancel.
+
+        :param pending: the marker the command was tracked with.
+        :type pending: PendingCommand
+        :param d: the defer returned by the command, if any.
+        :type d: twisted.internet.defer.Deferred or None
+        """
+        # No one else sees the marker once it's untracked, so it can be read
+        # without the lock.
+        if pending.cancelled and d is not None:
+            reactor.callFromThread(d.cancel)
+        for cmd in pending.superseded_by:
+            logger.debug("%s.%s came while dispatching, running it again" % (
+                cmd[:2]))
+            reactor.callFromThread(self._run_command, cmd)
+
+    def _command_fired(self, result, component, method, started):
+        """
+        Record how long it took for the defer of a command to fire, and
+        pass its result along.
+
+        :param component: the key of the component that ran the command.
+        :type component: str
+        :param method: the method that ran the command.
+        :type method: str
+        :param started: the time when the command started running.
+        :type started: float
+        """
+        latency.backend_stats.record(component, method, latency.FIRED,
+                                     time.time() - started)
+        return result
+
+    def _done_action(self, _, component, d):
         """
-        Remover of the defer once it's done
+        Remover of the defer once it's done, either way.
 
+        :param component: the key of the component that ran the command.
+        :type component: str
         :param d: defer to remove
         :type d: twisted.internet.defer.Deferred
         """
-        if d in self._ongoing_defers:
-            self._ongoing_defers.remove(d)
+        with self._ongoing_lock:
+            ongoing = self._ongoing_defers.get(component)
+            if ongoing is not None:
+                ongoing.pop(d, None)
 
     # XXX: Temporal interface until we migrate to zmq
     # We simulate the calls to zmq.send_multipart. Once we separate
@@ -1617,13 +1740,13 @@ class Backend(object):
             prov_https_connection       -> { PASSED_KEY: bool, ERROR_KEY: str }
             prov_download_provider_info -> { PASSED_KEY: bool, ERROR_KEY: str }
         """
-        self._call_queue.put(("provider", "setup_provider", None, provider))
+        self._enqueue(("provider", "setup_provider", None, provider))
 
     def provider_cancel_setup(self):
         """
         Cancel the ongoing setup provider (if any).
         """
-        self._call_queue.put(("provider", "cancel_setup_provider", None))
+        self._enqueue(("provider", "cancel_setup_provider", None))
 
     def provider_bootstrap(self, provider):
         """
@@ -1638,7 +1761,7 @@ class Backend(object):
             prov_check_ca_fingerprint  -> {PASSED_KEY: bool, ERROR_KEY: str}
             prov_check_api_certificate -> {PASSED_KEY: bool, ERROR_KEY: str}
         """
-        self._call_queue.put(("provider", "bootstrap", None, provider))
+        self._enqueue(("provider", "bootstrap", None, provider))
 
     def provider_get_supported_services(self, domain):
         """
@@ -1650,8 +1773,8 @@ class Backend(object):
         Signals:
             prov_get_supported_services -> list of unicode
         """
-        self._call_queue.put(("provider", "get_supported_services", None,
-                              domain))
+        self._enqueue(("provider", "get_supported_services", None,
+                       domain))
 
     def provider_get_all_services(self, providers):
         """
@@ -1663,8 +1786,8 @@ class Backend(object):
         Signals:
             prov_get_all_services -> list of unicode
         """
-        self._call_queue.put(("provider", "get_all_services", None,
-                              providers))
+        self._enqueue(("provider", "get_all_services", None,
+                       providers))
 
     def provider_get_details(self, domain, lang):
         """
@@ -1679,7 +1802,7 @@ class Backend(object):
         Signals:
             prov_get_details -> ProviderConfigLight
         """
-        self._call_queue.put(("provider", "get_details", None, domain, lang))
+        self._enqueue(("provider", "get_details", None, domain, lang))
 
     def user_register(self, provider, username, password):
         """
@@ -1697,8 +1820,8 @@ class Backend(object):
             srp_registration_taken
             srp_registration_failed
         """
-        self._call_queue.put(("register", "register_user", None, provider,
-                              username, password))
+        self._enqueue(("register", "register_user", None, provider,
+                       username, password))
 
     def eip_setup(self, provider, skip_network=False):
         """
@@ -1715,14 +1838,14 @@ class Backend(object):
             eip_client_certificate_ready -> {PASSED_KEY: bool, ERROR_KEY: str}
             eip_cancelled_setup
         """
-        self._call_queue.put(("eip", "setup_eip", None, provider,
-                              skip_network))
+        self._enqueue(("eip", "setup_eip", None, provider,
+                       skip_network))
 
     def eip_cancel_setup(self):
         """
         Cancel the ongoing setup EIP (if any).
         """
-        self._call_queue.put(("eip", "cancel_setup_eip", None))
+        self._enqueue(("eip", "cancel_setup_eip", None))
 
     def eip_start(self, restart=False):
         """
@@ -1749,7 +1872,7 @@ class Backend(object):
         :param restart: whether is is a restart.
         :type restart: bool
         """
-        self._call_queue.put(("eip", "start", None, restart))
+        self._enqueue(("eip", "start", None, restart))
 
     def eip_stop(self, shutdown=False, restart=False, failed=False):
         """
@@ -1761,13 +1884,13 @@ class Backend(object):
         :param restart: whether this is part of a restart.
         :type restart: bool
         """
-        self._call_queue.put(("eip", "stop", None, shutdown, restart))
+        self._enqueue(("eip", "stop", None, shutdown, restart))
 
     def eip_terminate(self):
         """
         Terminate the EIP service, not necessarily in a nice way.
         """
-        self._call_queue.put(("eip", "terminate", None))
+        self._enqueue(("eip", "terminate", None))
 
     def eip_get_gateways_list(self, domain):
         """
@@ -1785,7 +1908,7 @@ class Backend(object):
             eip_get_gateways_list_error
             eip_uninitialized_provider
         """
-        self._call_queue.put(("eip", "get_gateways_list", None, domain))
+        self._enqueue(("eip", "get_gateways_list", None, domain))
 
     def eip_get_initialized_providers(self, domains):
         """
@@ -1798,8 +1921,8 @@ class Backend(object):
             eip_get_initialized_providers -> list of tuple(unicode, bool)
 
         """
-        self._call_queue.put(("eip", "get_initialized_providers",
-                              None, domains))
+        self._enqueue(("eip", "get_initialized_providers",
+                       None, domains))
 
     def eip_can_start(self, domain):
         """
@@ -1812,14 +1935,14 @@ class Backend(object):
             eip_can_start
             eip_cannot_start
         """
-        self._call_queue.put(("eip", "can_start",
-                              None, domain))
+        self._enqueue(("eip", "can_start",
+                       None, domain))
 
     def tear_fw_down(self):
         """
         Signal the need to tear the fw down.
         """
-        self._call_queue.put(("eip", "tear_fw_down", None))
+        self._enqueue(("eip", "tear_fw_down", None))
 
     def user_login(self, provider, username, password):
         """
@@ -1840,8 +1963,8 @@ class Backend(object):
             srp_auth_connection_error
             srp_auth_error
         """
-        self._call_queue.put(("authenticate", "login", None, provider,
-                              username, password))
+        self._enqueue(("authenticate", "login", None, provider,
+                       username, password))
 
     def user_logout(self):
         """
@@ -1852,13 +1975,13 @@ class Backend(object):
             srp_logout_error
             srp_not_logged_in_error
         """
-        self._call_queue.put(("authenticate", "logout", None))
+        self._enqueue(("authenticate", "logout", None))
 
     def user_cancel_login(self):
         """
         Cancel the ongoing login (if any).
         """
-        self._call_queue.put(("authenticate", "cancel_login", None))
+        self._enqueue(("authenticate", "cancel_login", None))
 
     def user_change_password(self, current_password, new_password):
         """
@@ -1875,8 +1998,8 @@ class Backend(object):
             srp_password_change_badpw
             srp_password_change_error
         """
-        self._call_queue.put(("authenticate", "change_password", None,
-                              current_password, new_password))
+        self._enqueue(("authenticate", "change_password", None,
+                       current_password, new_password))
 
     def soledad_change_password(self, new_password):
         """
@@ -1891,8 +2014,8 @@ class Backend(object):
             srp_password_change_badpw
             srp_password_change_error
         """
-        self._call_queue.put(("soledad", "change_password", None,
-                              new_password))
+        self._enqueue(("soledad", "change_password", None,
+                       new_password))
 
     def user_get_logged_in_status(self):
         """
@@ -1902,7 +2025,7 @@ class Backend(object):
             srp_status_logged_in
             srp_status_not_logged_in
         """
-        self._call_queue.put(("authenticate", "get_logged_in_status", None))
+        self._enqueue(("authenticate", "get_logged_in_status", None))
 
     def soledad_bootstrap(self, username, domain, password):
         """
@@ -1920,8 +2043,8 @@ class Backend(object):
             soledad_bootstrap_failed
             soledad_invalid_auth_token
         """
-        self._call_queue.put(("soledad", "bootstrap", None,
-                              username, domain, password))
+        self._enqueue(("soledad", "bootstrap", None,
+                       username, domain, password))
 
     def soledad_load_offline(self, username, password, uuid):
         """
@@ -1936,20 +2059,20 @@ class Backend(object):
 
         Signals:
         """
-        self._call_queue.put(("soledad", "load_offline", None,
-                              username, password, uuid))
+        self._enqueue(("soledad", "load_offline", None,
+                       username, password, uuid))
 
     def soledad_cancel_bootstrap(self):
         """
         Cancel the ongoing soledad bootstrapping process (if any).
         """
-        self._call_queue.put(("soledad", "cancel_bootstrap", None))
+        self._enqueue(("soledad", "cancel_bootstrap", None))
 
     def soledad_close(self):
         """
         Close soledad database.
         """
-        self._call_queue.put(("soledad", "close", None))
+        self._enqueue(("soledad", "close", None))
 
     def keymanager_list_keys(self):
         """
@@ -1958,7 +2081,7 @@ class Backend(object):
         Signals:
             keymanager_keys_list -> list
         """
-        self._call_queue.put(("keymanager", "list_keys", None))
+        self._enqueue(("keymanager", "list_keys", None))
 
     def keymanager_export_keys(self, username, filename):
         """
@@ -1973,8 +2096,8 @@ class Backend(object):
             keymanager_export_ok
             keymanager_export_error
         """
-        self._call_queue.put(("keymanager", "export_keys", None,
-                              username, filename))
+        self._enqueue(("keymanager", "export_keys", None,
+                       username, filename))
 
     def keymanager_get_key_details(self, username):
         """
@@ -1986,7 +2109,7 @@ class Backend(object):
         Signals:
             keymanager_key_details
         """
-        self._call_queue.put(("keymanager", "get_key_details", None, username))
+        self._enqueue(("keymanager", "get_key_details", None, username))
 
     def smtp_start_service(self, full_user_id, download_if_needed=False):
         """
@@ -1998,8 +2121,8 @@ class Backend(object):
                                    for the file
         :type download_if_needed: bool
         """
-        self._call_queue.put(("mail", "start_smtp_service", None,
-                              full_user_id, download_if_needed))
+        self._enqueue(("mail", "start_smtp_service", None,
+                       full_user_id, download_if_needed))
 
     def imap_start_service(self, full_user_id, offline=False):
         """
@@ -2010,14 +2133,14 @@ class Backend(object):
         :param offline: whether imap should start in offline mode or not.
         :type offline: bool
         """
-        self._call_queue.put(("mail", "start_imap_service", None,
-                              full_user_id, offline))
+        self._enqueue(("mail", "start_imap_service", None,
+                       full_user_id, offline))
 
     def smtp_stop_service(self):
         """
         Stop the SMTP service.
         """
-        self._call_queue.put(("mail", "stop_smtp_service", None))
+        self._enqueue(("mail", "stop_smtp_service", None))
 
     def imap_stop_service(self):
         """
@@ -2026,4 +2149,4 @@ class Backend(object):
         Signals:
             imap_stopped
         """
-        self._call_queue.put(("mail", "stop_imap_service", None))
+        self._enqueue(("mail", "stop_imap_service", None))
@@ -0,0 +1,619 @@
+# -*- coding: utf-8 -*-
+# backend_ipc.py
+# Copyright (C) 2014 LEAP
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Out of process backend.
+
+The backend daemon hosts the Backend and all its components, and the
+frontend talks to it through a BackendProxy, that exposes the same methods
+and signals than the Backend does.
+
+Both sides talk through a Unix socket, using length prefixed frames with
+msgpack encoded messages:
+    frontend -> backend: (MSG_CALL, method, args, kwargs)
+    backend -> frontend: (MSG_SIGNAL, key, data)
+"""
+import logging
+import os
+import shutil
+import sys
+import tempfile
+
+from functools import partial
+
+from twisted.internet import protocol, reactor
+from twisted.protocols.basic import Int32StringReceiver
+
+from leap.bitmask.backend import Backend
+from leap.bitmask.config import flags
+from leap.bitmask.config.providerconfig import ProviderConfigLight
+from leap.bitmask.signaler import EventSignaler
+from leap.bitmask.util import wire
+
+logger = logging.getLogger(__name__)
+
+MSG_CALL = 0
+MSG_SIGNAL = 1
+
+# Objects that travel along with the signals and that the frontend needs
+# to get back with its behaviour.
+wire.register_type(ProviderConfigLight)
+
+
+def _get_backend_api():
+    """
+    Return the names of the Backend methods that can be called remotely.
+
+    :rtype: frozenset of str
+    """
+    return frozenset(
+        name for name, value in vars(Backend).items()
+        if not name.startswith('_') and callable(value) and
+        name not in ('start', 'stop'))
+
+BACKEND_API = _get_backend_api()
+
+
+class FramedProtocol(Int32StringReceiver):
+    """
+    Protocol that exchanges length prefixed, msgpack encoded, messages.
+    """
+    # keys lists and provider details can be big
+    MAX_LENGTH = 16 * 1024 * 1024
+
+    def send_message(self, data):
+        """
+        Send an already packed message.
+
+        :param data: the message packed with wire.pack
+        :type data: str
+        """
+        self.sendString(data)
+
+    def stringReceived(self, data):
+        """
+        Unpack a received frame and hand it over to `message_received`.
+
+        :param data: the frame received
+        :type data: str
+        """
+        try:
+            message = wire.unpack(data)
+        except Exception as e:
+            logger.error("Could not unpack message: {0!r}".format(e))
+            return
+
+        self.message_received(message)
+
+    def message_received(self, message):
+        """
+        Handle a received message. Derived classes should implement this.
+
+        :param message: the message received
+        :type message: list
+        """
+        raise NotImplementedError()
+
+
+#
+# Backend side
+#
+
+class SignalForwarder(object):
+    """
+    Callback for an EventSignaler that serializes the signals and sends them
+    to the connected frontend.
+    """
+
+    def __init__(self):
+        """
+        Constructor for the SignalForwarder
+        """
+        self.connection = None
+
+    def __call__(self, key, data):
+        """
+        Send a signal to the frontend, with its data.
+
+        :param key: string identifying the signal
+        :type key: str
+        :param data: object to send with the data
+        :type data: object
+        """
+        if self.connection is None:
+            logger.debug("No frontend connected, dropping signal %s" %
+                         (key,))
+            return
+
+        try:
+            message = wire.pack((MSG_SIGNAL, key, data))
+        except TypeError as e:
+            logger.error("Cannot serialize data for signal {0}: {1!r}".format(
+                key, e))
+            return
+
+        self.connection.send_message(message)
+
+
+class BackendDaemonProtocol(FramedProtocol):
+    """
+    Backend side of the connection with the frontend.
+    """
+
+    def connectionMade(self):
+        """
+        Attach this connection to the forwarder, only one frontend is
+        allowed.
+        """
+        forwarder = self.factory.forwarder
+        if forwarder.connection is not None:
+            logger.error("A frontend is already connected, refusing "
+                         "new connection.")
+            self.transport.loseConnection()
+            return
+
+        logger.debug("Frontend connected.")
+        forwarder.connection = self
+
+    def connectionLost(self, reason):
+        """
+        If the frontend went away, there is nothing left to do here, unless
+        the backend runs on its own.
+        """
+        forwarder = self.factory.forwarder
+        if forwarder.connection is self:
+            logger.debug("Frontend disconnected.")
+            forwarder.connection = None
+            if self.factory.exit_on_disconnect:
+                self.factory.shutdown()
+
+    def message_received(self, message):
+        """
+        Run the backend call received.
+
+        :param message: the call, as (MSG_CALL, method, args, kwargs)
+        :type message: list
+        """
+        try:
+            kind, method, args, kwargs = message
+        except ValueError:
+            logger.error("Malformed message: {0!r}".format(message))
+            return
+
+        if kind != MSG_CALL:
+            logger.error("Unexpected message type: {0!r}".format(kind))
+            return
+
+        self.factory.call(method, args, kwargs)
+
+
+class BackendDaemonFactory(protocol.ServerFactory):
+    """
+    Factory for the backend side of the connection, it holds the backend.
+    """
+
+    protocol = BackendDaemonProtocol
+
+    # Time given to the backend to cancel its defers before quitting.
+    SHUTDOWN_DELAY = 3
+
+    def __init__(self, backend, forwarder, exit_on_disconnect=True):
+        """
+        Constructor for the BackendDaemonFactory
+
+        :param backend: the backend to run the calls in.
+        :type backend: Backend
+        :param forwarder: the callback that sends the backend signals.
+        :type forwarder: SignalForwarder
+        :param exit_on_disconnect: whether to quit when the frontend
+                                   disconnects.
+        :type exit_on_disconnect: bool
+        """
+        self._backend = backend
+        self.forwarder = forwarder
+        self.exit_on_disconnect = exit_on_disconnect
+        self._stopping = False
+
+    def call(self, method, args, kwargs):
+        """
+        Call a backend method.
+
+        :param method: the name of the Backend method
+        :type method: unicode
+        :param args: the positional arguments for the call
+        :type args: list
+        :param kwargs: the keyword arguments for the call
+        :type kwargs: dict
+        """
+        if method == "stop":
+            self.shutdown()
+            return
+
+        if method not in BACKEND_API:
+            logger.error("Unknown backend call: {0!r}".format(method))
+            return
+
+        kwargs = dict((str(k), v) for k, v in kwargs.iteritems())
+        getattr(self._backend, method)(*args, **kwargs)
+
+    def shutdown(self):
+        """
+        Stop the backend and quit.
+        """
+        if self._stopping:
+            return
+
+        self._stopping = True
+        self._backend.stop()
+        reactor.callLater(self.SHUTDOWN_DELAY, reactor.stop)
+
+
+def _remove_socket(socket_path):
+    """
+    Remove the socket file. Its directory belongs to whoever chose the path.
+
+    :param socket_path: the path to the socket
+    :type socket_path: str
+    """
+    try:
+        os.unlink(socket_path)
+    except OSError:
+        pass
+
+
+def _set_flags(opts):
+    """
+    Set the global flags according to the options that the frontend passed.
+
+    :param opts: the parsed options
+    :type opts: argparse.Namespace
+    """
+    from leap.common.config.baseconfig import BaseConfig
+    flags.STANDALONE = opts.standalone
+    flags.OFFLINE = opts.offline
+    flags.APP_VERSION_CHECK = opts.app_version_check
+    flags.API_VERSION_CHECK = opts.api_version_check
+    flags.OPENVPN_VERBOSITY = opts.openvpn_verb
+    flags.CA_CERT_FILE = opts.ca_cert_file
+    flags.LATENCY_REPORT = opts.latency_report
+    # there is no Qt in here.
+    flags.HEADLESS = True
+
+    BaseConfig.standalone = opts.standalone
+
+
+def _add_logger_handler(debug=False):
+    """
+    Log to stderr, the frontend shares it with us.
+
+    :param debug: whether we should log debug messages or not.
+    :type debug: bool
+    """
+    from leap.bitmask.util import log_silencer, LOG_FORMAT
+
+    level = logging.DEBUG if debug else logging.WARNING
+    leap_logger = logging.getLogger(name='leap')
+    leap_logger.setLevel(level)
+
+    console = logging.StreamHandler()
+    console.setLevel(level)
+    console.setFormatter(logging.Formatter(LOG_FORMAT))
+    console.addFilter(log_silencer.SelectiveSilencerFilter())
+    leap_logger.addHandler(console)
+
+
+def listen(backend, signaler, socket_path, exit_on_disconnect=True):
+    """
+    Listen on a Unix socket for a frontend to drive the backend, and send
+    it the backend signals.
+
+    :param backend: the backend to run the calls in.
+    :type backend: Backend
+    :param signaler: the signaler used by the backend.
+    :type signaler: EventSignaler
+    :param socket_path: the path for the socket.
+    :type socket_path: str
+    :param exit_on_disconnect: whether to quit when the frontend
+                               disconnects.
+    :type exit_on_disconnect: bool
+    """
+    forwarder = SignalForwarder()
+    signaler.connect_all(forwarder)
+    factory = BackendDaemonFactory(backend, forwarder, exit_on_disconnect)
+
+    reactor.listenUNIX(socket_path, factory, mode=0600)
+    reactor.addSystemEventTrigger('after', 'shutdown',
+                                  _remove_socket, socket_path)
+    logger.debug("Backend listening on %s" % (socket_path,))
+
+
+def run_daemon():
+    """
+    Run the backend daemon, listening for the frontend on the socket given
+    with --socket.
+    """
+    from leap.bitmask.util import leap_argparse
+
+    parser = leap_argparse.build_parser()
+    parser.add_argument('--socket', metavar="/path/to/socket",
+                        action="store", dest="socket", required=True,
+                        help='Unix socket to listen for the frontend.')
+    opts, _ = parser.parse_known_args()
+
+    _add_logger_handler(opts.debug)
+    _set_flags(opts)
+
+    if flags.LATENCY_REPORT is not None:
+        from leap.bitmask.util.latency import install_report_handler
+        install_report_handler(flags.LATENCY_REPORT)
+
+    from leap.bitmask.util import dnscache
+    dnscache.install()
+
+    signaler = EventSignaler()
+    backend = Backend(getattr(opts, 'danger', False), signaler=signaler)
+    listen(backend, signaler, opts.socket)
+
+    backend.start()
+    reactor.run()
+
+
+#
+# Frontend side
+#
+
+class _BackendProxyProtocol(FramedProtocol):
+    """
+    Frontend side of the connection with the backend.
+    """
+
+    def connectionMade(self):
+        self.factory.resetDelay()
+        self.factory.proxy._connected(self)
+
+    def connectionLost(self, reason):
+        self.factory.proxy._disconnected()
+
+    def message_received(self, message):
+        """
+        Emit the signal received.
+
+        :param message: the signal, as (MSG_SIGNAL, key, data)
+        :type message: list
+        """
+        try:
+            kind, key, data = message
+        except ValueError:
+            logger.error("Malformed message: {0!r}".format(message))
+            return
+
+        if kind != MSG_SIGNAL:
+            logger.error("Unexpected message type: {0!r}".format(kind))
+            return
+
+        self.factory.proxy.signaler.signal(key, data)
+
+
+class _BackendProxyFactory(protocol.ReconnectingClientFactory):
+    """
+    Factory for the frontend side of the connection. It retries the
+    connection while the daemon starts, but not once it is lost.
+    """
+
+    protocol = _BackendProxyProtocol
+
+    initialDelay = 0.05
+    maxDelay = 1
+    maxRetries = 30
+
+    def __init__(self, proxy):
+        """
+        :param proxy: the proxy that uses this connection.
+        :type proxy: BackendProxy
+        """
+        self.proxy = proxy
+
+    def clientConnectionLost(self, connector, reason):
+        self.stopTrying()
+
+
+class _BackendProcessProtocol(protocol.ProcessProtocol):
+    """
+    Process protocol for the backend daemon.
+    """
+
+    def __init__(self, proxy):
+        """
+        :param proxy: the proxy that spawned the process.
+        :type proxy: BackendProxy
+        """
+        self._proxy = proxy
+
+    def processEnded(self, reason):
+        self._proxy._daemon_ended(reason)
+
+
+class BackendProxy(object):
+    """
+    Frontend for a backend running in a different process.
+
+    It exposes the same methods and signals that Backend does, so the UI
+    can use any of them.
+    """
+
+    PASSED_KEY = Backend.PASSED_KEY
+    ERROR_KEY = Backend.ERROR_KEY
+
+    def __init__(self, bypass_checks=False):
+        """
+        Constructor for the backend proxy.
+
+        :param bypass_checks: Set to true if the app should bypass
+                              first round of checks for CA
+                              certificates at bootstrap
+        :type bypass_checks: bool
+        """
+        # The proxy lives in the Qt frontend
+        from leap.bitmask.signaler_qt import Signaler
+
+        self._bypass_checks = bypass_checks
+
+        # The signals received from the backend are emitted through this
+        self._signaler = Signaler()
+
+        self._connection = None
+        self._factory = None
+        self._socket_dir = None
+
+        # Calls done before we get connected to the daemon
+        self._pending = []
+
+    @property
+    def signaler(self):
+        """
+        Public signaler access to let the UI connect to its signals.
+        """
+        return self._signaler
+
+    def __getattr__(self, name):
+        """
+        Return a callable that runs the Backend method `name` in the daemon.
+        """
+        if name not in BACKEND_API:
+            raise AttributeError(name)
+        return partial(self._call, name)
+
+    def _get_daemon_args(self, socket_path):
+        """
+        Return the arguments for the backend daemon process.
+
+        :param socket_path: the path for the socket to talk through.
+        :type socket_path: str
+
+        :rtype: list of str
+        """
+        args = ['--socket', socket_path]
+
+        if logging.getLogger('leap').isEnabledFor(logging.DEBUG):
+            args.append('--debug')
+        if flags.STANDALONE:
+            args.append('--standalone')
+        if flags.OFFLINE:
+            args.append('--offline')
+        if not flags.APP_VERSION_CHECK:
+            args.append('--no-app-version-check')
+        if not flags.API_VERSION_CHECK:
+            args.append('--no-api-version-check')
+        if flags.OPENVPN_VERBOSITY is not None:
+            args.extend(['--openvpn-verbosity', str(flags.OPENVPN_VERBOSITY)])
+        if flags.CA_CERT_FILE is not None:
+            args.extend(['--ca-cert-file', flags.CA_CERT_FILE])
+        if flags.LATENCY_REPORT is not None:
+            # the commands run in the daemon, so it writes the report.
+            args.extend(['--latency-report', flags.LATENCY_REPORT])
+        if self._bypass_checks:
+            args.append('--danger')
+
+        return args
+
+    def _get_daemon_command(self):
+        """
+        Return the command that runs the backend daemon.
+
+        A frozen bundle has no interpreter to run this module with, so the
+        bundle binary is run with --backend-daemon instead, see app.main.
+
+        :rtype: list of str
+        """
+        if getattr(sys, 'frozen', False):
+            return [sys.executable, '--backend-daemon']
+        return [sys.executable, '-m', 'leap.bitmask.backend_ipc']
+
+    def start(self):
+        """
+        Spawn the backend daemon and connect to it.
+        """
+        # mkdtemp creates a directory readable only by this user.
+        self._socket_dir = tempfile.mkdtemp(prefix="bitmask-")
+        socket_path = os.path.join(self._socket_dir, "backend.sock")
+
+        args = self._get_daemon_command()
+        args.extend(self._get_daemon_args(socket_path))
+
+        logger.debug("Spawning backend daemon...")
+        reactor.spawnProcess(_BackendProcessProtocol(self), sys.executable,
+                             args, env=os.environ,
+                             childFDs={0: 'w', 1: 1, 2: 2})
+
+        self._factory = _BackendProxyFactory(self)
+        reactor.connectUNIX(socket_path, self._factory)
+
+    def stop(self):
+        """
+        Ask the backend daemon to stop.
+        """
+        self._call("stop")
+
+    def _call(self, method, *args, **kwargs):
+        """
+        Send a call to the backend daemon, or keep it until we get connected.
+
+        :param method: the name of the Backend method to call.
+        :type method: str
+        """
+        message = wire.pack((MSG_CALL, method, args, kwargs))
+        if self._connection is None:
+            self._pending.append(message)
+        else:
+            self._connection.send_message(message)
+
+    def _connected(self, connection):
+        """
+        Send the calls we kept while waiting for the daemon.
+
+        :param connection: the connection with the daemon.
+        :type connection: _BackendProxyProtocol
+        """
+        logger.debug("Connected to the backend daemon.")
+        self._connection = connection
+        pending, self._pending = self._pending, []
+        for message in pending:
+            connection.send_message(message)
+
+    def _disconnected(self):
+        """
+        Forget about the lost connection.
+        """
+        logger.debug("Disconnected from the backend daemon.")
+        self._connection = None
+
+    def _daemon_ended(self, reason):
+        """
+        Clean up once the backend daemon is gone.
+
+        :param reason: the reason why the process ended.
+        :type reason: twisted.python.failure.Failure
+        """
+        logger.debug("Backend daemon ended: {0!r}".format(reason.value))
+        if self._factory is not None:
+            self._factory.stopTrying()
+        if self._socket_dir is not None:
+            shutil.rmtree(self._socket_dir, ignore_errors=True)
+            self._socket_dir = None
+
+
+if __name__ == "__main__":
+    run_daemon()
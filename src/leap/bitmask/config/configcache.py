@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+# configcache.py
+# Copyright (C) 2014 LEAP
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Process wide cache of the loaded configs.
+
+Loading a config parses its json and validates it against the schema. A
+loaded config is reused while its file keeps the same mtime and size, for
+the same config class and api version. The bootstrappers invalidate the
+files they save, so a new version is never missed even if it has the same
+size and is written in the same second. The configs they just loaded from
+the content they downloaded are put in the cache, so the first use of a
+new version doesn't parse it again, nor does a 304 later.
+
+The configs returned are shared: use their getters, don't load() on them.
+"""
+import logging
+import os
+
+from threading import Lock
+
+from leap.bitmask.util import get_path_prefix
+
+logger = logging.getLogger(__name__)
+
+
+class ConfigCache(object):
+    """
+    Thread safe cache of loaded configs, keyed by config class, path and
+    api version.
+    """
+
+    def __init__(self):
+        # {(config class, absolute path, api version): (stamp, config)}
+        self._entries = {}
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, config_class, path, api_version=None):
+        """
+        Return a config of `config_class` loaded from `path`, reusing the
+        cached one if the file didn't change.
+
+        :param config_class: the class of the config, a BaseConfig.
+        :type config_class: type
+        :param path: the path of the config, relative to the path prefix.
+        :type path: str
+        :param api_version: the api version to validate the config with, if
+                            the config class needs one.
+        :type api_version: str or None
+
+        :returns: the loaded config, or None if it can't be loaded.
+        :rtype: BaseConfig or None
+        """
+        absolute = os.path.join(get_path_prefix(), path)
+        key = (config_class, absolute, api_version)
+        try:
+            st = os.stat(absolute)
+            stamp = (st.st_mtime, st.st_size)
+        except OSError:
+            # let load() fail and log it, as if there was no cache.
+            stamp = None
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if stamp is not None and entry is not None and entry[0] == stamp:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        config = config_class()
+        if api_version is not None:
+            config.set_api_version(api_version)
+        if not config.load(path):
+            # failures are not cached, the file may be fixed any time.
+            return None
+
+        if stamp is not None:
+            with self._lock:
+                self._entries[key] = (stamp, config)
+        return config
+
+    def put(self, config_class, path, config, api_version=None):
+        """
+        Cache `config`, loaded from the content just written to `path`.
+
+        The cache keeps its own config sharing the loaded values, so
+        loading `config` again doesn't change the cached one.
+
+        :param config_class: the class of the config, a ValidatedConfig.
+        :type config_class: type
+        :param path: the path of the config, relative to the path prefix.
+        :type path: str
+        :param config: the loaded config.
+        :type config: ValidatedConfig
+        :param api_version: the api version the config was validated with.
+        :type api_version: str or None
+        """
+        self.invalidate(path)
+        if not config.loaded():
+            return
+
+        absolute = os.path.join(get_path_prefix(), path)
+        try:
+            st = os.stat(absolute)
+        except OSError:
+            return
+
+        shared = config_class()
+        if api_version is not None:
+            shared.set_api_version(api_version)
+        shared.copy_loaded(config)
+        with self._lock:
+            self._entries[(config_class, absolute, api_version)] = (
+                (st.st_mtime, st.st_size), shared)
+
+    def invalidate(self, path=None):
+        """
+        Forget the configs loaded from `path`, or every config if no path is
+        given.
+
+        :param path: the path of the config, relative to the path prefix.
+        :type path: str or None
+        """
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+                return
+
+            absolute = os.path.join(get_path_prefix(), path)
+            for key in [k for k in self._entries if k[1] == absolute]:
+                del self._entries[key]
+
+
+# The cache for this process
+_cache = ConfigCache()
+
+
+def load(config_class, path, api_version=None):
+    """
+    Return a config loaded from `path`, see ConfigCache.load.
+    """
+    return _cache.load(config_class, path, api_version)
+
+
+def put(config_class, path, config, api_version=None):
+    """
+    Cache a config just loaded for `path`, see ConfigCache.put.
+    """
+    _cache.put(config_class, path, config, api_version)
+
+
+def invalidate(path=None):
+    """
+    Forget the configs loaded from `path`, see ConfigCache.invalidate.
+    """
+    _cache.invalidate(path)
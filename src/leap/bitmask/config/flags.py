@@ -55,3 +55,18 @@ OPENVPN_VERBOSITY = 1
 
 # Skip the checks in the wizard, use for testing purposes only!
 SKIP_WIZARD_CHECKS = False
+
+# Run the backend in a separate process, talking to the frontend through
+# a local socket.
+BACKEND_PROCESS = False
+
+# File to write the backend latency report to, on SIGUSR1 and at shutdown.
+LATENCY_REPORT = None
+
+# Run without GUI, and without loading Qt at all. The backend settings are
+# then read and written without QSettings.
+HEADLESS = False
+
+# Fetch the provider files and talk to the auth api with the Twisted Agent
+# fetcher (util/agentfetcher.py) instead of requests.
+TWISTED_FETCHER = False
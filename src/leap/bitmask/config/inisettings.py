@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+# inisettings.py
+# Copyright (C) 2014 LEAP
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Plain python replacement for QSettings, for the headless mode.
+
+It reads and writes the same ini files that QSettings does with IniFormat,
+for the kind of values that the backend uses: strings, booleans and lists of
+strings. Other values written by the GUI are kept as they are.
+"""
+import ConfigParser
+import logging
+import os
+import tempfile
+
+from threading import Lock
+
+logger = logging.getLogger(__name__)
+
+# QSettings keeps the keys without a group in this section
+GENERAL_SECTION = "General"
+
+
+def _split_key(key):
+    """
+    Split a QSettings key in its ini section and option.
+
+    :param key: the key, like "Group/Key" or just "Key".
+    :type key: str
+
+    :rtype: tuple (str, str)
+    """
+    if "/" in key:
+        section, option = key.split("/", 1)
+        return section, option
+    return GENERAL_SECTION, key
+
+
+def _split_items(raw):
+    """
+    Split a raw ini value in its comma separated items, honoring quotes.
+
+    :param raw: the value as it is in the file.
+    :type raw: str
+
+    :rtype: list of str
+    """
+    items = []
+    current = []
+    quoted = False
+    escaped = False
+    for char in raw:
+        if escaped:
+            current.append(char)
+            escaped = False
+        elif char == "\\":
+            escaped = True
+        elif char == '"':
+            quoted = not quoted
+        elif char == "," and not quoted:
+            items.append("".join(current).strip())
+            current = []
+        else:
+            current.append(char)
+    items.append("".join(current).strip())
+    return items
+
+
+def _parse_value(raw):
+    """
+    Parse a raw ini value the way QSettings does.
+
+    :param raw: the value as it is in the file.
+    :type raw: str
+
+    :returns: the value, a list if it has several items, or None if it's
+              invalid.
+    :rtype: unicode, list of unicode or None
+    """
+    raw = raw.strip()
+    if raw == "@Invalid()":
+        return None
+    if raw.startswith("@"):
+        # some Qt type (@ByteArray, @Variant...) written by the GUI.
+        return raw
+
+    items = [item.decode("utf-8") for item in _split_items(raw)]
+    if len(items) > 1:
+        return items
+    return items[0]
+
+
+def _quote(text):
+    """
+    Quote a string if it has characters that QSettings would misread.
+
+    :type text: unicode or str
+
+    :rtype: str
+    """
+    if isinstance(text, unicode):
+        text = text.encode("utf-8")
+    if (any(char in text for char in ',;"=\\') or
+            text != text.strip() or text.startswith("@")):
+        return '"%s"' % (text.replace("\\", "\\\\").replace('"', '\\"'),)
+    return text
+
+
+def _format_value(value):
+    """
+    Format a value the way QSettings writes it.
+
+    :type value: bool, str, unicode or list
+
+    :rtype: str
+    """
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (list, tuple)):
+        if not value:
+            return "@Invalid()"
+        return ", ".join(_quote(item) for item in value)
+    if isinstance(value, (int, long, float)):
+        return str(value)
+    return _quote(value)
+
+
+class IniSettings(object):
+    """
+    The part of the QSettings API that LeapSettings uses: value, setValue,
+    remove, allKeys and sync.
+    """
+
+    def __init__(self, path, autosync=True):
+        """
+        :param path: the path of the ini file.
+        :type path: str
+        :param autosync: whether each change is written right away. If not,
+                         the changes are kept until sync() is called, like
+                         QSettings does.
+        :type autosync: bool
+        """
+        self._path = path
+        self._autosync = autosync
+        self._lock = Lock()
+
+        # changes not written yet: [(section, option, raw value or None)]
+        self._pending = []
+
+    def _parse(self):
+        """
+        Parse the settings file.
+
+        :rtype: ConfigParser.RawConfigParser
+        """
+        parser = ConfigParser.RawConfigParser()
+        # keys are case sensitive for QSettings
+        parser.optionxform = str
+        try:
+            parser.read(self._path)
+        except ConfigParser.Error as e:
+            logger.error("Could not parse %s: %r" % (self._path, e))
+        return parser
+
+    def _read(self):
+        """
+        Read the settings, with the changes not written yet.
+
+        :rtype: ConfigParser.RawConfigParser
+        """
+        parser = self._parse()
+        self._apply(parser, self._pending)
+        return parser
+
+    def _apply(self, parser, changes):
+        """
+        Apply changes to the parsed settings.
+
+        :param parser: the settings.
+        :type parser: ConfigParser.RawConfigParser
+        :param changes: the changes, a None value removes the option.
+        :type changes: list of (str, str, str or None)
+
+        :returns: whether the settings changed.
+        :rtype: bool
+        """
+        changed = False
+        for section, option, raw in changes:
+            if raw is not None:
+                if not parser.has_section(section):
+                    parser.add_section(section)
+                parser.set(section, option, raw)
+                changed = True
+            elif parser.has_option(section, option):
+                parser.remove_option(section, option)
+                if not parser.items(section):
+                    parser.remove_section(section)
+                changed = True
+        return changed
+
+    def _write(self, parser):
+        """
+        Write the settings file, replacing it atomically.
+
+        :param parser: the settings to write.
+        :type parser: ConfigParser.RawConfigParser
+        """
+        directory = os.path.dirname(self._path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".leap.conf")
+        try:
+            with os.fdopen(fd, "w") as f:
+                parser.write(f)
+            os.rename(tmp_path, self._path)
+        except (IOError, OSError) as e:
+            logger.error("Could not write %s: %r" % (self._path, e))
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+    def _change(self, section, option, raw):
+        """
+        Record a change, and write it if autosync is on.
+        """
+        with self._lock:
+            self._pending.append((section, option, raw))
+        if self._autosync:
+            self.sync()
+
+    def value(self, key, default=None):
+        """
+        Return the value for a key, or `default` if it's not set.
+
+        :param key: the key, like "Group/Key" or just "Key".
+        :type key: str
+        """
+        section, option = _split_key(key)
+        with self._lock:
+            parser = self._read()
+        if not parser.has_option(section, option):
+            return default
+
+        value = _parse_value(parser.get(section, option))
+        if value is None:
+            return default
+        return value
+
+    def allKeys(self):
+        """
+        Return all the keys that have a value.
+
+        :rtype: list of str
+        """
+        with self._lock:
+            parser = self._read()
+
+        keys = []
+        for section in parser.sections():
+            for option in parser.options(section):
+                if section == GENERAL_SECTION:
+                    keys.append(option)
+                else:
+                    keys.append("%s/%s" % (section, option))
+        return keys
+
+    def setValue(self, key, value):
+        """
+        Set the value for a key.
+
+        :param key: the key, like "Group/Key" or just "Key".
+        :type key: str
+        :param value: the value to save.
+        :type value: bool, str, unicode or list
+        """
+        section, option = _split_key(key)
+        self._change(section, option, _format_value(value))
+
+    def remove(self, key):
+        """
+        Remove a key.
+
+        :param key: the key, like "Group/Key" or just "Key".
+        :type key: str
+        """
+        section, option = _split_key(key)
+        self._change(section, option, None)
+
+    def sync(self):
+        """
+        Write the pending changes, with a single write.
+        """
+        with self._lock:
+            if not self._pending:
+                return
+            changes, self._pending = self._pending, []
+
+            # read it again, the GUI may have changed it in the meantime.
+            parser = self._parse()
+            if self._apply(parser, changes):
+                self._write(parser)
@@ -20,39 +20,36 @@ QSettings abstraction.
 import os
 import logging
 
-from PySide import QtCore
-
 from leap.common.check import leap_assert, leap_assert_type
+from leap.bitmask.config import flags, providerindex
+from leap.bitmask.config.inisettings import IniSettings
+from leap.bitmask.config.settingsstore import get_store
 from leap.bitmask.util import get_path_prefix
+from leap.bitmask.util.constants import PROVIDER_VERIFIED_TTL
 
 logger = logging.getLogger(__name__)
 
 
-def to_bool(val):
+def _open_settings(path):
     """
-    Returns the boolean value corresponding to val. Will return False
-    in case val is not a string or something that behaves like one.
-
-    :param val: value to cast
-    :type val: either bool already or str
+    Return the QSettings for the settings file, or a plain python
+    replacement in headless mode.
 
-    :rtype: bool
+    :param path: the path of the settings file.
+    :type path: str
     """
-    if isinstance(val, bool):
-        return val
+    if flags.HEADLESS:
+        return IniSettings(path, autosync=False)
 
-    bool_val = False
-    try:
-        bool_val = val.lower() == "true"
-    except:
-        pass
-
-    return bool_val
+    from PySide import QtCore
+    return QtCore.QSettings(path, QtCore.QSettings.IniFormat)
 
 
 class LeapSettings(object):
     """
     Leap client QSettings wrapper
+
+    All the instances share the same in-memory settings, see settingsstore.
     """
 
     CONFIG_NAME = "leap.conf"
@@ -69,6 +66,7 @@ class LeapSettings(object):
     GATEWAY_KEY = "Gateway"
     PINNED_KEY = "Pinned"
     SKIPFIRSTRUN_KEY = "SkipFirstRun"
+    PROVIDERVERIFIEDTTL_KEY = "ProviderVerifiedTTL"
     UUIDFORUSER_KEY = "%s/%s_uuid"
 
     # values
@@ -77,9 +75,32 @@ class LeapSettings(object):
     def __init__(self):
         settings_path = os.path.join(get_path_prefix(),
                                      "leap", self.CONFIG_NAME)
+        self._settings = get_store(settings_path, _open_settings)
+
+    def connect(self, callback):
+        """
+        Call `callback(key, value)` each time a setting changes, value is
+        None if it was removed.
+
+        :param callback: the function to call.
+        :type callback: callable
+        """
+        self._settings.connect(callback)
+
+    def disconnect(self, callback):
+        """
+        Stop calling `callback` on the changes.
 
-        self._settings = QtCore.QSettings(settings_path,
-                                          QtCore.QSettings.IniFormat)
+        :param callback: a function given to connect.
+        :type callback: callable
+        """
+        self._settings.disconnect(callback)
+
+    def flush(self):
+        """
+        Write the pending changes now instead of in a moment.
+        """
+        self._settings.flush()
 
     def get_geometry(self):
         """
@@ -122,20 +143,13 @@ class LeapSettings(object):
         Returns the configured providers based on the file structure in the
         settings directory.
 
+        The providers come from the providers index, see
+        leap.bitmask.config.providerindex. Whether each one has a valid
+        certificate, and its services, are in its ProviderInfo.
+
         :rtype: list of str
         """
-        # TODO: check which providers have a valid certificate among
-        # other things, not just the directories
-        providers = []
-        try:
-            providers_path = os.path.join(get_path_prefix(),
-                                          "leap", "providers")
-            providers = os.listdir(providers_path)
-        except Exception as e:
-            logger.debug("Error listing providers, assume there are none. %r"
-                         % (e,))
-
-        return providers
+        return providerindex.get_index().get_providers()
 
     def is_pinned_provider(self, domain):
         """
@@ -149,9 +163,7 @@ class LeapSettings(object):
         """
         leap_assert(len(domain) > 0, "We need a nonempty domain.")
         pinned_key = "{0}/{1}".format(domain, self.PINNED_KEY)
-        result = to_bool(self._settings.value(pinned_key, False))
-
-        return result
+        return self._settings.get_bool(pinned_key, False)
 
     def get_selected_gateway(self, provider):
         """
@@ -196,12 +208,7 @@ class LeapSettings(object):
         """
 
         leap_assert(len(provider) > 0, "We need a nonempty provider")
-        enabled_services = self._settings.value("%s/Services" % (provider,),
-                                                [])
-        if isinstance(enabled_services, (str, unicode)):
-            enabled_services = enabled_services.split(",")
-
-        return enabled_services
+        return self._settings.get_list("%s/Services" % (provider,))
 
     def set_enabled_services(self, provider, services):
         """
@@ -266,7 +273,7 @@ class LeapSettings(object):
 
         :rtype: bool
         """
-        return to_bool(self._settings.value(self.REMEMBER_KEY, False))
+        return self._settings.get_bool(self.REMEMBER_KEY, False)
 
     def set_remember(self, remember):
         """
@@ -305,7 +312,7 @@ class LeapSettings(object):
 
         :rtype: bool
         """
-        return to_bool(self._settings.value(self.AUTOSTARTEIP_KEY, False))
+        return self._settings.get_bool(self.AUTOSTARTEIP_KEY, False)
 
     def set_autostart_eip(self, autostart):
         """
@@ -323,7 +330,7 @@ class LeapSettings(object):
 
         :rtype: bool
         """
-        return to_bool(self._settings.value(self.ALERTMISSING_KEY, True))
+        return self._settings.get_bool(self.ALERTMISSING_KEY, True)
 
     def set_alert_missing_scripts(self, value):
         """
@@ -342,7 +349,7 @@ class LeapSettings(object):
         :returns: if the first run wizard should be skipped or not
         :rtype: bool
         """
-        return to_bool(self._settings.value(self.SKIPFIRSTRUN_KEY, False))
+        return self._settings.get_bool(self.SKIPFIRSTRUN_KEY, False)
 
     def set_skip_first_run(self, skip):
         """
@@ -354,6 +361,33 @@ class LeapSettings(object):
         leap_assert_type(skip, bool)
         self._settings.setValue(self.SKIPFIRSTRUN_KEY, skip)
 
+    def get_provider_verified_ttl(self):
+        """
+        Gets the seconds a provider that passed the setup checks is trusted
+        without checking it again. 0 runs the checks on every login.
+
+        :rtype: int
+        """
+        value = self._settings.value(self.PROVIDERVERIFIEDTTL_KEY,
+                                     PROVIDER_VERIFIED_TTL)
+        try:
+            return max(0, int(value))
+        except (TypeError, ValueError):
+            logger.warning("Wrong %s %r, using the default."
+                           % (self.PROVIDERVERIFIEDTTL_KEY, value))
+            return PROVIDER_VERIFIED_TTL
+
+    def set_provider_verified_ttl(self, ttl):
+        """
+        Sets the seconds a provider that passed the setup checks is trusted
+        without checking it again.
+
+        :param ttl: the seconds, 0 to run the checks on every login.
+        :type ttl: int
+        """
+        leap_assert_type(ttl, int)
+        self._settings.setValue(self.PROVIDERVERIFIEDTTL_KEY, ttl)
+
     def get_uuid(self, username):
         """
         Gets the uuid for a given username.
@@ -22,11 +22,13 @@ import logging
 import os
 
 from leap.bitmask import provider
+from leap.bitmask.config import configcache
 from leap.bitmask.config.provider_spec import leap_provider_spec
+from leap.bitmask.config.validatedconfig import ValidatedConfig
 from leap.bitmask.services import get_service_display_name
 from leap.bitmask.util import get_path_prefix
 from leap.common.check import leap_check
-from leap.common.config.baseconfig import BaseConfig, LocalizedKey
+from leap.common.config.baseconfig import LocalizedKey
 
 logger = logging.getLogger(__name__)
 
@@ -67,12 +69,12 @@ class ProviderConfigLight(object):
         return services_str
 
 
-class ProviderConfig(BaseConfig):
+class ProviderConfig(ValidatedConfig):
     """
     Provider configuration abstraction class
     """
     def __init__(self):
-        BaseConfig.__init__(self)
+        ValidatedConfig.__init__(self)
 
     def get_light_config(self, domain, lang=None):
         """
@@ -102,16 +104,16 @@ class ProviderConfig(BaseConfig):
         """
         Helper to return a valid Provider Config from the domain name.
 
+        The config is shared with the other callers and reloaded only when
+        the file changes, see configcache.
+
         :param domain: the domain name of the provider.
         :type domain: str
 
         :rtype: ProviderConfig or None if there is a problem loading the config
         """
-        provider_config = ProviderConfig()
-        if not provider_config.load(provider.get_provider_path(domain)):
-            provider_config = None
-
-        return provider_config
+        return configcache.load(ProviderConfig,
+                                provider.get_provider_path(domain))
 
     def _get_schema(self):
         """
@@ -0,0 +1,521 @@
+# -*- coding: utf-8 -*-
+# providerindex.py
+# Copyright (C) 2014 LEAP
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Persistent index of the configured providers.
+
+Each provider is described by a ProviderInfo: whether it's usable, its
+services, the expiry of its CA cert and the mtimes of its config files. The
+index is saved next to the providers directory, and at startup the saved
+snapshot is loaded and checked against the providers directory in a
+background thread, reading again only the providers whose files changed.
+After that the index is kept up to date one provider at a time:
+
+    - on Linux, inotify reports the changes in the providers directory and
+      the provider is read again in a thread, out of the reactor thread.
+    - the bootstrappers refresh the providers they write to, which also
+      covers the platforms without inotify.
+
+Listing the providers is then a lookup in memory, or a read of the saved
+snapshot if the GUI asks before the background thread loaded it.
+"""
+import calendar
+import json
+import logging
+import os
+import time
+
+from threading import Lock, Thread
+
+from leap.bitmask.platform_init import IS_WIN
+from leap.bitmask.util import get_path_prefix
+from leap.common import certs as leap_certs
+
+logger = logging.getLogger(__name__)
+
+# The files of a provider that are tracked, relative to its directory.
+PROVIDER_JSON = "provider.json"
+EIP_SERVICE_JSON = "eip-service.json"
+CA_CERT = os.path.join("keys", "ca", "cacert.pem")
+TRACKED_FILES = (
+    PROVIDER_JSON,
+    EIP_SERVICE_JSON,
+    "smtp-service.json",
+    "soledad-service.json",
+    CA_CERT,
+)
+
+# The snapshot of the index, next to the providers directory.
+INDEX_FILE = "providers-index.json"
+INDEX_VERSION = 1
+
+
+def get_providers_path():
+    """
+    Return the absolute path of the providers directory.
+
+    :rtype: str
+    """
+    return os.path.join(get_path_prefix(), "leap", "providers")
+
+
+def get_index_path(providers_path):
+    """
+    Return the absolute path of the snapshot of the index of a providers
+    directory.
+
+    :param providers_path: the absolute path of the providers directory.
+    :type providers_path: str
+
+    :rtype: str
+    """
+    return os.path.join(os.path.dirname(providers_path.rstrip(os.sep)),
+                        INDEX_FILE)
+
+
+class ProviderInfo(object):
+    """
+    What the index knows about a configured provider.
+    """
+
+    def __init__(self, domain, services=None, cert_expiry=None, mtimes=None,
+                 config_loaded=False):
+        """
+        :param domain: the domain of the provider.
+        :type domain: str
+        :param services: the services of the provider.
+        :type services: list of str
+        :param cert_expiry: the expiry of the CA cert, in seconds since the
+                            epoch, or None if there is no valid cert.
+        :type cert_expiry: float or None
+        :param mtimes: the mtime of each tracked file that exists.
+        :type mtimes: dict
+        :param config_loaded: whether the provider.json could be loaded.
+        :type config_loaded: bool
+        """
+        self.domain = domain
+        self.services = services or []
+        self.cert_expiry = cert_expiry
+        self.mtimes = mtimes or {}
+        self.config_loaded = config_loaded
+
+    def is_valid(self, now=None):
+        """
+        Return whether the provider can be used: it has a valid provider.json
+        and a CA cert that didn't expire.
+
+        :param now: the current time, in seconds since the epoch.
+        :type now: float or None
+
+        :rtype: bool
+        """
+        if now is None:
+            now = time.time()
+        return (self.config_loaded and self.cert_expiry is not None and
+                self.cert_expiry > now)
+
+    def is_initialized(self):
+        """
+        Return whether the EIP config of the provider was downloaded.
+
+        :rtype: bool
+        """
+        return EIP_SERVICE_JSON in self.mtimes
+
+    def to_dict(self):
+        """
+        Return the info as a dict that can be saved as json.
+
+        :rtype: dict
+        """
+        return {
+            "services": self.services,
+            "cert_expiry": self.cert_expiry,
+            "mtimes": self.mtimes,
+            "config_loaded": self.config_loaded,
+        }
+
+    @classmethod
+    def from_dict(cls, domain, data):
+        """
+        Return the info of `domain` saved with to_dict.
+
+        :rtype: ProviderInfo
+        """
+        return cls(domain, services=data.get("services"),
+                   cert_expiry=data.get("cert_expiry"),
+                   mtimes=data.get("mtimes"),
+                   config_loaded=data.get("config_loaded", False))
+
+    def __eq__(self, other):
+        return (isinstance(other, ProviderInfo) and
+                self.domain == other.domain and
+                self.to_dict() == other.to_dict())
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return "<ProviderInfo %s services=%r cert_expiry=%r>" % (
+            self.domain, self.services, self.cert_expiry)
+
+
+def read_provider(providers_path, domain, previous=None):
+    """
+    Read what the index keeps about the provider `domain` from its files.
+
+    :param providers_path: the absolute path of the providers directory.
+    :type providers_path: str
+    :param domain: the domain of the provider.
+    :type domain: str
+    :param previous: the info read before, returned as it is if none of the
+                     tracked files changed since.
+    :type previous: ProviderInfo or None
+
+    :returns: the provider info, or None if the provider is not configured.
+    :rtype: ProviderInfo or None
+    """
+    # imported here, providerconfig imports leapsettings, that imports this.
+    from leap.bitmask.config import configcache
+    from leap.bitmask.config.providerconfig import ProviderConfig
+
+    provider_dir = os.path.join(providers_path, domain)
+    if not os.path.isdir(provider_dir):
+        return None
+
+    mtimes = {}
+    for name in TRACKED_FILES:
+        try:
+            mtimes[name] = os.stat(os.path.join(provider_dir, name)).st_mtime
+        except OSError:
+            pass
+
+    if previous is not None and previous.mtimes == mtimes:
+        return previous
+
+    info = ProviderInfo(domain, mtimes=mtimes)
+    if PROVIDER_JSON in mtimes:
+        config = configcache.load(ProviderConfig,
+                                  os.path.join(provider_dir, PROVIDER_JSON))
+        if config is not None:
+            info.config_loaded = True
+            info.services = config.get_services() or []
+
+    if CA_CERT in mtimes:
+        try:
+            with open(os.path.join(provider_dir, CA_CERT)) as f:
+                _, to = leap_certs.get_cert_time_boundaries(f.read())
+            info.cert_expiry = calendar.timegm(to)
+        except Exception as e:
+            logger.warning("Can't read the CA cert of %s: %r" % (domain, e))
+
+    return info
+
+
+class ProviderIndex(object):
+    """
+    Thread safe index of the providers in a providers directory.
+    """
+
+    def __init__(self, providers_path, index_path=None):
+        """
+        :param providers_path: the absolute path of the providers directory.
+        :type providers_path: str
+        :param index_path: the absolute path of the snapshot of the index,
+                           next to the providers directory by default.
+        :type index_path: str or None
+        """
+        self._path = providers_path
+        self._index_path = index_path or get_index_path(providers_path)
+        # {domain: ProviderInfo}, None until the snapshot is loaded
+        self._providers = None
+        self._scanned = False
+        self._lock = Lock()
+        # the scan and the refreshes write the index one at a time
+        self._write_lock = Lock()
+        self._notifier = None
+        # domains with a refresh on the way, a write is several events
+        self._queued = set()
+        self.scans = 0
+        self.refreshes = 0
+
+    def _load_snapshot(self):
+        """
+        Read the saved snapshot of the index.
+
+        :returns: the saved providers, or None if there is no snapshot.
+        :rtype: dict or None
+        """
+        try:
+            with open(self._index_path) as f:
+                data = json.load(f)
+        except IOError:
+            return None
+        except ValueError as e:
+            logger.warning("Can't read the providers index, it will be "
+                           "rebuilt. %r" % (e,))
+            return None
+        if data.get("version") != INDEX_VERSION:
+            return None
+        providers = {}
+        for domain, info in data.get("providers", {}).items():
+            providers[domain] = ProviderInfo.from_dict(domain, info)
+        return providers
+
+    def _save_snapshot(self, providers):
+        """
+        Replace the saved snapshot of the index atomically.
+
+        Must be called with the write lock held.
+        """
+        data = {
+            "version": INDEX_VERSION,
+            "providers": dict((domain, info.to_dict())
+                              for domain, info in providers.items()),
+        }
+        tmp_path = self._index_path + ".tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(data, f, indent=2, sort_keys=True)
+            if IS_WIN and os.path.exists(self._index_path):
+                # windows can't rename over an existing file.
+                os.remove(self._index_path)
+            os.rename(tmp_path, self._index_path)
+        except (IOError, OSError) as e:
+            logger.error("Could not save the providers index: %r" % (e,))
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+    def _get_providers(self):
+        """
+        Return the providers in memory, loading the saved snapshot the
+        first time. Without a snapshot, the first time the index is used,
+        the providers directory has to be scanned.
+
+        :rtype: dict
+        """
+        # the dict is replaced on every change, never modified.
+        with self._lock:
+            if self._providers is not None:
+                return self._providers
+            providers = self._load_snapshot()
+            if providers is not None:
+                self._providers = providers
+                return providers
+        self.scan()
+        with self._lock:
+            return self._providers
+
+    def scan(self):
+        """
+        Check the index against the providers directory, the first time
+        only, and save it. Only the providers whose files changed since the
+        snapshot was saved are read again.
+        """
+        with self._write_lock:
+            if self._scanned:
+                return
+            with self._lock:
+                previous = self._providers
+            if previous is None:
+                previous = self._load_snapshot() or {}
+
+            providers = {}
+            try:
+                domains = os.listdir(self._path)
+            except Exception as e:
+                logger.debug("Error listing providers, assume there are "
+                             "none. %r" % (e,))
+                domains = []
+            for domain in domains:
+                info = read_provider(self._path, domain,
+                                     previous.get(domain))
+                if info is not None:
+                    providers[domain] = info
+
+            with self._lock:
+                self._providers = providers
+                self._scanned = True
+                self.scans += 1
+            if providers != previous:
+                self._save_snapshot(providers)
+
+    def _scan_in_background(self):
+        """
+        Load the snapshot, so it's ready when the GUI asks, then scan.
+        """
+        self._get_providers()
+        self.scan()
+
+    def scan_in_background(self):
+        """
+        Do the first scan in a thread, so the index is ready when the GUI
+        asks.
+        """
+        thread = Thread(target=self._scan_in_background,
+                        name="ProviderIndexScan")
+        thread.daemon = True
+        thread.start()
+
+    def get_providers(self):
+        """
+        Return the domains of the configured providers.
+
+        :rtype: list of str
+        """
+        return sorted(self._get_providers())
+
+    def get_info(self, domain):
+        """
+        Return what the index knows about the provider `domain`.
+
+        :param domain: the domain of the provider.
+        :type domain: str
+
+        :rtype: ProviderInfo or None
+        """
+        return self._get_providers().get(domain)
+
+    def refresh(self, domain):
+        """
+        Read the provider `domain` again, after its files changed.
+
+        :param domain: the domain of the provider.
+        :type domain: str
+        """
+        self._get_providers()
+        with self._write_lock:
+            with self._lock:
+                previous = self._providers.get(domain)
+            info = read_provider(self._path, domain, previous)
+            with self._lock:
+                self.refreshes += 1
+                providers = dict(self._providers)
+                if info is None:
+                    providers.pop(domain, None)
+                else:
+                    providers[domain] = info
+                self._providers = providers
+            if info != previous:
+                self._save_snapshot(providers)
+
+    def watch(self):
+        """
+        Refresh the index on the changes in the providers directory, with
+        inotify. Does nothing where inotify is not available.
+
+        Must be called from the reactor thread.
+        """
+        if self._notifier is not None:
+            return
+        try:
+            from twisted.internet import inotify
+            from twisted.python import filepath
+        except ImportError:
+            logger.debug("No inotify, the providers index will only be "
+                         "refreshed by the bootstrappers.")
+            return
+
+        if not os.path.isdir(self._path):
+            # the first bootstrap creates it, and refreshes the index.
+            return
+
+        mask = (inotify.IN_CREATE | inotify.IN_DELETE |
+                inotify.IN_MOVED_FROM | inotify.IN_MOVED_TO |
+                inotify.IN_DELETE_SELF | inotify.IN_CLOSE_WRITE)
+        try:
+            notifier = inotify.INotify()
+            notifier.startReading()
+            notifier.watch(filepath.FilePath(self._path), mask=mask,
+                           autoAdd=True, recursive=True,
+                           callbacks=[self._on_change])
+        except Exception as e:
+            logger.warning("Can't watch the providers directory: %r" % (e,))
+            return
+        self._notifier = notifier
+
+    def stop_watching(self):
+        """
+        Stop the inotify watch, if any.
+        """
+        if self._notifier is not None:
+            self._notifier.loseConnection()
+            self._notifier = None
+
+    def _on_change(self, ignored, path, mask):
+        """
+        Called by inotify, in the reactor thread, for a change under the
+        providers directory.
+        """
+        # imported here, importing the reactor must wait for qtreactor.
+        from leap.bitmask.util import threadpools
+
+        relative = os.path.relpath(path.path, self._path)
+        domain = relative.split(os.sep)[0]
+        if domain in (os.curdir, os.pardir):
+            return
+        with self._lock:
+            if domain in self._queued:
+                return
+            self._queued.add(domain)
+        d = threadpools.defer_to_pool(threadpools.PROVIDER,
+                                      self._refresh_queued, domain)
+        d.addErrback(lambda failure: logger.error(
+            "Error refreshing provider %s: %r" % (domain, failure)))
+
+    def _refresh_queued(self, domain):
+        """
+        Refresh a provider queued by _on_change.
+        """
+        with self._lock:
+            self._queued.discard(domain)
+        self.refresh(domain)
+
+
+_indexes = {}
+_indexes_lock = Lock()
+
+
+def get_index(providers_path=None):
+    """
+    Return the index for a providers directory, creating it the first time.
+
+    :param providers_path: the absolute path of the providers directory, by
+                           default the one of this installation.
+    :type providers_path: str or None
+
+    :rtype: ProviderIndex
+    """
+    if providers_path is None:
+        providers_path = get_providers_path()
+    with _indexes_lock:
+        index = _indexes.get(providers_path)
+        if index is None:
+            index = ProviderIndex(providers_path)
+            _indexes[providers_path] = index
+        return index
+
+
+def refresh(domain):
+    """
+    Refresh the provider `domain` in the index of this installation, after
+    writing its files. See ProviderIndex.refresh.
+    """
+    index = get_index()
+    index.refresh(domain)
+    # the first provider creates the providers directory, watch it now.
+    from twisted.internet import reactor
+    reactor.callFromThread(index.watch)
@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+# settingsstore.py
+# Copyright (C) 2014 LEAP
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Shared in-memory store for the settings file.
+
+Every LeapSettings of the process uses the same store. The file is read
+once, the reads are served from memory, and the changes are written back
+together a short time after the first one, so a burst of changes is a
+single write. Whatever is still pending is written at exit.
+
+The changes written are only the keys that changed, over the current file,
+so changes made by another process to other keys are kept. Changes made by
+another process after the file was read are not seen until the next start.
+"""
+import atexit
+import logging
+
+from threading import Lock, Timer
+
+logger = logging.getLogger(__name__)
+
+# marks a removed key in the pending changes
+_REMOVED = object()
+
+
+def to_bool(val):
+    """
+    Returns the boolean value corresponding to val. Will return False
+    in case val is not a string or something that behaves like one.
+
+    :param val: value to cast
+    :type val: either bool already or str
+
+    :rtype: bool
+    """
+    if isinstance(val, bool):
+        return val
+
+    bool_val = False
+    try:
+        bool_val = val.lower() == "true"
+    except:
+        pass
+
+    return bool_val
+
+
+class SettingsStore(object):
+    """
+    Thread safe, in-memory copy of a settings file, with delayed writes.
+    """
+
+    # Seconds to wait for more changes before writing.
+    WRITE_DELAY = 0.5
+
+    def __init__(self, path, opener, write_delay=WRITE_DELAY):
+        """
+        :param path: the path of the settings file.
+        :type path: str
+        :param opener: returns a QSettings-like object for a path, with
+                       value, allKeys, setValue, remove and sync.
+        :type opener: callable
+        :param write_delay: seconds to wait for more changes before writing.
+        :type write_delay: float
+        """
+        self._path = path
+        self._opener = opener
+        self._write_delay = write_delay
+        self._lock = Lock()
+        self._write_lock = Lock()
+        self._values = None
+        self._pending = {}
+        self._timer = None
+        self._callbacks = []
+        self.writes = 0
+
+    def _load(self):
+        """
+        Read the file, the first time only.
+
+        Must be called with the lock held.
+        """
+        if self._values is None:
+            settings = self._opener(self._path)
+            self._values = dict((key, settings.value(key))
+                                for key in settings.allKeys())
+
+    def value(self, key, default=None):
+        """
+        Return the value for a key, or `default` if it's not set.
+
+        :param key: the key, like "Group/Key" or just "Key".
+        :type key: str
+        """
+        with self._lock:
+            self._load()
+            value = self._values.get(key)
+        if value is None:
+            return default
+        return value
+
+    def get_bool(self, key, default=False):
+        """
+        Return the value for a key as a boolean.
+
+        :param key: the key, like "Group/Key" or just "Key".
+        :type key: str
+        :param default: the value if the key is not set.
+        :type default: bool
+
+        :rtype: bool
+        """
+        return to_bool(self.value(key, default))
+
+    def get_list(self, key, default=None):
+        """
+        Return the value for a key as a list. A list with one item is
+        saved as a plain value, and that item may have commas.
+
+        :param key: the key, like "Group/Key" or just "Key".
+        :type key: str
+        :param default: the value if the key is not set.
+        :type default: list
+
+        :rtype: list
+        """
+        value = self.value(key, default if default is not None else [])
+        if isinstance(value, basestring):
+            value = value.split(",")
+        return list(value)
+
+    def setValue(self, key, value):
+        """
+        Set the value for a key, it'll be written in a moment.
+
+        :param key: the key, like "Group/Key" or just "Key".
+        :type key: str
+        :param value: the value to save.
+        :type value: object
+        """
+        self._change(key, value)
+
+    def remove(self, key):
+        """
+        Remove a key, it'll be written in a moment.
+
+        :param key: the key, like "Group/Key" or just "Key".
+        :type key: str
+        """
+        self._change(key, _REMOVED)
+
+    def _change(self, key, value):
+        """
+        Apply a change in memory, schedule the write and notify.
+        """
+        with self._lock:
+            self._load()
+            if value is _REMOVED:
+                if key not in self._values:
+                    return
+                del self._values[key]
+            else:
+                if self._values.get(key) == value:
+                    return
+                self._values[key] = value
+
+            self._pending[key] = value
+            if self._timer is None:
+                self._timer = Timer(self._write_delay, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+            callbacks = list(self._callbacks)
+
+        notified = None if value is _REMOVED else value
+        for callback in callbacks:
+            try:
+                callback(key, notified)
+            except Exception as e:
+                logger.error("Error notifying a settings change: %r" % (e,))
+
+    def flush(self):
+        """
+        Write the pending changes now, with a single write.
+        """
+        # the writes go one at a time, but the reads don't wait for them.
+        with self._write_lock:
+            with self._lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                if not self._pending:
+                    return
+                changes, self._pending = self._pending, {}
+
+            try:
+                settings = self._opener(self._path)
+                for key, value in changes.items():
+                    if value is _REMOVED:
+                        settings.remove(key)
+                    else:
+                        settings.setValue(key, value)
+                settings.sync()
+                self.writes += 1
+            except Exception as e:
+                logger.error("Could not write the settings: %r" % (e,))
+
+    def connect(self, callback):
+        """
+        Call `callback(key, value)` on each change, value is None if the key
+        was removed. It's called in the thread that made the change.
+
+        :param callback: the function to call.
+        :type callback: callable
+        """
+        with self._lock:
+            self._callbacks.append(callback)
+
+    def disconnect(self, callback):
+        """
+        Stop calling `callback` on the changes.
+
+        :param callback: a function given to connect.
+        :type callback: callable
+        """
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+
+_stores = {}
+_stores_lock = Lock()
+
+
+def get_store(path, opener):
+    """
+    Return the store for the settings file at `path`, creating it the first
+    time.
+
+    :param path: the path of the settings file.
+    :type path: str
+    :param opener: returns a QSettings-like object for a path, used only if
+                   the store is created.
+    :type opener: callable
+
+    :rtype: SettingsStore
+    """
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = SettingsStore(path, opener)
+            _stores[path] = store
+            atexit.register(store.flush)
+        return store
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+# test_configcache.py
+# Copyright (C) 2014 LEAP
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Tests for the config cache
+"""
+import os
+import shutil
+import tempfile
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+import mock
+
+from leap.bitmask.config import configcache
+from leap.bitmask.services.mail.smtpconfig import SMTPConfig
+from leap.common.testing.basetest import BaseLeapTest
+
+CONFIG_PATH = os.path.join("leap", "providers", "example.org", "conf.json")
+
+
+class FakeConfig(object):
+    """
+    Stands for a BaseConfig, counts the loads.
+    """
+    loads = 0
+    prefix = None
+
+    def __init__(self):
+        self.api_version = None
+
+    def set_api_version(self, version):
+        self.api_version = version
+
+    def load(self, path):
+        FakeConfig.loads += 1
+        return os.path.isfile(os.path.join(FakeConfig.prefix, path))
+
+
+class ConfigCacheTestCase(BaseLeapTest):
+    """
+    Tests for the ConfigCache class.
+    """
+
+    def setUp(self):
+        self.prefix = tempfile.mkdtemp()
+        FakeConfig.prefix = self.prefix
+        FakeConfig.loads = 0
+
+        patch = mock.patch.object(configcache, "get_path_prefix",
+                                  return_value=self.prefix)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+        self.path = os.path.join(self.prefix, CONFIG_PATH)
+        os.makedirs(os.path.dirname(self.path))
+        self._write("{}")
+        self.cache = configcache.ConfigCache()
+
+    def tearDown(self):
+        shutil.rmtree(self.prefix)
+
+    def _write(self, content):
+        with open(self.path, "w") as f:
+            f.write(content)
+
+    def test_loaded_once_while_unchanged(self):
+        first = self.cache.load(FakeConfig, CONFIG_PATH, "1")
+        second = self.cache.load(FakeConfig, CONFIG_PATH, "1")
+        self.assertIs(first, second)
+        self.assertEqual(first.api_version, "1")
+        self.assertEqual(FakeConfig.loads, 1)
+
+    def test_api_version_is_part_of_the_key(self):
+        self.cache.load(FakeConfig, CONFIG_PATH, "1")
+        config = self.cache.load(FakeConfig, CONFIG_PATH, "2")
+        self.assertEqual(config.api_version, "2")
+        self.assertEqual(FakeConfig.loads, 2)
+
+    def test_changed_file_reloads(self):
+        self.cache.load(FakeConfig, CONFIG_PATH)
+        self._write('{"changed": true}')
+        self.cache.load(FakeConfig, CONFIG_PATH)
+        self.assertEqual(FakeConfig.loads, 2)
+
+    def test_invalidate(self):
+        self.cache.load(FakeConfig, CONFIG_PATH)
+        self.cache.invalidate(CONFIG_PATH)
+        self.cache.load(FakeConfig, CONFIG_PATH)
+        self.assertEqual(FakeConfig.loads, 2)
+
+    def test_failures_are_not_cached(self):
+        os.remove(self.path)
+        self.assertIsNone(self.cache.load(FakeConfig, CONFIG_PATH))
+        self._write("{}")
+        self.assertIsNotNone(self.cache.load(FakeConfig, CONFIG_PATH))
+
+    def test_put_shares_the_loaded_config(self):
+        content = ('{"serial": 1, "version": 1, "locations": {}, '
+                   '"hosts": {"walrus": {"hostname": "smtp.example.org", '
+                   '"ip_address": "1.2.3.4", "port": 465}}}')
+        self._write(content)
+        config = SMTPConfig()
+        config.set_api_version("1")
+        self.assertTrue(config.load(data=content))
+        self.cache.put(SMTPConfig, CONFIG_PATH, config, "1")
+
+        with mock.patch.object(SMTPConfig, "load") as load:
+            cached = self.cache.load(SMTPConfig, CONFIG_PATH, "1")
+            self.assertFalse(load.called)
+        self.assertIsNot(cached, config)
+        self.assertEqual(cached.get_hosts(), config.get_hosts())
+
+        # a config that didn't load is not cached
+        self.cache.put(SMTPConfig, CONFIG_PATH, SMTPConfig(), "1")
+        self.assertEqual(self.cache.hits, 1)
+        with mock.patch.object(SMTPConfig, "load", return_value=False):
+            self.assertIsNone(self.cache.load(SMTPConfig, CONFIG_PATH, "1"))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+# test_inisettings.py
+# Copyright (C) 2014 LEAP
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Tests for inisettings module.
+"""
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+import os
+import shutil
+import tempfile
+
+from leap.common.testing.basetest import BaseLeapTest
+from leap.bitmask.config.inisettings import IniSettings
+
+# As written by QSettings with IniFormat
+QSETTINGS_INI = """[General]
+RememberUserAndPass=true
+DefaultProvider=demo.bitmask.net
+Geometry=@ByteArray(\\x1\\xd9\\xd0\\xcb)
+
+[demo.bitmask.net]
+Services=openvpn, mx
+Gateway=Automatic
+test_uuid=0123456789abcdef
+"""
+
+
+class IniSettingsTest(BaseLeapTest):
+    """Tests for IniSettings"""
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self._path = os.path.join(self._dir, "leap.conf")
+        with open(self._path, "w") as f:
+            f.write(QSETTINGS_INI)
+        self.settings = IniSettings(self._path)
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def test_read_qsettings_values(self):
+        self.assertEqual(self.settings.value("RememberUserAndPass"), "true")
+        self.assertEqual(self.settings.value("DefaultProvider"),
+                         "demo.bitmask.net")
+        self.assertEqual(self.settings.value("demo.bitmask.net/Services"),
+                         ["openvpn", "mx"])
+        self.assertEqual(self.settings.value("demo.bitmask.net/test_uuid"),
+                         "0123456789abcdef")
+
+    def test_default(self):
+        self.assertIsNone(self.settings.value("User"))
+        self.assertEqual(self.settings.value("other.net/Gateway", "x"), "x")
+
+    def test_set_value(self):
+        self.settings.setValue("other.net/Gateway", u"gw1.other.net")
+        self.settings.setValue("AutoStartEIP", True)
+        self.settings.setValue("other.net/Services", ["openvpn"])
+
+        settings = IniSettings(self._path)
+        self.assertEqual(settings.value("other.net/Gateway"),
+                         "gw1.other.net")
+        self.assertEqual(settings.value("AutoStartEIP"), "true")
+        self.assertEqual(settings.value("other.net/Services"), "openvpn")
+
+    def test_values_with_commas_are_quoted(self):
+        self.settings.setValue("User", u"a, b")
+        self.assertEqual(self.settings.value("User"), "a, b")
+
+    def test_other_values_are_kept(self):
+        self.settings.setValue("User", u"test")
+        with open(self._path) as f:
+            content = f.read()
+        self.assertIn("@ByteArray(\\x1\\xd9\\xd0\\xcb)", content)
+
+    def test_remove(self):
+        self.settings.remove("DefaultProvider")
+        self.assertIsNone(self.settings.value("DefaultProvider"))
+        self.assertEqual(self.settings.value("RememberUserAndPass"), "true")
+
+    def test_all_keys(self):
+        self.assertEqual(sorted(self.settings.allKeys()),
+                         ["DefaultProvider", "Geometry",
+                          "RememberUserAndPass",
+                          "demo.bitmask.net/Gateway",
+                          "demo.bitmask.net/Services",
+                          "demo.bitmask.net/test_uuid"])
+
+    def test_changes_wait_for_sync(self):
+        settings = IniSettings(self._path, autosync=False)
+        settings.setValue("User", u"test")
+        settings.remove("DefaultProvider")
+        self.assertEqual(settings.value("User"), "test")
+        self.assertIsNone(IniSettings(self._path).value("User"))
+
+        settings.sync()
+        reread = IniSettings(self._path)
+        self.assertEqual(reread.value("User"), "test")
+        self.assertIsNone(reread.value("DefaultProvider"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -29,7 +29,7 @@ import mock
 
 from leap.common.testing.basetest import BaseLeapTest
 from leap.bitmask.config.leapsettings import LeapSettings
-from leap.bitmask.config import flags
+from leap.bitmask.config import flags, providerindex
 
 
 class LeapSettingsTest(BaseLeapTest):
@@ -47,11 +47,12 @@ class LeapSettingsTest(BaseLeapTest):
         """
         flags.STANDALONE = False
         self._leapsettings = LeapSettings()
-        with mock.patch('os.listdir') as os_listdir:
+        with mock.patch.object(providerindex.ProviderIndex, 'get_providers',
+                               autospec=True) as get_providers:
             # use this method only to spy where LeapSettings is looking for
             self._leapsettings.get_configured_providers()
-            args, kwargs = os_listdir.call_args
-            config_dir = args[0]
+            args, kwargs = get_providers.call_args
+            config_dir = args[0]._path
             self.assertFalse(config_dir.startswith(os.getcwd()))
             self.assertFalse(config_dir.endswith('config'))
 
@@ -61,11 +62,12 @@ class LeapSettingsTest(BaseLeapTest):
         """
         flags.STANDALONE = True
         self._leapsettings = LeapSettings()
-        with mock.patch('os.listdir') as os_listdir:
+        with mock.patch.object(providerindex.ProviderIndex, 'get_providers',
+                               autospec=True) as get_providers:
             # use this method only to spy where LeapSettings is looking for
             self._leapsettings.get_configured_providers()
-            args, kwargs = os_listdir.call_args
-            config_dir = args[0]
+            args, kwargs = get_providers.call_args
+            config_dir = args[0]._path
             self.assertTrue(config_dir.startswith(os.getcwd()))
             self.assertFalse(config_dir.endswith('config'))
 
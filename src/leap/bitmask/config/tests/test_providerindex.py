@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+# test_providerindex.py
+# Copyright (C) 2014 LEAP
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Tests for providerindex module.
+"""
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+import os
+import shutil
+import tempfile
+import time
+
+import mock
+
+from leap.common.testing.basetest import BaseLeapTest
+from leap.bitmask.config import providerindex
+from leap.bitmask.config.providerindex import ProviderIndex, ProviderInfo
+
+
+def _fake_read_provider(providers_path, domain, previous=None):
+    if not os.path.isdir(os.path.join(providers_path, domain)):
+        return None
+    return ProviderInfo(domain, services=["openvpn"], config_loaded=True,
+                        cert_expiry=time.time() + 3600,
+                        mtimes={providerindex.PROVIDER_JSON: 1.0})
+
+
+class ProviderIndexTest(BaseLeapTest):
+    """Tests for ProviderIndex"""
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self._providers_path = os.path.join(self._dir, "providers")
+        os.mkdir(self._providers_path)
+        for domain in ("b.example.org", "a.example.org"):
+            os.mkdir(os.path.join(self._providers_path, domain))
+
+        self._patcher = mock.patch.object(
+            providerindex, "read_provider", side_effect=_fake_read_provider)
+        self.read_provider = self._patcher.start()
+        self.index = ProviderIndex(self._providers_path)
+
+    def tearDown(self):
+        self._patcher.stop()
+        shutil.rmtree(self._dir)
+
+    def test_scans_once(self):
+        self.index.scan()
+        self.index.scan()
+        with mock.patch("os.listdir") as os_listdir:
+            self.assertEqual(self.index.get_providers(),
+                             ["a.example.org", "b.example.org"])
+            self.index.get_info("a.example.org")
+            self.assertFalse(os_listdir.called)
+        self.assertEqual(self.index.scans, 1)
+        self.assertEqual(self.read_provider.call_count, 2)
+
+    def test_refresh_one_provider(self):
+        self.index.scan()
+        os.mkdir(os.path.join(self._providers_path, "c.example.org"))
+        shutil.rmtree(os.path.join(self._providers_path, "a.example.org"))
+
+        self.index.refresh("c.example.org")
+        self.index.refresh("a.example.org")
+        self.assertEqual(self.index.get_providers(),
+                         ["b.example.org", "c.example.org"])
+        self.assertEqual(self.index.get_info("c.example.org").services,
+                         ["openvpn"])
+        self.assertEqual(self.index.scans, 1)
+
+    def test_missing_directory(self):
+        index = ProviderIndex(os.path.join(self._dir, "missing"))
+        self.assertEqual(index.get_providers(), [])
+
+    def test_snapshot_is_saved(self):
+        self.index.scan()
+        self.assertTrue(os.path.isfile(
+            os.path.join(self._dir, providerindex.INDEX_FILE)))
+
+        index = ProviderIndex(self._providers_path)
+        with mock.patch("os.listdir") as os_listdir:
+            self.assertEqual(index.get_providers(),
+                             ["a.example.org", "b.example.org"])
+            info = index.get_info("a.example.org")
+            self.assertFalse(os_listdir.called)
+        self.assertTrue(info.is_valid())
+        self.assertEqual(info.services, ["openvpn"])
+        self.assertEqual(index.scans, 0)
+
+    def test_scan_passes_the_saved_infos(self):
+        self.index.scan()
+        self.read_provider.reset_mock()
+
+        index = ProviderIndex(self._providers_path)
+        index.scan()
+        previous = dict((args[1], args[2])
+                        for args, kwargs in self.read_provider.call_args_list)
+        self.assertEqual(previous["a.example.org"],
+                         self.index.get_info("a.example.org"))
+
+    def test_refresh_saves_the_snapshot(self):
+        self.index.scan()
+        os.mkdir(os.path.join(self._providers_path, "c.example.org"))
+        self.index.refresh("c.example.org")
+
+        index = ProviderIndex(self._providers_path)
+        self.assertEqual(index.get_providers(),
+                         ["a.example.org", "b.example.org", "c.example.org"])
+
+
+class ProviderInfoTest(BaseLeapTest):
+    """Tests for ProviderInfo"""
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_is_valid(self):
+        now = time.time()
+        self.assertTrue(ProviderInfo("a", config_loaded=True,
+                                     cert_expiry=now + 1).is_valid(now))
+        self.assertFalse(ProviderInfo("a", config_loaded=True,
+                                      cert_expiry=now - 1).is_valid(now))
+        self.assertFalse(ProviderInfo("a", config_loaded=True).is_valid(now))
+        self.assertFalse(ProviderInfo("a", cert_expiry=now + 1).is_valid(now))
+
+    def test_is_initialized(self):
+        self.assertFalse(ProviderInfo("a").is_initialized())
+        info = ProviderInfo(
+            "a", mtimes={providerindex.EIP_SERVICE_JSON: 1.0})
+        self.assertTrue(info.is_initialized())
+
+    def test_to_dict(self):
+        info = ProviderInfo("a", services=["openvpn"], cert_expiry=10.0,
+                            mtimes={providerindex.PROVIDER_JSON: 1.0},
+                            config_loaded=True)
+        self.assertEqual(ProviderInfo.from_dict("a", info.to_dict()), info)
+
+
+class ReadProviderTest(BaseLeapTest):
+    """Tests for read_provider"""
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def test_read_provider(self):
+        self.assertIsNone(providerindex.read_provider(self._dir, "a"))
+        os.mkdir(os.path.join(self._dir, "a"))
+        with open(os.path.join(self._dir, "a", "provider.json"), "w") as f:
+            f.write("{}")
+        info = providerindex.read_provider(self._dir, "a")
+        self.assertEqual(info.mtimes.keys(), [providerindex.PROVIDER_JSON])
+        self.assertIsNone(info.cert_expiry)
+
+    def test_unchanged_provider_is_not_read(self):
+        os.mkdir(os.path.join(self._dir, "a"))
+        with open(os.path.join(self._dir, "a", "provider.json"), "w") as f:
+            f.write("{}")
+        info = providerindex.read_provider(self._dir, "a")
+        with mock.patch("leap.bitmask.config.configcache.load") as load:
+            again = providerindex.read_provider(self._dir, "a", info)
+            self.assertFalse(load.called)
+        self.assertIs(again, info)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+# test_settingsstore.py
+# Copyright (C) 2014 LEAP
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Tests for settingsstore module.
+"""
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+import os
+import shutil
+import tempfile
+
+from leap.common.testing.basetest import BaseLeapTest
+from leap.bitmask.config.inisettings import IniSettings
+from leap.bitmask.config.settingsstore import SettingsStore
+
+SETTINGS_INI = """[General]
+RememberUserAndPass=true
+
+[demo.bitmask.net]
+Services=openvpn, mx
+"""
+
+
+class SettingsStoreTest(BaseLeapTest):
+    """Tests for SettingsStore"""
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self._path = os.path.join(self._dir, "leap.conf")
+        with open(self._path, "w") as f:
+            f.write(SETTINGS_INI)
+
+        self.opened = 0
+        # long delay, the tests flush explicitly
+        self.store = SettingsStore(self._path, self._open, write_delay=60)
+
+    def tearDown(self):
+        self.store.flush()
+        shutil.rmtree(self._dir)
+
+    def _open(self, path):
+        self.opened += 1
+        return IniSettings(path, autosync=False)
+
+    def test_reads_file_once(self):
+        self.assertTrue(self.store.get_bool("RememberUserAndPass"))
+        self.assertEqual(self.store.get_list("demo.bitmask.net/Services"),
+                         ["openvpn", "mx"])
+        self.assertIsNone(self.store.value("User"))
+        self.assertEqual(self.opened, 1)
+
+    def test_changes_written_together(self):
+        self.store.setValue("User", u"test")
+        self.store.setValue("AutoStartEIP", True)
+        self.store.remove("RememberUserAndPass")
+        self.assertEqual(self.store.value("User"), u"test")
+        self.assertIsNone(IniSettings(self._path).value("User"))
+
+        self.store.flush()
+        self.assertEqual(self.store.writes, 1)
+        settings = IniSettings(self._path)
+        self.assertEqual(settings.value("User"), "test")
+        self.assertEqual(settings.value("AutoStartEIP"), "true")
+        self.assertIsNone(settings.value("RememberUserAndPass"))
+
+    def test_unchanged_value_is_not_written(self):
+        self.store.setValue("RememberUserAndPass", "true")
+        self.store.flush()
+        self.assertEqual(self.store.writes, 0)
+
+    def test_notifications(self):
+        changes = []
+        callback = lambda key, value: changes.append((key, value))
+        self.store.connect(callback)
+        self.store.setValue("User", u"test")
+        self.store.remove("User")
+        self.store.disconnect(callback)
+        self.store.setValue("User", u"other")
+        self.assertEqual(changes, [("User", u"test"), ("User", None)])
+
+    def test_delayed_write(self):
+        store = SettingsStore(self._path, self._open, write_delay=0.01)
+        store.setValue("User", u"test")
+        # the timer thread does the flush
+        store._timer.join()
+        self.assertEqual(store.writes, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
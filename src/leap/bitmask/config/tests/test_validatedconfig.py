@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+# test_validatedconfig.py
+# Copyright (C) 2014 LEAP
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Tests for the configs with shared validators
+"""
+import json
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from leap.bitmask.config import validatedconfig
+from leap.bitmask.services.mail.smtpconfig import SMTPConfig
+from leap.common.testing.basetest import BaseLeapTest
+
+sample_config = {
+    "serial": 1,
+    "version": 1,
+    "hosts": {
+        "walrus": {
+            "hostname": "smtp.example.org",
+            "ip_address": "1.2.3.4",
+            "port": 465
+        }
+    },
+    "locations": {}
+}
+
+
+class ValidatedConfigTestCase(BaseLeapTest):
+    """
+    Tests for the ValidatedConfig class.
+    """
+
+    def setUp(self):
+        self.validators = validatedconfig.ValidatorCache()
+        self._original = validatedconfig.validators
+        validatedconfig.validators = self.validators
+
+    def tearDown(self):
+        validatedconfig.validators = self._original
+
+    def _load(self, content):
+        config = SMTPConfig()
+        config.set_api_version("1")
+        return config, config.load(data=json.dumps(content))
+
+    def test_same_content_validated_once(self):
+        config, loaded = self._load(sample_config)
+        self.assertTrue(loaded)
+        config, loaded = self._load(sample_config)
+        self.assertTrue(loaded)
+
+        self.assertEqual(self.validators.validations, 1)
+        self.assertEqual(self.validators.skipped, 1)
+        self.assertEqual(config.get_hosts(), sample_config["hosts"])
+
+    def test_other_content_is_validated(self):
+        self._load(sample_config)
+        other = dict(sample_config, serial=2)
+        config, loaded = self._load(other)
+        self.assertTrue(loaded)
+        self.assertEqual(self.validators.validations, 2)
+
+    def test_invalid_content_always_fails(self):
+        invalid = dict(sample_config, hosts="not a dict")
+        self.assertFalse(self._load(invalid)[1])
+        self.assertFalse(self._load(invalid)[1])
+        self.assertEqual(self.validators.skipped, 0)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
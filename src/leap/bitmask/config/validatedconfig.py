@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+# validatedconfig.py
+# Copyright (C) 2014 LEAP
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Configs that validate their schema once.
+
+BaseConfig.load copies the schema, encodes it to json and back, checks it
+against the json schema meta schema and then validates the config with it,
+on every load. Here the validator is built once per config class and api
+version, and a content that was already validated with it (same sha256)
+is not validated again. The type casting of PluggableConfig still runs on
+every load, it's cheap and it builds the loaded values.
+"""
+import hashlib
+import json
+import logging
+import os
+
+from collections import OrderedDict
+from threading import Lock
+
+import jsonschema
+
+from leap.common.check import leap_check
+from leap.common.config.baseconfig import BaseConfig, NonExistingSchema
+from leap.common.config.pluggableconfig import (JSONSchemaEncoder,
+                                                PluggableConfig)
+
+try:
+    from jsonschema.validators import validator_for
+except ImportError:
+    # old jsonschema, validate the old way.
+    validator_for = None
+
+logger = logging.getLogger(__name__)
+
+
+class ValidatorCache(object):
+    """
+    Thread safe cache of schema validators, and of the contents that passed
+    them.
+    """
+
+    # How many validated contents to remember.
+    MAX_VALIDATED = 256
+
+    def __init__(self):
+        # {(config class, api version): validator}
+        self._validators = {}
+        # {(config class, api version, sha256): None}, oldest first
+        self._validated = OrderedDict()
+        self._lock = Lock()
+        self.validations = 0
+        self.skipped = 0
+
+    def _get_validator(self, key, schema):
+        """
+        Return the validator for `key`, building it if it's the first time.
+
+        :param key: the config class and api version.
+        :type key: tuple
+        :param schema: the schema of the config, as _get_schema returns it.
+        :type schema: dict
+        """
+        with self._lock:
+            validator = self._validators.get(key)
+        if validator is not None:
+            return validator
+
+        # the specs use python types for the types, encode them the same
+        # way PluggableConfig does.
+        json_schema = json.loads(JSONSchemaEncoder().encode(schema))
+        cls = validator_for(json_schema)
+        cls.check_schema(json_schema)
+        validator = cls(json_schema)
+
+        with self._lock:
+            self._validators[key] = validator
+        return validator
+
+    def validate(self, key, schema, config, digest=None):
+        """
+        Validate `config` against `schema`, unless a content with the same
+        digest already passed.
+
+        :param key: the config class and api version.
+        :type key: tuple
+        :param schema: the schema of the config, as _get_schema returns it.
+        :type schema: dict
+        :param config: the deserialized config.
+        :type config: dict
+        :param digest: the sha256 of the serialized config, if known.
+        :type digest: str or None
+
+        :raises jsonschema.ValidationError: if the config is not valid.
+        """
+        if digest is not None:
+            with self._lock:
+                if key + (digest,) in self._validated:
+                    self.skipped += 1
+                    return
+
+        if validator_for is None:
+            schema_json = JSONSchemaEncoder().encode(schema)
+            jsonschema.validate(config, json.loads(schema_json))
+        else:
+            self._get_validator(key, schema).validate(config)
+
+        with self._lock:
+            self.validations += 1
+            if digest is not None:
+                self._validated[key + (digest,)] = None
+                while len(self._validated) > self.MAX_VALIDATED:
+                    self._validated.popitem(last=False)
+
+
+# The cache for this process
+validators = ValidatorCache()
+
+
+class _ValidatingChecker(PluggableConfig):
+    """
+    PluggableConfig that validates with the shared validators.
+    """
+
+    def __init__(self, key, **kwargs):
+        """
+        :param key: the config class and api version.
+        :type key: tuple
+        """
+        PluggableConfig.__init__(self, **kwargs)
+        self._key = key
+        self._digest = None
+
+    def deserialize(self, string=None, fromfile=None, format=None):
+        """
+        Load the configuration from a file or string, keeping the digest of
+        its content.
+        """
+        if fromfile:
+            with open(fromfile, 'r') as f:
+                string = f.read()
+        if string:
+            self._digest = hashlib.sha256(string).hexdigest()
+        return PluggableConfig.deserialize(self, string=string,
+                                           format=format or self._format)
+
+    def validate(self, config, format=None):
+        """
+        Validate the config and cast its values.
+        """
+        validators.validate(self._key, self.options, config, self._digest)
+        self.to_python(config)
+
+
+class ValidatedConfig(BaseConfig):
+    """
+    BaseConfig that validates with a validator shared by the configs of its
+    class and api version.
+    """
+
+    def load(self, path="", data=None, mtime=None, relative=True):
+        """
+        Loads the configuration from disk.
+        It may raise NonExistingSchema exception.
+
+        :param path: if relative=True, this is a relative path
+                     to configuration. The absolute path
+                     will be calculated depending on the platform
+        :type path: str
+        :param data: the content of the configuration, to load it from
+                     there instead of from the path.
+        :type data: str
+        :param mtime: the modification time of the content.
+        :type mtime: str
+
+        :param relative: if True, path is relative. If False, it's absolute.
+        :type relative: bool
+
+        :return: True if loaded from disk correctly, False otherwise
+        :rtype: bool
+        """
+        if relative is True:
+            config_path = os.path.join(self.get_path_prefix(), path)
+        else:
+            config_path = path
+
+        schema = self._get_spec()
+        leap_check(schema is not None,
+                   "There is no schema to use.", NonExistingSchema)
+
+        # the schema is only read, it doesn't need a copy for each load.
+        key = (self.__class__, self._api_version)
+        self._config_checker = _ValidatingChecker(key, format="json")
+        self._config_checker.options = schema
+
+        try:
+            if data is None:
+                self._config_checker.load(fromfile=config_path, mtime=mtime)
+            else:
+                self._config_checker.load(data, mtime=mtime)
+        except Exception as e:
+            logger.error("Something went wrong while loading " +
+                         "the config from %s\n%s" % (config_path, e))
+            self._config_checker = None
+            return False
+        return True
+
+    def copy_loaded(self, other):
+        """
+        Take the loaded values of `other`, a config of the same class and
+        api version, without loading them again.
+
+        The values are shared: both configs can be read, and loaded again,
+        but not changed in place.
+
+        :param other: the loaded config.
+        :type other: ValidatedConfig
+        """
+        leap_check(isinstance(other, self.__class__),
+                   "Can't copy a %s into a %s" % (other.__class__.__name__,
+                                                  self.__class__.__name__))
+        self._config_checker = other._config_checker
@@ -18,12 +18,10 @@
 Utilities for dealing with client certs
 """
 import logging
-import os
 
 from leap.bitmask.crypto.srpauth import SRPAuth
+from leap.bitmask.provider import artifacts
 from leap.bitmask.util.constants import REQUEST_TIMEOUT
-from leap.common.files import check_and_fix_urw_only
-from leap.common.files import mkdir_p
 
 from leap.common import certs as leap_certs
 
@@ -67,14 +65,11 @@ def download_client_cert(provider_config, path, session):
         raise Exception("The downloaded certificate is not a "
                         "valid PEM file")
 
-    mkdir_p(os.path.dirname(path))
-
+    store = artifacts.get_store(provider_config.get_domain())
     try:
-        with open(path, "w") as f:
-            f.write(client_cert)
-    except IOError as exc:
+        with store.transaction() as txn:
+            txn.write(store.get_name(path), client_cert, headers=res.headers)
+    except (IOError, OSError) as exc:
         logger.error(
             "Error saving client cert: %r" % (exc,))
         raise
-
-    check_and_fix_urw_only(path)
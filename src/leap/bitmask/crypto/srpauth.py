@@ -27,14 +27,15 @@ import json
 #this error is raised from requests
 from simplejson.decoder import JSONDecodeError
 from functools import partial
-from requests.adapters import HTTPAdapter
 
-from twisted.internet import threads
 from twisted.internet.defer import CancelledError
 
+from leap.bitmask.config import flags
 from leap.bitmask.config.leapsettings import LeapSettings
+from leap.bitmask.util import agentfetcher
+from leap.bitmask.util import httppool
 from leap.bitmask.util import request_helpers as reqhelper
-from leap.bitmask.util.compat import requests_has_max_retries
+from leap.bitmask.util import threadpools
 from leap.bitmask.util.constants import REQUEST_TIMEOUT
 from leap.common.check import leap_assert
 from leap.common.events import signal as events_signal
@@ -156,7 +157,7 @@ class SRPAuth(object):
             # **************************************************** #
             # Dependency injection helpers, override this for more
             # granular testing
-            self._fetcher = requests
+            self._fetcher = agentfetcher if flags.TWISTED_FETCHER else requests
             self._srp = srp
             self._hashfun = self._srp.SHA256
             self._ng = self._srp.NG_1024
@@ -181,18 +182,24 @@ class SRPAuth(object):
         def _reset_session(self):
             """
             Resets the current session and sets max retries to 30.
+            The connections of the new session come from the process
+            pool, see util/httppool.py
             """
-            self._session = self._fetcher.session()
             # We need to bump the default retries, otherwise logout
             # fails most of the times
             # NOTE: This is a workaround for the moment, the server
             # side seems to return correctly every time, but it fails
             # on the client end.
-            if requests_has_max_retries:
-                adapter = HTTPAdapter(max_retries=30)
-            else:
-                adapter = HTTPAdapter()
-            self._session.mount('https://', adapter)
+            self._session = httppool.mount(self._fetcher.session(),
+                                           max_retries=30)
+
+        def cancel_requests(self):
+            """
+            Abort the requests in flight, if the fetcher can.
+            """
+            cancel = getattr(self._session, "cancel", None)
+            if cancel is not None:
+                cancel()
 
         def _safe_unhexlify(self, val):
             """
@@ -248,18 +255,8 @@ class SRPAuth(object):
             """
             logger.debug("Starting authentication process...")
             try:
-                auth_data = {
-                    self.LOGIN_KEY: username,
-                    self.A_KEY: binascii.hexlify(self._srp_a)
-                }
-                sessions_url = "%s/%s/%s/" % \
-                    (self._provider_config.get_api_uri(),
-                     self._provider_config.get_api_version(),
-                     "sessions")
-
-                ca_cert_path = self._provider_config.get_ca_cert_path()
-                ca_cert_path = ca_cert_path.encode(sys.getfilesystemencoding())
-
+                sessions_url, auth_data, ca_cert_path = \
+                    self._get_init_session_request(username)
                 init_session = self._session.post(sessions_url,
                                                   data=auth_data,
                                                   verify=ca_cert_path,
@@ -273,6 +270,102 @@ class SRPAuth(object):
                 logger.error("Unknown error: %r" % (e,))
                 raise SRPAuthenticationError()
 
+            return self._check_init_session(init_session)
+
+        def _get_init_session_request(self, username):
+            """
+            Returns the url, the data and the verify parameter of the first
+            request for authentication.
+
+            :param username: username to login
+            :type username: str
+
+            :rtype: tuple(str, dict, str)
+            """
+            auth_data = {
+                self.LOGIN_KEY: username,
+                self.A_KEY: binascii.hexlify(self._srp_a)
+            }
+            sessions_url = "%s/%s/%s/" % \
+                (self._provider_config.get_api_uri(),
+                 self._provider_config.get_api_version(),
+                 "sessions")
+
+            ca_cert_path = self._provider_config.get_ca_cert_path()
+            ca_cert_path = ca_cert_path.encode(sys.getfilesystemencoding())
+            return sessions_url, auth_data, ca_cert_path
+
+        def _fetch_init_session(self, _, username):
+            """
+            Like _start_authentication, for a session that fetches in the
+            reactor: no thread waits for the response.
+
+            :param _: IGNORED, output from the previous callback (None)
+            :type _: IGNORED
+            :param username: username to login
+            :type username: str
+
+            :returns: a defer that fires with the salt and B parameters
+            :rtype: Deferred
+            """
+            logger.debug("Starting authentication process...")
+            try:
+                sessions_url, auth_data, ca_cert_path = \
+                    self._get_init_session_request(username)
+            except Exception as e:
+                logger.error("Unknown error: %r" % (e,))
+                raise SRPAuthenticationError()
+            # Clean up A value, we don't need it anymore
+            self._srp_a = None
+
+            d = agentfetcher.call_in_reactor(
+                self._session.fetch, "POST", sessions_url, data=auth_data,
+                verify=ca_cert_path, timeout=REQUEST_TIMEOUT)
+            d.addErrback(self._fetch_error, "salt",
+                         unknown=SRPAuthenticationError)
+            d.addCallback(self._check_init_session)
+            return d
+
+        def _fetch_error(self, failure, step, unknown=None):
+            """
+            Errback for the requests sent with fetch, raises the errors the
+            blocking requests raise.
+
+            :param failure: the failure of the request.
+            :type failure: twisted.python.failure.Failure
+            :param step: the step of the authentication, for the logs.
+            :type step: str
+            :param unknown: the exception to raise for the errors that are
+                            not connection errors, if any.
+            :type unknown: type or None
+            """
+            if failure.check(CancelledError):
+                return failure
+            if failure.check(requests.exceptions.ConnectionError):
+                logger.error("No connection made (%s): %r"
+                             % (step, failure.value))
+                raise SRPAuthConnectionError()
+            if unknown is not None:
+                logger.error("Unknown error: %r" % (failure.value,))
+                raise unknown()
+            return failure
+
+        def _check_init_session(self, init_session):
+            """
+            Checks the response to the first request for authentication.
+
+            Might raise all SRPAuthenticationError based:
+              SRPAuthBadStatusCode
+              SRPAuthBadUserOrPassword
+              SRPAuthNoSalt
+              SRPAuthNoB
+
+            :param init_session: the response.
+            :type init_session: requests.Response
+
+            :return: salt and B parameters
+            :rtype: tuple
+            """
             content, mtime = reqhelper.get_content(init_session)
 
             if init_session.status_code not in (200,):
@@ -319,6 +412,34 @@ class SRPAuth(object):
             :return: the M2 SRP parameter
             :rtype: str
             """
+            auth_url, auth_data = self._get_challenge_request(salt_B, username)
+
+            try:
+                auth_result = self._session.put(auth_url,
+                                                data=auth_data,
+                                                verify=self._provider_config.
+                                                get_ca_cert_path(),
+                                                timeout=REQUEST_TIMEOUT)
+            except requests.exceptions.ConnectionError as e:
+                logger.error("No connection made (HAMK): %r" % (e,))
+                raise SRPAuthConnectionError()
+
+            return self._check_auth_result(auth_result)
+
+        def _get_challenge_request(self, salt_B, username):
+            """
+            Given the salt and B processes the auth challenge, and returns
+            the url and the data of the request with the M parameter.
+
+            Might raise SRPAuthBadDataFromServer
+
+            :param salt_B: salt and B parameters for the username
+            :type salt_B: tuple
+            :param username: username for this session
+            :type username: str
+
+            :rtype: tuple(str, dict)
+            """
             logger.debug("Processing challenge...")
             try:
                 salt, B = salt_B
@@ -338,17 +459,45 @@ class SRPAuth(object):
             auth_data = {
                 self.CLIENT_AUTH_KEY: binascii.hexlify(M)
             }
+            return auth_url, auth_data
 
-            try:
-                auth_result = self._session.put(auth_url,
-                                                data=auth_data,
-                                                verify=self._provider_config.
-                                                get_ca_cert_path(),
-                                                timeout=REQUEST_TIMEOUT)
-            except requests.exceptions.ConnectionError as e:
-                logger.error("No connection made (HAMK): %r" % (e,))
-                raise SRPAuthConnectionError()
+        def _fetch_auth_result(self, auth_request):
+            """
+            Like the request of _process_challenge, for a session that
+            fetches in the reactor: no thread waits for the response.
+
+            :param auth_request: the url and the data of the request.
+            :type auth_request: tuple(str, dict)
+
+            :returns: a defer that fires with the json content of the
+                      response
+            :rtype: Deferred
+            """
+            auth_url, auth_data = auth_request
+            ca_cert_path = self._provider_config.get_ca_cert_path()
+            d = agentfetcher.call_in_reactor(
+                self._session.fetch, "PUT", auth_url, data=auth_data,
+                verify=ca_cert_path.encode(sys.getfilesystemencoding()),
+                timeout=REQUEST_TIMEOUT)
+            d.addErrback(self._fetch_error, "HAMK")
+            d.addCallback(self._check_auth_result)
+            return d
+
+        def _check_auth_result(self, auth_result):
+            """
+            Checks the response to the request with the M parameter.
+
+            Might raise SRPAuthenticationError based:
+              SRPAuthBadStatusCode
+              SRPAuthBadUserOrPassword
+              SRPAuthJSONDecodeError
+
+            :param auth_result: the response.
+            :type auth_result: requests.Response
 
+            :return: the json content of the response
+            :rtype: dict
+            """
             try:
                 content, mtime = reqhelper.get_content(auth_result)
             except JSONDecodeError:
@@ -375,7 +524,11 @@ class SRPAuth(object):
                              (auth_result.status_code, content))
                 raise SRPAuthBadStatusCode()
 
-            return json.loads(content)
+            try:
+                return json.loads(content)
+            except ValueError:
+                logger.error("Bad JSON content in auth result.")
+                raise SRPAuthJSONDecodeError()
 
         def _extract_data(self, json_content):
             """
@@ -449,7 +602,8 @@ class SRPAuth(object):
             self.set_session_id(session_id)
 
         def _threader(self, cb, res, *args, **kwargs):
-            return threads.deferToThread(cb, res, *args, **kwargs)
+            return threadpools.defer_to_pool(threadpools.AUTH,
+                                             cb, res, *args, **kwargs)
 
         def _change_password(self, current_password, new_password):
             """
@@ -513,7 +667,8 @@ class SRPAuth(object):
             :param new_password: the new password for the user
             :type new_password: str
             """
-            d = threads.deferToThread(
+            d = threadpools.defer_to_pool(
+                threadpools.AUTH,
                 self._change_password, current_password, new_password)
             d.addCallback(self._change_password_ok)
             d.addErrback(self._change_password_error)
@@ -561,18 +716,29 @@ class SRPAuth(object):
 
             self._reset_session()
 
-            d = threads.deferToThread(self._authentication_preprocessing,
-                                      username=username,
-                                      password=password)
-
-            d.addCallback(
-                partial(self._threader,
-                        self._start_authentication),
-                username=username)
-            d.addCallback(
-                partial(self._threader,
-                        self._process_challenge),
-                username=username)
+            d = threadpools.defer_to_pool(threadpools.AUTH,
+                                          self._authentication_preprocessing,
+                                          username=username,
+                                          password=password)
+
+            if agentfetcher.can_fetch(self._session):
+                # only the SRP computations run in a thread, no thread
+                # waits for the responses.
+                d.addCallback(self._fetch_init_session, username=username)
+                d.addCallback(
+                    partial(self._threader,
+                            self._get_challenge_request),
+                    username=username)
+                d.addCallback(self._fetch_auth_result)
+            else:
+                d.addCallback(
+                    partial(self._threader,
+                            self._start_authentication),
+                    username=username)
+                d.addCallback(
+                    partial(self._threader,
+                            self._process_challenge),
+                    username=username)
             d.addCallback(
                 partial(self._threader,
                         self._extract_data))
@@ -654,7 +820,7 @@ class SRPAuth(object):
                 self.set_uuid(None)
                 self.set_token(None)
                 # Also reset the session
-                self._session = self._fetcher.session()
+                self._reset_session()
                 logger.debug("Successfully logged out.")
                 if self._signaler is not None:
                     self._signaler.signal(self._signaler.SRP_LOGOUT_OK)
@@ -749,6 +915,12 @@ class SRPAuth(object):
         """
         return self.__instance.is_authenticated()
 
+    def cancel_requests(self):
+        """
+        Abort the requests in flight, if the fetcher can.
+        """
+        self.__instance.cancel_requests()
+
     def change_password(self, current_password, new_password):
         """
         Changes the user's password.
@@ -22,10 +22,11 @@ import logging
 import requests
 import srp
 
-from PySide import QtCore
 from urlparse import urlparse
 
+from leap.bitmask.config import flags
 from leap.bitmask.config.providerconfig import ProviderConfig
+from leap.bitmask.util import agentfetcher, httppool, threadpools
 from leap.bitmask.util.constants import SIGNUP_TIMEOUT
 from leap.bitmask.util.request_helpers import get_content
 from leap.common.check import leap_assert, leap_assert_type
@@ -33,7 +34,7 @@ from leap.common.check import leap_assert, leap_assert_type
 logger = logging.getLogger(__name__)
 
 
-class SRPRegister(QtCore.QObject):
+class SRPRegister(object):
     """
     Registers a user to a specific provider using SRP
     """
@@ -60,7 +61,6 @@ class SRPRegister(QtCore.QObject):
         :param register_path: webapp path for registering users
         :type register_path; str
         """
-        QtCore.QObject.__init__(self)
         leap_assert(provider_config, "Please provide a provider")
         leap_assert_type(provider_config, ProviderConfig)
 
@@ -70,7 +70,7 @@ class SRPRegister(QtCore.QObject):
         # **************************************************** #
         # Dependency injection helpers, override this for more
         # granular testing
-        self._fetcher = requests
+        self._fetcher = agentfetcher if flags.TWISTED_FETCHER else requests
         self._srp = srp
         self._hashfun = self._srp.SHA256
         self._ng = self._srp.NG_1024
@@ -84,7 +84,7 @@ class SRPRegister(QtCore.QObject):
 
         self._register_path = register_path
 
-        self._session = self._fetcher.session()
+        self._session = httppool.mount(self._fetcher.session())
 
     def _get_registration_uri(self):
         """
@@ -102,40 +102,53 @@ class SRPRegister(QtCore.QObject):
 
         return uri
 
-    def register_user(self, username, password):
+    def _get_user_data(self, username, password):
         """
-        Registers a user with the validator based on the password provider
+        Returns the data of the register request: the username, and the
+        salt and verifier for the password.
 
         :param username: username to register
         :type username: str
         :param password: password for this username
         :type password: str
 
-        :returns: if the registration went ok or not.
-        :rtype: bool
+        :rtype: dict
         """
-
-        username = username.lower().encode('utf-8')
-        password = password.encode('utf-8')
-
         salt, verifier = self._srp.create_salted_verification_key(
             username,
             password,
             self._hashfun,
             self._ng)
 
-        user_data = {
+        return {
             self.USER_LOGIN_KEY: username,
             self.USER_VERIFIER_KEY: binascii.hexlify(verifier),
             self.USER_SALT_KEY: binascii.hexlify(salt)
         }
 
+    def register_user(self, username, password):
+        """
+        Registers a user with the validator based on the password provider
+
+        :param username: username to register
+        :type username: str
+        :param password: password for this username
+        :type password: str
+
+        :returns: if the registration went ok or not.
+        :rtype: bool
+        """
+
+        username = username.lower().encode('utf-8')
+        password = password.encode('utf-8')
+
+        user_data = self._get_user_data(username, password)
+
         uri = self._get_registration_uri()
 
         logger.debug('Post to uri: %s' % uri)
         logger.debug("Will try to register user = %s" % (username,))
 
-        ok = False
         req = None
         try:
             req = self._session.post(uri,
@@ -146,11 +159,67 @@ class SRPRegister(QtCore.QObject):
 
         except requests.exceptions.RequestException as exc:
             logger.error(exc.message)
-        else:
-            ok = req.ok
 
+        return self._check_response(req, username)
+
+    def register_user_deferred(self, username, password):
+        """
+        Registers a user like register_user, in the background. The salt
+        and verifier are computed in the AUTH pool, and with a session that
+        fetches in the reactor no thread waits for the response.
+
+        :param username: username to register
+        :type username: str
+        :param password: password for this username
+        :type password: str
+
+        :returns: a defer that fires with whether the registration went ok.
+        :rtype: Deferred
+        """
+        if not agentfetcher.can_fetch(self._session):
+            return threadpools.defer_to_pool(
+                threadpools.AUTH, self.register_user, username, password)
+
+        username = username.lower().encode('utf-8')
+        password = password.encode('utf-8')
+        uri = self._get_registration_uri()
+
+        def fetch(user_data):
+            logger.debug('Post to uri: %s' % uri)
+            logger.debug("Will try to register user = %s" % (username,))
+            return agentfetcher.call_in_reactor(
+                self._session.fetch, "POST", uri, data=user_data,
+                timeout=SIGNUP_TIMEOUT,
+                verify=self._provider_config.get_ca_cert_path())
+
+        def request_error(failure):
+            failure.trap(requests.exceptions.RequestException)
+            logger.error(failure.value.message)
+
+        d = threadpools.defer_to_pool(threadpools.AUTH, self._get_user_data,
+                                      username, password)
+        d.addCallback(fetch)
+        d.addErrback(request_error)
+        d.addCallback(self._check_response, username)
+        return d
+
+    def _check_response(self, req, username):
+        """
+        Signals the result of the register request, and logs the error the
+        provider sent, if any.
+
+        :param req: the response, or None if the request failed.
+        :type req: requests.Response or None
+        :param username: the username registered
+        :type username: str
+
+        :returns: if the registration went ok or not.
+        :rtype: bool
+        """
+        ok = False
         status_code = self.STATUS_ERROR
         if req is not None:
+            ok = req.ok
             status_code = req.status_code
         self._emit_result(status_code)
 
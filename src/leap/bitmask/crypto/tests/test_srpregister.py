@@ -33,6 +33,7 @@ from twisted.internet import threads
 from leap.bitmask.config.providerconfig import ProviderConfig
 from leap.bitmask.crypto import srpregister, srpauth
 from leap.bitmask.crypto.tests import fake_provider
+from leap.bitmask.util import agentfetcher
 from leap.common.testing.https_server import where
 
 log.startLogging(sys.stdout)
@@ -86,6 +87,7 @@ class SRPTestCase(unittest.TestCase):
         if not loaded:
             raise ImproperlyConfiguredError(
                 "Could not load test provider config")
+        cls.provider = provider
         cls.register = srpregister.SRPRegister(provider_config=provider)
 
         cls.auth = srpauth.SRPAuth(provider)
@@ -199,3 +201,29 @@ class SRPTestCase(unittest.TestCase):
         d.addCallback(self.assertTrue)
 
         return d
+
+    @deferred()
+    def test_register_and_login_with_agentfetcher(self):
+        """
+        Checks that a user registered with the agent fetcher can log in
+        with it.
+        """
+        register = srpregister.SRPRegister(provider_config=self.provider)
+        register._fetcher = agentfetcher
+        register._session = agentfetcher.session()
+
+        auth = srpauth.SRPAuth._SRPAuth__impl(self.provider,
+                                             signaler=MagicMock())
+        auth._fetcher = agentfetcher
+
+        d = register.register_user_deferred("foouser_agent", "barpass")
+        d.addCallback(self.assertTrue)
+        d.addCallback(lambda _: auth.authenticate("foouser_agent",
+                                                  "barpass"))
+
+        def check(_):
+            auth._signaler.signal.assert_called_with(
+                auth._signaler.SRP_AUTH_OK)
+            self.assertIsNotNone(auth.get_session_id())
+        d.addCallback(check)
+        return d
@@ -23,6 +23,7 @@ import logging
 from functools import partial
 from PySide import QtCore, QtGui
 
+from leap.bitmask.config import providerindex
 from leap.bitmask.config.leapsettings import LeapSettings
 from leap.bitmask.gui.ui_eippreferences import Ui_EIPPreferences
 
@@ -96,14 +97,16 @@ class EIPPreferencesWindow(QtGui.QDialog):
         if not providers:
             return
 
-        self._backend.eip_get_initialized_providers(providers)
+        index = providerindex.get_index()
+        initialized = []
+        for domain in providers:
+            info = index.get_info(domain)
+            initialized.append(
+                (domain, info is not None and info.is_initialized()))
+        self._load_providers_in_combo(initialized)
 
-    @QtCore.Slot(list)
     def _load_providers_in_combo(self, providers):
         """
-        TRIGGERS:
-            Signaler.eip_get_initialized_providers
-
         Add the client's configured providers to the providers combo boxes.
 
         :param providers: the list of providers to add and whether each one is
@@ -253,5 +256,3 @@ class EIPPreferencesWindow(QtGui.QDialog):
         sig.eip_get_gateways_list_error.connect(self._gateways_list_error)
         sig.eip_uninitialized_provider.connect(
             self._gateways_list_uninitialized)
-        sig.eip_get_initialized_providers.connect(
-            self._load_providers_in_combo)
@@ -27,7 +27,7 @@ from twisted.internet import reactor, threads
 
 from leap.bitmask import __version__ as VERSION
 from leap.bitmask import __version_hash__ as VERSION_HASH
-from leap.bitmask.config import flags
+from leap.bitmask.config import flags, providerindex
 from leap.bitmask.config.leapsettings import LeapSettings
 
 from leap.bitmask.gui.advanced_key_management import AdvancedKeyManagement
@@ -44,6 +44,7 @@ from leap.bitmask.platform_init import IS_WIN, IS_MAC, IS_LINUX
 from leap.bitmask.platform_init.initializers import init_platform
 
 from leap.bitmask import backend
+from leap.bitmask.signaler_qt import Signaler
 
 from leap.bitmask.services.eip import conductor as eip_conductor
 from leap.bitmask.services.mail import conductor as mail_conductor
@@ -61,8 +62,6 @@ if IS_WIN:
 from leap.common.events import register
 from leap.common.events import events_pb2 as proto
 
-from leap.mail.imap.service.imap import IMAP_PORT
-
 from ui_mainwindow import Ui_MainWindow
 
 QtDelayedCall = QtCore.QTimer.singleShot
@@ -124,9 +123,20 @@ class MainWindow(QtGui.QMainWindow):
         self.ui = Ui_MainWindow()
         self.ui.setupUi(self)
         self.menuBar().setNativeMenuBar(not IS_LINUX)
-        self._backend = backend.Backend(bypass_checks)
+        if flags.BACKEND_PROCESS and not IS_WIN:
+            from leap.bitmask.backend_ipc import BackendProxy
+            self._backend = BackendProxy(bypass_checks)
+        else:
+            if flags.BACKEND_PROCESS:
+                logger.warning("The backend can't run in a separate "
+                               "process on this platform.")
+            self._backend = backend.Backend(bypass_checks,
+                                            signaler=Signaler())
         self._backend.start()
 
+        # We are not shown yet, see showEvent
+        self._backend.signaler.set_frontend_visible(False)
+
         self._settings = LeapSettings()
 
         # Login Widget
@@ -399,7 +409,6 @@ class MainWindow(QtGui.QMainWindow):
 
         sig.prov_unsupported_client.connect(self._needs_update)
         sig.prov_unsupported_api.connect(self._incompatible_api)
-        sig.prov_get_all_services.connect(self._provider_get_all_services)
 
         # EIP start signals ==============================================
 
@@ -809,9 +818,14 @@ class MainWindow(QtGui.QMainWindow):
         This means, for example, that with just one provider with EIP
         only, the mail widget won't be displayed.
         """
-        providers = self._settings.get_configured_providers()
+        index = providerindex.get_index()
+        services = set()
+        for domain in self._settings.get_configured_providers():
+            info = index.get_info(domain)
+            if info is not None:
+                services.update(info.services)
 
-        self._backend.provider_get_all_services(providers)
+        self._provider_get_all_services(services)
 
     def _provider_get_all_services(self, services):
         self._set_eip_visible(EIP_SERVICE in services)
@@ -1021,6 +1035,10 @@ class MainWindow(QtGui.QMainWindow):
 
         Display the Bitmask help dialog.
         """
+        # loaded here and not at the top, for EIP only users it's never
+        # needed at all.
+        from leap.mail.imap.service.imap import IMAP_PORT
+
         # TODO: don't hardcode!
         smtp_port = 2013
 
@@ -1078,6 +1096,22 @@ class MainWindow(QtGui.QMainWindow):
             return
         QtGui.QMainWindow.changeEvent(self, e)
 
+    def showEvent(self, e):
+        """
+        Reimplements the showEvent to let the backend signaler know that
+        we are visible.
+        """
+        self._backend.signaler.set_frontend_visible(True)
+        QtGui.QMainWindow.showEvent(self, e)
+
+    def hideEvent(self, e):
+        """
+        Reimplements the hideEvent to let the backend signaler know that
+        we are hidden, so it can drop the signals we don't need.
+        """
+        self._backend.signaler.set_frontend_visible(False)
+        QtGui.QMainWindow.hideEvent(self, e)
+
     def closeEvent(self, e):
         """
         Reimplementation of closeEvent to close to tray
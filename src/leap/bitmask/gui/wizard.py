@@ -24,7 +24,7 @@ from functools import partial
 
 from PySide import QtCore, QtGui
 
-from leap.bitmask.config import flags
+from leap.bitmask.config import flags, providerindex
 from leap.bitmask.config.leapsettings import LeapSettings
 from leap.bitmask.services import get_service_display_name, get_supported
 from leap.bitmask.util.credentials import password_checks, username_checks
@@ -160,7 +160,14 @@ class Wizard(QtGui.QWizard):
         Loads the configured providers into the wizard providers combo box.
         """
         ls = LeapSettings()
-        providers = ls.get_configured_providers()
+        index = providerindex.get_index()
+        # only the providers with a provider.json and a CA cert that didn't
+        # expire can be used as they are.
+        providers = []
+        for domain in ls.get_configured_providers():
+            info = index.get_info(domain)
+            if info is not None and info.is_valid():
+                providers.append(domain)
         if not providers:
             self.ui.rbExistingProvider.setEnabled(False)
             self.ui.label_8.setEnabled(False)  # 'https://' label
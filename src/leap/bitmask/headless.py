@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+# headless.py
+# Copyright (C) 2014 LEAP
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Headless mode, runs the backend without interface and without Qt.
+
+The backend signals go through an EventSignaler and are logged. With a
+control socket, a client can drive the backend through it, using the same
+protocol that the out of process backend uses (see backend_ipc).
+"""
+import logging
+
+from twisted.internet import reactor
+
+from leap.bitmask.backend import Backend
+from leap.bitmask.signaler import EventSignaler
+
+logger = logging.getLogger(__name__)
+
+
+def _log_signal(key, data):
+    """
+    Log a backend signal.
+
+    :param key: string identifying the signal
+    :type key: str
+    :param data: the data sent with the signal
+    :type data: object
+    """
+    if data == '':
+        logger.info("Signal: %s" % (key,))
+    else:
+        logger.info("Signal: %s %r" % (key, data))
+
+
+def run(bypass_checks=False, control_socket=None):
+    """
+    Run the backend until the reactor is stopped.
+
+    :param bypass_checks: Set to true if the app should bypass
+                          first round of checks for CA
+                          certificates at bootstrap
+    :type bypass_checks: bool
+    :param control_socket: the path of a Unix socket to listen for a
+                           client on, None to not listen at all.
+    :type control_socket: str or None
+    """
+    signaler = EventSignaler()
+    signaler.connect_all(_log_signal)
+    backend = Backend(bypass_checks, signaler=signaler)
+
+    if control_socket is not None:
+        from leap.bitmask import backend_ipc
+        backend_ipc.listen(backend, signaler, control_socket,
+                           exit_on_disconnect=False)
+
+    backend.start()
+    logger.info("Running headless.")
+    reactor.run()
@@ -0,0 +1,521 @@
+# -*- coding: utf-8 -*-
+# artifacts.py
+# Copyright (C) 2014 LEAP
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Crash safe storage of the files downloaded for a provider.
+
+The provider.json, the service configs and the certificates are written in
+transactions:
+
+    with artifacts.get_store(domain).transaction() as txn:
+        txn.write("eip-service.json", content, mtime=mtime,
+                  headers=res.headers)
+
+On commit every file of the transaction is written to a temporary file,
+then they are all flushed to disk, renamed over the old ones and the
+manifest is saved. A crash leaves either the old or the new version of a
+file, never half of one.
+
+The manifest (manifest.json in the provider directory) keeps for each file
+its sha256, size, mtime, the url it was downloaded from, the HTTP
+validators it came with and when the server last said it was current, so
+the readers can check a file against it with a stat instead of hashing it,
+and the downloaders can ask for it again only if it changed, or not at all
+if it was checked recently:
+
+    headers = store.get_conditional_headers("eip-service.json", uri, mtime)
+
+The store also remembers when a set of files passed the provider checks
+(verified.json), so the checks run again only when one of those files
+changed or the record is too old.
+"""
+import hashlib
+import json
+import logging
+import os
+import time
+
+from threading import Lock
+
+from leap.bitmask import util
+from leap.bitmask.platform_init import IS_WIN
+from leap.common.files import mkdir_p
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = "manifest.json"
+VERIFIED = "verified.json"
+
+# The HTTP headers kept in the manifest, to revalidate the files later.
+VALIDATOR_HEADERS = ("last-modified", "etag")
+
+
+def _replace(src, dst):
+    """
+    Rename src over dst. Windows can't rename over an existing file.
+    """
+    if IS_WIN and os.path.exists(dst):
+        os.remove(dst)
+    os.rename(src, dst)
+
+
+def _fsync_dir(path):
+    """
+    Flush a directory, so the renames in it are on disk.
+    """
+    if IS_WIN:
+        # directories can't be opened there, renames are flushed anyway.
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class ArtifactTransaction(object):
+    """
+    A set of files to write together. Use it as a context manager: it's
+    committed if the block ends fine, and dropped if it raises.
+    """
+
+    def __init__(self, store):
+        """
+        :param store: the store to write to.
+        :type store: ArtifactStore
+        """
+        self._store = store
+        # [(name, content, mtime, url, validators, mode)]
+        self._files = []
+
+    def write(self, name, content, mtime=None, headers=None, mode=0600,
+              url=None):
+        """
+        Add a file to the transaction.
+
+        :param name: the path of the file, relative to the provider
+                     directory.
+        :type name: str
+        :param content: the content of the file.
+        :type content: str
+        :param mtime: the modification time to give the file.
+        :type mtime: int or None
+        :param headers: the headers of the response the content came in,
+                        to keep its validators.
+        :type headers: dict or None
+        :param mode: the permissions of the file.
+        :type mode: int
+        :param url: the url the content was downloaded from.
+        :type url: str or None
+        """
+        if isinstance(content, unicode):
+            content = content.encode("utf-8")
+        validators = {}
+        for header in VALIDATOR_HEADERS:
+            value = headers.get(header) if headers is not None else None
+            if value:
+                validators[header] = value
+        self._files.append((name, content, mtime, url, validators, mode))
+
+    def commit(self):
+        """
+        Write the files of the transaction to disk.
+        """
+        if self._files:
+            self._store._commit(self._files)
+        self._files = []
+
+    def abort(self):
+        """
+        Drop the files of the transaction.
+        """
+        self._files = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+
+
+class ArtifactStore(object):
+    """
+    The files of a provider directory, and their manifest.
+    """
+
+    def __init__(self, root):
+        """
+        :param root: the absolute path of the provider directory.
+        :type root: str
+        """
+        self._root = root
+        self._lock = Lock()
+        # {name: entry}, None until read
+        self._manifest = None
+        # {"at": time, "files": {name: sha256}}, None until read
+        self._verified = None
+        self.commits = 0
+
+    def _path(self, name):
+        return os.path.join(self._root, name)
+
+    def get_name(self, path):
+        """
+        Return the name in this store of the file at `path`.
+
+        :param path: the absolute path of a file in the provider directory.
+        :type path: str
+
+        :rtype: str
+        """
+        name = os.path.relpath(path, self._root)
+        if name.startswith(os.pardir):
+            raise ValueError("%s is not in %s" % (path, self._root))
+        return name
+
+    def _load_manifest(self):
+        """
+        Read the manifest, the first time only.
+
+        Must be called with the lock held.
+        """
+        if self._manifest is not None:
+            return
+        self._manifest = {}
+        try:
+            with open(self._path(MANIFEST)) as f:
+                self._manifest = json.load(f)
+        except IOError:
+            pass
+        except ValueError as e:
+            # it's only written with a rename, but don't trust it if broken.
+            logger.warning("Ignoring a broken manifest in %s: %r"
+                           % (self._root, e))
+
+    def transaction(self):
+        """
+        Start a transaction on this store.
+
+        :rtype: ArtifactTransaction
+        """
+        return ArtifactTransaction(self)
+
+    def _commit(self, files):
+        """
+        Write the files, see the module docstring.
+
+        :param files: the files of a transaction.
+        :type files: list
+        """
+        now = time.time()
+        with self._lock:
+            self._load_manifest()
+            manifest = dict(self._manifest)
+            staged = []
+            try:
+                for name, content, mtime, url, validators, mode in files:
+                    path = self._path(name)
+                    mkdir_p(os.path.dirname(path))
+                    # a leftover of a crash is just overwritten.
+                    tmp_path = path + ".tmp"
+                    staged.append((path, tmp_path))
+                    # created with the mode, the keys are never readable by
+                    # others, not even for a moment.
+                    fd = os.open(tmp_path,
+                                 os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode)
+                    with os.fdopen(fd, "wb") as f:
+                        f.write(content)
+                    if mtime:
+                        os.utime(tmp_path, (mtime, mtime))
+                    # a leftover tmp file keeps its old mode.
+                    os.chmod(tmp_path, mode)
+
+                # every file is complete on disk before any is replaced.
+                for path, tmp_path in staged:
+                    fd = os.open(tmp_path, os.O_RDONLY)
+                    try:
+                        os.fsync(fd)
+                    finally:
+                        os.close(fd)
+
+                for (path, tmp_path), written in zip(staged, files):
+                    name, content, mtime, url, validators, mode = written
+                    _replace(tmp_path, path)
+                    st = os.stat(path)
+                    manifest[name] = {
+                        "sha256": hashlib.sha256(content).hexdigest(),
+                        "size": st.st_size,
+                        "mtime": st.st_mtime,
+                        "url": url,
+                        "validators": validators,
+                        "checked": now,
+                    }
+            except (IOError, OSError):
+                for path, tmp_path in staged:
+                    if os.path.exists(tmp_path):
+                        os.unlink(tmp_path)
+                raise
+
+            for directory in set(os.path.dirname(path)
+                                 for path, tmp_path in staged):
+                _fsync_dir(directory)
+            self._save_manifest(manifest)
+            self._manifest = manifest
+            self.commits += 1
+
+    def _save_manifest(self, manifest):
+        """
+        Replace the manifest file atomically.
+
+        Must be called with the lock held.
+        """
+        # the files are fine, they'll just be missing from the manifest.
+        self._save_json(MANIFEST, manifest)
+
+    def _save_json(self, name, data):
+        """
+        Replace the json file `name` atomically, logging the errors.
+
+        Must be called with the lock held.
+        """
+        path = self._path(name)
+        tmp_path = path + ".tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(data, f, indent=2, sort_keys=True)
+                f.flush()
+                os.fsync(f.fileno())
+            _replace(tmp_path, path)
+        except (IOError, OSError) as e:
+            logger.error("Could not save %s of %s: %r"
+                         % (name, self._root, e))
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+    def get_entry(self, name):
+        """
+        Return the manifest entry of a file if the file is still the one
+        written, checked with a stat against the manifest.
+
+        :param name: the path of the file, relative to the provider
+                     directory.
+        :type name: str
+
+        :returns: a dict with sha256, size, mtime, url, validators and
+                  checked, or None
+                  if the file is missing or changed after it was written.
+        :rtype: dict or None
+        """
+        with self._lock:
+            self._load_manifest()
+            entry = self._manifest.get(name)
+        if entry is None:
+            return None
+        try:
+            st = os.stat(self._path(name))
+        except OSError:
+            return None
+        if st.st_size != entry["size"] or st.st_mtime != entry["mtime"]:
+            return None
+        return dict(entry)
+
+    def get_conditional_headers(self, name, url, mtime=None):
+        """
+        Return the headers to download a file again only if it changed:
+        If-None-Match with its ETag, if it came from the same `url`, and
+        If-Modified-Since with its Last-Modified.
+
+        :param name: the path of the file, relative to the provider
+                     directory.
+        :type name: str
+        :param url: the url the file is going to be downloaded from.
+        :type url: str
+        :param mtime: the If-Modified-Since to use for a file that has no
+                      validators, like the ones written before the manifest.
+        :type mtime: int or None
+
+        :rtype: dict
+        """
+        headers = {}
+        entry = self.get_entry(name)
+        if entry is not None:
+            validators = entry.get("validators", {})
+            # an ETag only means something to the server that made it.
+            if "etag" in validators and entry.get("url") == url:
+                headers["if-none-match"] = validators["etag"]
+            if "last-modified" in validators:
+                headers["if-modified-since"] = validators["last-modified"]
+        if mtime and "if-modified-since" not in headers:
+            headers["if-modified-since"] = mtime
+        return headers
+
+    def mark_fresh(self, name, now=None):
+        """
+        Record that the server said the file is still current, on a 304.
+
+        :param name: the path of the file, relative to the provider
+                     directory.
+        :type name: str
+        :param now: the current time, in seconds since the epoch.
+        :type now: float or None
+        """
+        if now is None:
+            now = time.time()
+        if self.get_entry(name) is None:
+            # not written by the store, there's nothing to keep it in.
+            return
+        with self._lock:
+            manifest = dict(self._manifest)
+            manifest[name] = dict(manifest[name], checked=now)
+            self._save_manifest(manifest)
+            self._manifest = manifest
+
+    def is_fresh(self, name, max_age, now=None):
+        """
+        Return whether the file was downloaded, or found current by the
+        server, less than `max_age` seconds ago, and didn't change since.
+
+        :param name: the path of the file, relative to the provider
+                     directory.
+        :type name: str
+        :param max_age: how long a file is fresh, in seconds.
+        :type max_age: int
+        :param now: the current time, in seconds since the epoch.
+        :type now: float or None
+
+        :rtype: bool
+        """
+        if now is None:
+            now = time.time()
+        entry = self.get_entry(name)
+        if entry is None or entry.get("checked") is None:
+            return False
+        return entry["checked"] <= now < entry["checked"] + max_age
+
+    def _get_digest(self, name):
+        """
+        Return the sha256 of a file, from the manifest if the file is still
+        the one written, or hashing it if it's not in the manifest.
+
+        :rtype: str or None if the file doesn't exist.
+        """
+        entry = self.get_entry(name)
+        if entry is not None:
+            return entry["sha256"]
+        # written before the manifest existed, or changed since.
+        try:
+            with open(self._path(name), "rb") as f:
+                return hashlib.sha256(f.read()).hexdigest()
+        except IOError:
+            return None
+
+    def _load_verified(self):
+        """
+        Read the verified record, the first time only.
+
+        Must be called with the lock held.
+        """
+        if self._verified is not None:
+            return
+        self._verified = {}
+        try:
+            with open(self._path(VERIFIED)) as f:
+                self._verified = json.load(f)
+        except IOError:
+            pass
+        except ValueError as e:
+            logger.warning("Ignoring a broken verified record in %s: %r"
+                           % (self._root, e))
+
+    def mark_verified(self, names, now=None):
+        """
+        Record that the files `names`, as they are now, passed the checks.
+
+        :param names: the paths of the files, relative to the provider
+                      directory.
+        :type names: list of str
+        :param now: the current time, in seconds since the epoch.
+        :type now: float or None
+        """
+        if now is None:
+            now = time.time()
+        files = {}
+        for name in names:
+            digest = self._get_digest(name)
+            if digest is None:
+                logger.warning("Can't record %s as verified, it doesn't "
+                               "exist." % (name,))
+                return
+            files[name] = digest
+
+        record = {"at": now, "files": files}
+        with self._lock:
+            self._save_json(VERIFIED, record)
+            self._verified = record
+
+    def is_verified(self, names, ttl, now=None):
+        """
+        Return whether the files `names` passed the checks less than `ttl`
+        seconds ago and didn't change since.
+
+        :param names: the paths of the files, relative to the provider
+                      directory.
+        :type names: list of str
+        :param ttl: how long a verification lasts, in seconds.
+        :type ttl: int
+        :param now: the current time, in seconds since the epoch.
+        :type now: float or None
+
+        :rtype: bool
+        """
+        if now is None:
+            now = time.time()
+        with self._lock:
+            self._load_verified()
+            record = self._verified
+        verified_at = record.get("at")
+        files = record.get("files", {})
+        # a clock that went back doesn't make a record last longer.
+        if verified_at is None or not verified_at <= now < verified_at + ttl:
+            return False
+        for name in names:
+            if name not in files or self._get_digest(name) != files[name]:
+                return False
+        return True
+
+_stores = {}
+_stores_lock = Lock()
+
+
+def get_store(domain):
+    """
+    Return the store for the directory of the provider `domain`.
+
+    :param domain: the domain of the provider.
+    :type domain: str
+
+    :rtype: ArtifactStore
+    """
+    root = os.path.join(util.get_path_prefix(), "leap", "providers", domain)
+    with _stores_lock:
+        store = _stores.get(root)
+        if store is None:
+            store = ArtifactStore(root)
+            _stores[root] = store
+        return store
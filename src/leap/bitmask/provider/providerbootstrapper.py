@@ -18,24 +18,31 @@
 Provider bootstrapping
 """
 import logging
-import socket
 import os
 import sys
 
+from functools import partial
+
 import requests
 
+from twisted.internet import defer
+from twisted.internet.defer import CancelledError
+from twisted.python.failure import Failure
+
 from leap.bitmask import provider
 from leap.bitmask import util
-from leap.bitmask.config import flags
+from leap.bitmask.config import configcache, flags, providerindex
+from leap.bitmask.config.leapsettings import LeapSettings
 from leap.bitmask.config.providerconfig import ProviderConfig, MissingCACert
-from leap.bitmask.provider import get_provider_path
+from leap.bitmask.provider import artifacts, get_provider_path
 from leap.bitmask.services.abstractbootstrapper import AbstractBootstrapper
-from leap.bitmask.util.constants import REQUEST_TIMEOUT
+from leap.bitmask.util import agentfetcher, dnscache, threadpools
+from leap.bitmask.util.constants import PROVIDER_FRESH_FOR, REQUEST_TIMEOUT
 from leap.bitmask.util.request_helpers import get_content
 from leap.common import ca_bundle
 from leap.common.certs import get_digest
 from leap.common.check import leap_assert, leap_assert_type, leap_check
-from leap.common.files import check_and_fix_urw_only, get_mtime, mkdir_p
+from leap.common.files import check_and_fix_urw_only, get_mtime
 
 logger = logging.getLogger(__name__)
 
@@ -118,11 +125,10 @@ class ProviderBootstrapper(AbstractBootstrapper):
         leap_assert(self._domain, "Cannot check DNS without a domain")
         logger.debug("Checking name resolution for %r" % (self._domain))
 
-        # We don't skip this check, since it's basic for the whole
-        # system to work
-        # err --- but we can do it after a failure, to diagnose what went
-        # wrong. Right now we're just adding connection overhead. -- kali
-        socket.gethostbyname(self._domain.encode('idna'))
+        # The select checks only run it to diagnose a failed download, or
+        # along with it. See run_provider_select_checks.
+        # The address stays cached for the downloads that follow.
+        dnscache.resolve_blocking(self._domain)
 
     def _check_https(self, *args):
         """
@@ -132,10 +138,8 @@ class ProviderBootstrapper(AbstractBootstrapper):
         leap_assert(self._domain, "Cannot check HTTPS without a domain")
         logger.debug("Checking https for %r" % (self._domain))
 
-        # We don't skip this check, since it's basic for the whole
-        # system to work.
-        # err --- but we can do it after a failure, to diagnose what went
-        # wrong. Right now we're just adding connection overhead. -- kali
+        # The select checks only run it to diagnose a failed download, or
+        # along with it. See run_provider_select_checks.
 
         verify = self.verify
         if verify:
@@ -159,9 +163,13 @@ class ProviderBootstrapper(AbstractBootstrapper):
             self._err_msg = self.tr("Provider does not support HTTPS")
             raise
 
-    def _download_provider_info(self, *args):
+    def _get_provider_info_request(self):
         """
-        Downloads the provider.json defition
+        Returns what to request to download the provider.json, or None if
+        it was checked recently and it doesn't need to be downloaded.
+
+        :returns: the uri, the verify parameter and the headers.
+        :rtype: tuple(unicode, bool or str, dict) or None
         """
         leap_assert(self._domain,
                     "Cannot download provider info without a domain")
@@ -177,9 +185,12 @@ class ProviderBootstrapper(AbstractBootstrapper):
                                      get_provider_path(domain))
 
         mtime = get_mtime(provider_json)
+        store = artifacts.get_store(domain)
 
-        if self._download_if_needed and mtime:
-            headers['if-modified-since'] = mtime
+        if self._provider_json_is_fresh():
+            logger.debug("Provider definition checked recently, not "
+                         "downloading it")
+            return None
 
         uri = "https://%s/%s" % (self._domain, "provider.json")
         verify = self.verify
@@ -187,30 +198,90 @@ class ProviderBootstrapper(AbstractBootstrapper):
         if mtime:  # the provider.json exists
         # So, we're getting it from the api.* and checking against
         # the provider ca.
+            # the config parsed the last time, unless the file changed.
+            provider_config = configcache.load(ProviderConfig,
+                                               get_provider_path(domain))
             try:
-                provider_config = ProviderConfig()
-                provider_config.load(provider_json)
-                uri = provider_config.get_api_uri() + '/provider.json'
-                verify = provider_config.get_ca_cert_path()
+                if provider_config is not None:
+                    uri = provider_config.get_api_uri() + '/provider.json'
+                    verify = provider_config.get_ca_cert_path()
             except MissingCACert:
                 # no ca? then download from main domain again.
                 pass
 
+        if self._download_if_needed and mtime:
+            # the ETag and Last-Modified it came with, if it wasn't touched
+            # since.
+            headers.update(store.get_conditional_headers("provider.json", uri,
+                                                         mtime))
+
         if verify:
             verify = verify.encode(sys.getfilesystemencoding())
         logger.debug("Requesting for provider.json... "
                      "uri: {0}, verify: {1}, headers: {2}".format(
                          uri, verify, headers))
+        return uri, verify, headers
+
+    def _download_provider_info(self, *args):
+        """
+        Downloads the provider.json defition
+        """
+        request = self._get_provider_info_request()
+        if request is None:
+            return
+
+        uri, verify, headers = request
         res = self._session.get(uri.encode('idna'), verify=verify,
                                 headers=headers, timeout=REQUEST_TIMEOUT)
+        self._save_provider_info(res, uri)
+
+    def _fetch_provider_info(self):
+        """
+        Downloads the provider.json defition like _download_provider_info,
+        with a session that can fetch in the reactor: no thread waits for
+        the response, and cancelling the defer aborts the request. The files
+        are read and written in the THREAD_POOL pool.
+
+        :returns: the defer with the download
+        :rtype: deferred
+        """
+        def fetch(request):
+            if request is None:
+                return
+            uri, verify, headers = request
+            d = agentfetcher.call_in_reactor(
+                self._session.fetch, "GET", uri.encode('idna'),
+                verify=verify, headers=headers, timeout=REQUEST_TIMEOUT)
+            d.addCallback(partial(self._callback_threader,
+                                  self._save_provider_info), uri)
+            return d
+
+        d = threadpools.defer_to_pool(self.THREAD_POOL,
+                                      self._get_provider_info_request)
+        d.addCallback(fetch)
+        return d
+
+    def _save_provider_info(self, res, uri):
+        """
+        Checks the response to the provider.json request, and saves the
+        provider.json if it changed.
+
+        :param res: the response.
+        :type res: requests.Response
+        :param uri: the uri requested.
+        :type uri: unicode
+        """
         res.raise_for_status()
         logger.debug("Request status code: {0}".format(res.status_code))
 
+        domain = self._domain.encode(sys.getfilesystemencoding())
+        store = artifacts.get_store(domain)
         min_client_version = res.headers.get(self.MIN_CLIENT_VERSION, '0')
 
         # Not modified
         if res.status_code == 304:
             logger.debug("Provider definition has not been modified")
+            store.mark_fresh("provider.json")
         # --------------------------------------------------------------
         # end refactor, more or less...
         # XXX Watch out, have to check the supported api yet.
@@ -226,8 +297,12 @@ class ProviderBootstrapper(AbstractBootstrapper):
 
             provider_config = ProviderConfig()
             provider_config.load(data=provider_definition, mtime=mtime)
-            provider_config.save(["leap", "providers",
-                                  domain, "provider.json"])
+            with store.transaction() as txn:
+                txn.write("provider.json", provider_definition, mtime=mtime,
+                          headers=res.headers, url=uri)
+            configcache.put(ProviderConfig, get_provider_path(domain),
+                            provider_config)
+            providerindex.refresh(domain)
 
             if flags.API_VERSION_CHECK:
                 # TODO split
@@ -246,7 +321,18 @@ class ProviderBootstrapper(AbstractBootstrapper):
 
     def run_provider_select_checks(self, domain, download_if_needed=False):
         """
-        Populates the check queue.
+        Runs the provider select checks: name resolution, https and the
+        provider.json download.
+
+        The download starts right away. The first time a provider is
+        selected the provider.json comes from the domain itself, so a
+        download that works proves the other two checks too, and they only
+        run after a failure, to tell what went wrong. Otherwise the
+        provider.json comes from the api, and the domain is checked at the
+        same time as the download.
+
+        The result of each check is signaled in the same order as if they
+        ran one after the other.
 
         :param domain: domain to check
         :type domain: unicode
@@ -254,21 +340,123 @@ class ProviderBootstrapper(AbstractBootstrapper):
         :param download_if_needed: if True, makes the checks do not
                                    overwrite already downloaded data
         :type download_if_needed: bool
+
+        :returns: the defer with the checks
+        :rtype: deferred
         """
         leap_assert(domain and len(domain) > 0, "We need a domain!")
 
         self._domain = ProviderConfig.sanitize_path_component(domain)
         self._download_if_needed = download_if_needed
+        self._signal_to_emit = None
+        self._err_msg = None
+
+        diagnostics = None
+        provider_json = os.path.join(
+            util.get_path_prefix(),
+            get_provider_path(
+                self._domain.encode(sys.getfilesystemencoding())))
+        if os.path.isfile(provider_json) and \
+                not self._provider_json_is_fresh():
+            # the download goes to the api, it says nothing of the domain.
+            diagnostics = threadpools.defer_to_pool(self.THREAD_POOL,
+                                                    self._diagnose)
+
+        if agentfetcher.can_fetch(self._session):
+            d = self._fetch_provider_info()
+        else:
+            d = threadpools.defer_to_pool(self.THREAD_POOL,
+                                          self._download_provider_info)
+        d.addBoth(self._wait_diagnostics, diagnostics)
+        d.addErrback(self._gui_errback)
+        return d
 
-        cb_chain = [
+    def _provider_json_is_fresh(self):
+        """
+        Returns True if the provider.json doesn't need to be downloaded: it
+        was found current recently, by a login or by the background
+        refresher, see provider/refresher.py
+
+        :rtype: bool
+        """
+        if not self._download_if_needed:
+            return False
+        store = artifacts.get_store(
+            self._domain.encode(sys.getfilesystemencoding()))
+        return store.is_fresh("provider.json", PROVIDER_FRESH_FOR)
+
+    def _diagnose(self):
+        """
+        Runs the name resolution and https checks, one after the other.
+
+        :returns: None if both pass, or the signal of the one that failed
+                  and its failure.
+        :rtype: None or tuple(str, Failure)
+        """
+        checks = (
             (self._check_name_resolution,
              self._signaler.PROV_NAME_RESOLUTION_KEY),
             (self._check_https, self._signaler.PROV_HTTPS_CONNECTION_KEY),
-            (self._download_provider_info,
-             self._signaler.PROV_DOWNLOAD_PROVIDER_INFO_KEY)
-        ]
+        )
+        for check, signal in checks:
+            try:
+                check()
+            except Exception:
+                return signal, Failure()
+        return None
 
-        return self.addCallbackChain(cb_chain)
+    def _wait_diagnostics(self, result, diagnostics):
+        """
+        Called with the result of the download. Waits for the diagnostics,
+        running them first if the download failed and they weren't.
+
+        :param result: the result of _download_provider_info.
+        :type result: None or Failure
+        :param diagnostics: the defer of the diagnostics, if they run.
+        :type diagnostics: deferred or None
+        """
+        if isinstance(result, Failure) and result.check(CancelledError):
+            return result
+
+        if diagnostics is None:
+            if not isinstance(result, Failure):
+                # it came from the domain: it resolves and https works.
+                self._report_select_checks(None, result)
+                return
+            diagnostics = threadpools.defer_to_pool(self.THREAD_POOL,
+                                                    self._diagnose)
+
+        diagnostics.addCallback(self._report_select_checks, result)
+        return diagnostics
+
+    def _report_select_checks(self, diagnosis, result):
+        """
+        Signals the result of the select checks, in their order.
+
+        :param diagnosis: what _diagnose returned.
+        :type diagnosis: None or tuple(str, Failure)
+        :param result: the result of _download_provider_info.
+        :type result: None or Failure
+
+        :returns: the failure of the first check that failed, if any.
+        :rtype: None or Failure
+        """
+        steps = [
+            (self._signaler.PROV_NAME_RESOLUTION_KEY, None),
+            (self._signaler.PROV_HTTPS_CONNECTION_KEY, None),
+            (self._signaler.PROV_DOWNLOAD_PROVIDER_INFO_KEY, result),
+        ]
+        if diagnosis is not None:
+            failed_signal, failure = diagnosis
+            steps = [(signal, failure if signal == failed_signal else None)
+                     for signal, _ in steps]
+
+        for signal, failure in steps:
+            if isinstance(failure, Failure):
+                # _gui_errback signals it.
+                self._signal_to_emit = signal
+                return failure
+            self._gui_notify(None, signal=signal)
 
     def _should_proceed_cert(self):
         """
@@ -285,12 +473,56 @@ class ProviderBootstrapper(AbstractBootstrapper):
         return not os.path.exists(self._provider_config
                                   .get_ca_cert_path(about_to_download=True))
 
+    def _get_verified_files(self):
+        """
+        Returns the store of the provider and the files the setup checks
+        verify: its provider.json and its CA cert.
+
+        :rtype: tuple(ArtifactStore, tuple of str)
+        """
+        store = artifacts.get_store(self._provider_config.get_domain())
+        cert_path = self._provider_config.get_ca_cert_path(
+            about_to_download=True)
+        return store, ("provider.json", store.get_name(cert_path))
+
+    def _is_verified(self):
+        """
+        Returns True if the provider passed the setup checks less than the
+        configured TTL ago, and its provider.json and CA cert didn't change
+        since.
+
+        :rtype: bool
+        """
+        store, names = self._get_verified_files()
+        ttl = LeapSettings().get_provider_verified_ttl()
+        return store.is_verified(names, ttl)
+
+    def _should_check_cert(self):
+        """
+        Returns True if the CA cert has to be checked: it's downloaded now,
+        or it wasn't verified recently against the current provider.json.
+
+        :rtype: bool
+        """
+        return self._should_proceed_cert() or not self._is_verified()
+
+    def _mark_verified(self, *args):
+        """
+        Records that the provider passed the setup checks, so the next
+        logins can skip them.
+        """
+        try:
+            store, names = self._get_verified_files()
+            store.mark_verified(names)
+        except Exception as e:
+            # the checks passed, the next login just runs them again.
+            logger.warning("Could not record %r as verified: %r"
+                           % (self._domain, e))
+
     def _download_ca_cert(self, *args):
         """
         Downloads the CA cert that is going to be used for the api URL
         """
-        # XXX maybe we can skip this step if
-        # we have a fresh one.
         leap_assert(self._provider_config, "Cannot download the ca cert "
                     "without a provider config!")
 
@@ -308,14 +540,13 @@ class ProviderBootstrapper(AbstractBootstrapper):
                                 timeout=REQUEST_TIMEOUT)
         res.raise_for_status()
 
+        store = artifacts.get_store(self._provider_config.get_domain())
         cert_path = self._provider_config.get_ca_cert_path(
             about_to_download=True)
-        cert_dir = os.path.dirname(cert_path)
-        mkdir_p(cert_dir)
-        with open(cert_path, "w") as f:
-            f.write(res.content)
-
-        check_and_fix_urw_only(cert_path)
+        with store.transaction() as txn:
+            txn.write(store.get_name(cert_path), res.content,
+                      headers=res.headers)
+        providerindex.refresh(self._domain)
 
     def _check_ca_fingerprint(self, *args):
         """
@@ -329,7 +560,7 @@ class ProviderBootstrapper(AbstractBootstrapper):
                      (self._domain,
                       self._provider_config.get_ca_cert_path()))
 
-        if not self._should_proceed_cert():
+        if not self._should_check_cert():
             return
 
         parts = self._provider_config.get_ca_cert_fingerprint().split(":")
@@ -361,7 +592,7 @@ class ProviderBootstrapper(AbstractBootstrapper):
                      (self._provider_config.get_api_uri(),
                       self._provider_config.get_ca_cert_path()))
 
-        if not self._should_proceed_cert():
+        if not self._should_check_cert():
             return
 
         test_uri = "%s/%s/cert" % (self._provider_config.get_api_uri(),
@@ -382,7 +613,9 @@ class ProviderBootstrapper(AbstractBootstrapper):
         :type provider_config: ProviderConfig
 
         :param download_if_needed: if True, makes the checks do not
-                                   overwrite already downloaded data.
+                                   overwrite already downloaded data, and
+                                   skips them if the provider was verified
+                                   recently and didn't change since.
         :type download_if_needed: bool
         """
         leap_assert(provider_config, "We need a provider config!")
@@ -396,7 +629,17 @@ class ProviderBootstrapper(AbstractBootstrapper):
             (self._check_ca_fingerprint,
              self._signaler.PROV_CHECK_CA_FINGERPRINT_KEY),
             (self._check_api_certificate,
-             self._signaler.PROV_CHECK_API_CERTIFICATE_KEY)
+             self._signaler.PROV_CHECK_API_CERTIFICATE_KEY),
+            (self._mark_verified, None)
         ]
 
+        if download_if_needed and self._is_verified():
+            logger.debug("%r was verified recently, skipping the setup "
+                         "checks." % (self._domain,))
+            self._signal_to_emit = None
+            self._err_msg = None
+            for cb, signal in cb_chain:
+                self._gui_notify(None, signal)
+            return defer.succeed(None)
+
         return self.addCallbackChain(cb_chain)
@@ -0,0 +1,352 @@
+# -*- coding: utf-8 -*-
+# refresher.py
+# Copyright (C) 2014 LEAP
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Background refresh of the files of the configured providers.
+
+A while after startup, and then every PROVIDER_REFRESH_INTERVAL, the
+provider.json and the service configs of every configured provider are
+revalidated with conditional requests. A file the server says is current
+is marked fresh, a new version is written like the bootstrappers do, so
+the next login finds them fresh and doesn't download anything (see
+ArtifactStore.is_fresh).
+
+The downloads run in their own thread pool, that bounds how many run at
+once, and the requests to the same host go one at a time and HOST_DELAY
+seconds apart.
+"""
+import logging
+import os
+import sys
+import time
+
+from urlparse import urlparse
+
+import requests
+
+from twisted.internet import defer, reactor, task
+
+from leap.bitmask import provider
+from leap.bitmask import util
+from leap.bitmask.config import configcache, flags, providerindex
+from leap.bitmask.config.providerconfig import MissingCACert, ProviderConfig
+from leap.bitmask.provider import artifacts, get_provider_path
+from leap.bitmask.provider.providerbootstrapper import ProviderBootstrapper
+from leap.bitmask.util import httppool, threadpools
+from leap.bitmask.util.constants import (PROVIDER_REFRESH_INTERVAL,
+                                         REQUEST_TIMEOUT)
+from leap.bitmask.util.request_helpers import get_content
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait after startup, not to slow it down.
+START_DELAY = 30
+# Seconds between two requests to the same host.
+HOST_DELAY = 1.0
+
+
+def _get_service_configs():
+    """
+    Return the classes of the service configs that are refreshed.
+
+    :rtype: list of type
+    """
+    from leap.bitmask.services.eip.eipconfig import EIPConfig
+    from leap.bitmask.services.mail.smtpconfig import SMTPConfig
+    from leap.bitmask.services.soledad.soledadconfig import SoledadConfig
+    return [EIPConfig, SMTPConfig, SoledadConfig]
+
+
+class RefreshJob(object):
+    """
+    A provider file to revalidate.
+    """
+
+    def __init__(self, domain, name, url, verify, config_class,
+                 api_version=None):
+        """
+        :param domain: the domain of the provider.
+        :type domain: str
+        :param name: the path of the file, relative to the provider
+                     directory.
+        :type name: str
+        :param url: the url to download it from.
+        :type url: str
+        :param verify: the CA cert to verify the server with.
+        :type verify: str
+        :param config_class: the class to load the file with.
+        :type config_class: type
+        :param api_version: the api version of the provider, for the
+                            service configs.
+        :type api_version: str or None
+        """
+        self.domain = domain
+        self.name = name
+        self.url = url
+        self.verify = verify
+        self.config_class = config_class
+        self.api_version = api_version
+
+    @property
+    def host(self):
+        return urlparse(self.url).netloc
+
+    def __repr__(self):
+        return "<RefreshJob %s %s>" % (self.domain, self.name)
+
+
+class ProviderRefresher(object):
+    """
+    Revalidates the files of the configured providers in the background.
+    """
+
+    def __init__(self, index=None, interval=PROVIDER_REFRESH_INTERVAL,
+                 host_delay=HOST_DELAY):
+        """
+        :param index: the index of the configured providers, the one of
+                      this installation by default.
+        :type index: ProviderIndex or None
+        :param interval: seconds between two refreshes.
+        :type interval: int
+        :param host_delay: seconds between two requests to the same host.
+        :type host_delay: float
+        """
+        self._index = index
+        self._interval = interval
+        self._host_delay = host_delay
+
+        # **************************************************** #
+        # Dependency injection helpers, override this for more
+        # granular testing
+        self._fetcher = requests
+        # **************************************************** #
+
+        self._session = httppool.mount(self._fetcher.session())
+        # {host: DeferredLock}, one request at a time to each host
+        self._host_locks = {}
+        # {host: time of the end of the last request}
+        self._last_request = {}
+        self._loop = None
+        self._start_call = None
+        self._running = None
+
+        self.refreshes = 0
+        self.checked = 0
+        self.updated = 0
+        self.errors = 0
+
+    def start(self):
+        """
+        Refresh START_DELAY seconds from now, and then every interval.
+
+        Must be called from the reactor thread.
+        """
+        if self._loop is not None or flags.OFFLINE:
+            return
+        self._start_call = reactor.callLater(START_DELAY, self.refresh_all)
+        self._loop = task.LoopingCall(self.refresh_all)
+        self._loop.start(self._interval, now=False)
+
+    def stop(self):
+        """
+        Stop refreshing. A refresh on the way still finishes.
+        """
+        if self._start_call is not None and self._start_call.active():
+            self._start_call.cancel()
+        self._start_call = None
+        if self._loop is not None and self._loop.running:
+            self._loop.stop()
+        self._loop = None
+
+    def refresh_all(self):
+        """
+        Revalidate the files of every configured provider.
+
+        Must be called from the reactor thread.
+
+        :returns: a defer that fires when every file was revalidated, or
+                  right away if a refresh is already on the way.
+        :rtype: Deferred
+        """
+        if self._running is not None:
+            return defer.succeed(None)
+
+        d = threadpools.defer_to_pool(threadpools.REFRESH, self._get_jobs)
+        d.addCallback(self._run_jobs)
+        d.addErrback(self._log_error, "Error refreshing the providers")
+
+        def done(result):
+            self._running = None
+            self.refreshes += 1
+            return result
+        d.addBoth(done)
+        # it may have finished already.
+        if not d.called:
+            self._running = d
+        return d
+
+    def _get_jobs(self):
+        """
+        Return the files to revalidate, of the providers that finished
+        their setup.
+
+        :rtype: list of RefreshJob
+        """
+        index = self._index or providerindex.get_index()
+        jobs = []
+        for domain in index.get_providers():
+            config = configcache.load(ProviderConfig,
+                                      get_provider_path(domain))
+            if config is None:
+                continue
+            try:
+                verify = config.get_ca_cert_path().encode(
+                    sys.getfilesystemencoding())
+            except MissingCACert:
+                continue
+
+            api_uri = config.get_api_uri()
+            api_version = config.get_api_version()
+            jobs.append(RefreshJob(domain, "provider.json",
+                                   "%s/provider.json" % (api_uri,),
+                                   verify, ProviderConfig))
+
+            provider_dir = os.path.join(util.get_path_prefix(), "leap",
+                                        "providers", domain)
+            for config_class in _get_service_configs():
+                name = "%s-service.json" % (config_class().name,)
+                # only the services in use.
+                if not os.path.isfile(os.path.join(provider_dir, name)):
+                    continue
+                url = "%s/%s/config/%s" % (api_uri, api_version, name)
+                jobs.append(RefreshJob(domain, name, url, verify,
+                                       config_class, api_version))
+        return jobs
+
+    def _run_jobs(self, jobs):
+        """
+        Run the jobs, the ones for the same host one after the other.
+
+        :returns: a defer that fires when they all finished.
+        :rtype: Deferred
+        """
+        ds = []
+        for job in jobs:
+            lock = self._host_locks.get(job.host)
+            if lock is None:
+                lock = self._host_locks[job.host] = defer.DeferredLock()
+            d = lock.run(self._polite_run, job)
+            d.addErrback(self._log_error, "Error refreshing %r" % (job,))
+            ds.append(d)
+        return defer.DeferredList(ds)
+
+    def _polite_run(self, job):
+        """
+        Run a job in the pool once HOST_DELAY passed since the last request
+        to its host. Called with the lock of the host held.
+        """
+        host = job.host
+        wait = self._last_request.get(host, 0) + self._host_delay - \
+            time.time()
+        d = task.deferLater(reactor, max(0, wait),
+                            threadpools.defer_to_pool, threadpools.REFRESH,
+                            self._refresh, job)
+
+        def done(result):
+            self._last_request[host] = time.time()
+            if result is True:
+                self.updated += 1
+            if result in (True, False):
+                self.checked += 1
+            return result
+        d.addBoth(done)
+        return d
+
+    def _refresh(self, job):
+        """
+        Revalidate a file, and write the new version if there's one.
+
+        :returns: whether a new version was written.
+        :rtype: bool
+        """
+        store = artifacts.get_store(job.domain)
+        path = os.path.join("leap", "providers", job.domain, job.name)
+        headers = store.get_conditional_headers(job.name, job.url)
+        res = self._session.get(job.url, verify=job.verify, headers=headers,
+                                timeout=REQUEST_TIMEOUT)
+
+        if res.status_code == 304:
+            store.mark_fresh(job.name)
+            return False
+        if res.status_code in (401, 403):
+            # this service wants a session, the login refreshes it.
+            logger.debug("%r needs to be logged in." % (job,))
+            return False
+        res.raise_for_status()
+
+        content, mtime = get_content(res)
+        config = job.config_class()
+        if job.api_version is not None:
+            config.set_api_version(job.api_version)
+        if not config.load(data=content, mtime=mtime):
+            logger.warning("Not saving an invalid %r." % (job,))
+            return False
+        if not self._is_usable(job, config, res):
+            return False
+
+        with store.transaction() as txn:
+            txn.write(job.name, content, mtime=mtime, headers=res.headers,
+                      url=job.url)
+        configcache.put(job.config_class, path, config, job.api_version)
+        providerindex.refresh(job.domain)
+        logger.debug("Refreshed %r." % (job,))
+        return True
+
+    def _is_usable(self, job, config, res):
+        """
+        Return whether a new provider.json can replace the current one.
+        The ones this client can't use are left to the login, that tells
+        the user why.
+
+        :rtype: bool
+        """
+        if job.config_class is not ProviderConfig:
+            return True
+        if flags.APP_VERSION_CHECK:
+            min_client_version = res.headers.get(
+                ProviderBootstrapper.MIN_CLIENT_VERSION, '0')
+            if not provider.supports_client(min_client_version):
+                return False
+        if flags.API_VERSION_CHECK:
+            if not provider.supports_api(config.get_api_version()):
+                return False
+        return True
+
+    def _log_error(self, failure, message):
+        self.errors += 1
+        logger.warning("%s: %r" % (message, failure.value))
+
+
+# The refresher for this process
+refresher = ProviderRefresher()
+
+
+def start():
+    """
+    Start refreshing the configured providers in the background, see
+    ProviderRefresher.start.
+    """
+    refresher.start()
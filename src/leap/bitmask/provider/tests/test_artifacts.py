@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+# test_artifacts.py
+# Copyright (C) 2014 LEAP
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Tests for the artifacts module.
+"""
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+import hashlib
+import json
+import os
+import shutil
+import stat
+import tempfile
+
+import mock
+
+from leap.common.testing.basetest import BaseLeapTest
+from leap.bitmask.provider.artifacts import ArtifactStore, MANIFEST
+
+LAST_MODIFIED = "Tue, 01 Apr 2014 10:00:00 GMT"
+
+
+class ArtifactStoreTest(BaseLeapTest):
+    """Tests for ArtifactStore"""
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self.store = ArtifactStore(self._dir)
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def _read(self, name):
+        with open(os.path.join(self._dir, name)) as f:
+            return f.read()
+
+    def test_transaction(self):
+        cert = os.path.join("keys", "ca", "cacert.pem")
+        with self.store.transaction() as txn:
+            txn.write("eip-service.json", '{"serial": 1}', mtime=1000,
+                      headers={"last-modified": LAST_MODIFIED,
+                               "content-type": "application/json"})
+            txn.write(cert, "CERT")
+
+        self.assertEqual(self._read("eip-service.json"), '{"serial": 1}')
+        self.assertEqual(self._read(cert), "CERT")
+        path = os.path.join(self._dir, cert)
+        self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0600)
+        self.assertEqual(os.path.getmtime(
+            os.path.join(self._dir, "eip-service.json")), 1000)
+        self.assertEqual(self.store.commits, 1)
+
+        entry = self.store.get_entry("eip-service.json")
+        self.assertEqual(entry["sha256"],
+                         hashlib.sha256('{"serial": 1}').hexdigest())
+        self.assertEqual(entry["validators"],
+                         {"last-modified": LAST_MODIFIED})
+        self.assertEqual(self.store.get_entry(cert)["validators"], {})
+
+        # a new store reads the manifest from disk
+        with open(os.path.join(self._dir, MANIFEST)) as f:
+            self.assertEqual(sorted(json.load(f)), sorted([
+                "eip-service.json", cert]))
+        self.assertIsNotNone(ArtifactStore(self._dir).get_entry(cert))
+
+    def test_failed_block_writes_nothing(self):
+        with self.assertRaises(RuntimeError):
+            with self.store.transaction() as txn:
+                txn.write("provider.json", "{}")
+                raise RuntimeError()
+        self.assertFalse(os.path.exists(
+            os.path.join(self._dir, "provider.json")))
+        self.assertEqual(self.store.commits, 0)
+
+    def test_failed_rename_keeps_old_file(self):
+        with self.store.transaction() as txn:
+            txn.write("eip-service.json", "old")
+
+        with mock.patch("os.rename", side_effect=OSError()):
+            with self.assertRaises(OSError):
+                with self.store.transaction() as txn:
+                    txn.write("eip-service.json", "new")
+
+        self.assertEqual(self._read("eip-service.json"), "old")
+        self.assertFalse(os.path.exists(
+            os.path.join(self._dir, "eip-service.json.tmp")))
+        self.assertEqual(self.store.get_entry("eip-service.json")["sha256"],
+                         hashlib.sha256("old").hexdigest())
+
+    def test_changed_file_has_no_entry(self):
+        with self.store.transaction() as txn:
+            txn.write("provider.json", "{}",
+                      headers={"last-modified": LAST_MODIFIED})
+        with open(os.path.join(self._dir, "provider.json"), "w") as f:
+            f.write('{"changed": true}')
+
+        self.assertIsNone(self.store.get_entry("provider.json"))
+        self.assertEqual(self.store.get_conditional_headers(
+            "provider.json", "https://example.org/provider.json"), {})
+
+    def test_conditional_headers(self):
+        url = "https://api.example.org/1/config/eip-service.json"
+        with self.store.transaction() as txn:
+            txn.write("eip-service.json", "{}", url=url,
+                      headers={"last-modified": LAST_MODIFIED,
+                               "etag": '"abc"'})
+
+        self.assertEqual(
+            self.store.get_conditional_headers("eip-service.json", url),
+            {"if-none-match": '"abc"', "if-modified-since": LAST_MODIFIED})
+        # the etag of another server is not sent
+        self.assertEqual(
+            self.store.get_conditional_headers("eip-service.json",
+                                               "https://example.org/x", 10),
+            {"if-modified-since": LAST_MODIFIED})
+        # a file without validators falls back to its mtime
+        self.assertEqual(
+            self.store.get_conditional_headers("provider.json", url, 10),
+            {"if-modified-since": 10})
+        self.assertEqual(
+            self.store.get_conditional_headers("provider.json", url), {})
+
+    def test_verified(self):
+        cert = os.path.join("keys", "ca", "cacert.pem")
+        names = ("provider.json", cert)
+        with self.store.transaction() as txn:
+            txn.write("provider.json", "{}")
+        # written before the manifest, it's hashed
+        os.makedirs(os.path.join(self._dir, "keys", "ca"))
+        with open(os.path.join(self._dir, cert), "w") as f:
+            f.write("CERT")
+
+        self.assertFalse(self.store.is_verified(names, 100, now=1000))
+        self.store.mark_verified(names, now=1000)
+        self.assertTrue(self.store.is_verified(names, 100, now=1050))
+        self.assertTrue(ArtifactStore(self._dir).is_verified(
+            names, 100, now=1050))
+        # too old, or from the future
+        self.assertFalse(self.store.is_verified(names, 100, now=1100))
+        self.assertFalse(self.store.is_verified(names, 100, now=900))
+
+        with self.store.transaction() as txn:
+            txn.write("provider.json", '{"changed": true}')
+        self.assertFalse(self.store.is_verified(names, 100, now=1050))
+
+    def test_get_name(self):
+        path = os.path.join(self._dir, "keys", "client", "openvpn.pem")
+        self.assertEqual(self.store.get_name(path),
+                         os.path.join("keys", "client", "openvpn.pem"))
+        self.assertRaises(ValueError, self.store.get_name, "/tmp/other.pem")
+
+
+if __name__ == "__main__":
+    unittest.main()
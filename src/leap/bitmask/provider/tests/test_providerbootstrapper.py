@@ -38,12 +38,14 @@ from requests.models import Response
 
 from leap.bitmask import provider
 from leap.bitmask import util
-from leap.bitmask.backend import Signaler
+from leap.bitmask.signaler_qt import Signaler
 from leap.bitmask.config.providerconfig import ProviderConfig
+from leap.bitmask.provider import artifacts
 from leap.bitmask.crypto.tests import fake_provider
 from leap.bitmask.provider.providerbootstrapper import ProviderBootstrapper
 from leap.bitmask.provider.providerbootstrapper import UnsupportedProviderAPI
 from leap.bitmask.provider.providerbootstrapper import WrongFingerprint
+from leap.bitmask.util import agentfetcher
 from leap.common.files import mkdir_p
 from leap.common.testing.basetest import BaseLeapTest
 from leap.common.testing.https_server import where
@@ -68,8 +70,19 @@ class ProviderBootstrapperTest(BaseLeapTest):
         with self.assertRaises((socket.gaierror, socket.error)):
             self.pb._check_name_resolution()
 
+    def _get_signaled(self):
+        """
+        Returns the signals emitted by the bootstrapper, and whether each
+        one passed.
+
+        :rtype: list of tuple(str, bool)
+        """
+        return [(args[0], args[1][self.pb.PASSED_KEY])
+                for args, kwargs in self.pb._signaler.signal.call_args_list]
+
     @deferred()
     def test_run_provider_select_checks(self):
+        self.pb._signaler.signal = mock.MagicMock()
         self.pb._check_name_resolution = mock.MagicMock()
         self.pb._check_https = mock.MagicMock()
         self.pb._download_provider_info = mock.MagicMock()
@@ -77,9 +90,58 @@ class ProviderBootstrapperTest(BaseLeapTest):
         d = self.pb.run_provider_select_checks("somedomain")
 
         def check(*args):
+            # the download worked, no need to diagnose anything.
+            self.assertFalse(self.pb._check_name_resolution.called)
+            self.assertFalse(self.pb._check_https.called)
+            self.pb._download_provider_info.assert_called_once_with()
+            sig = self.pb._signaler
+            self.assertEqual(self._get_signaled(), [
+                (sig.PROV_NAME_RESOLUTION_KEY, True),
+                (sig.PROV_HTTPS_CONNECTION_KEY, True),
+                (sig.PROV_DOWNLOAD_PROVIDER_INFO_KEY, True)])
+        d.addCallback(check)
+        return d
+
+    @deferred()
+    def test_run_provider_select_checks_diagnoses_failure(self):
+        self.pb._signaler.signal = mock.MagicMock()
+        self.pb._check_name_resolution = mock.MagicMock()
+        self.pb._check_https = mock.MagicMock(side_effect=Exception())
+        self.pb._download_provider_info = mock.MagicMock(
+            side_effect=Exception())
+
+        d = self.pb.run_provider_select_checks("somedomain")
+
+        def check(*args):
+            self.pb._check_name_resolution.assert_called_once_with()
+            self.pb._check_https.assert_called_once_with()
+            sig = self.pb._signaler
+            self.assertEqual(self._get_signaled(), [
+                (sig.PROV_NAME_RESOLUTION_KEY, True),
+                (sig.PROV_HTTPS_CONNECTION_KEY, False)])
+        d.addCallback(check)
+        return d
+
+    @deferred()
+    def test_run_provider_select_checks_known_provider(self):
+        self.pb._signaler.signal = mock.MagicMock()
+        self.pb._check_name_resolution = mock.MagicMock()
+        self.pb._check_https = mock.MagicMock()
+        self.pb._download_provider_info = mock.MagicMock(
+            side_effect=Exception())
+
+        with mock.patch('os.path.isfile', return_value=True):
+            d = self.pb.run_provider_select_checks("somedomain")
+
+        def check(*args):
+            # provider.json comes from the api, the domain is checked too.
             self.pb._check_name_resolution.assert_called_once_with()
-            self.pb._check_https.assert_called_once_with(None)
-            self.pb._download_provider_info.assert_called_once_with(None)
+            self.pb._check_https.assert_called_once_with()
+            sig = self.pb._signaler
+            self.assertEqual(self._get_signaled(), [
+                (sig.PROV_NAME_RESOLUTION_KEY, True),
+                (sig.PROV_HTTPS_CONNECTION_KEY, True),
+                (sig.PROV_DOWNLOAD_PROVIDER_INFO_KEY, False)])
         d.addCallback(check)
         return d
 
@@ -98,6 +160,37 @@ class ProviderBootstrapperTest(BaseLeapTest):
         d.addCallback(check)
         return d
 
+    def test_run_provider_setup_checks_skips_verified(self):
+        self.pb._signaler.signal = mock.MagicMock()
+        self.pb._download_ca_cert = mock.MagicMock()
+        self.pb._check_ca_fingerprint = mock.MagicMock()
+        self.pb._check_api_certificate = mock.MagicMock()
+        self.pb._is_verified = mock.MagicMock(return_value=True)
+
+        d = self.pb.run_provider_setup_checks(ProviderConfig(),
+                                              download_if_needed=True)
+
+        self.assertTrue(d.called)
+        self.assertFalse(self.pb._download_ca_cert.called)
+        self.assertFalse(self.pb._check_ca_fingerprint.called)
+        self.assertFalse(self.pb._check_api_certificate.called)
+        sig = self.pb._signaler
+        self.assertEqual(self._get_signaled(), [
+            (sig.PROV_DOWNLOAD_CA_CERT_KEY, True),
+            (sig.PROV_CHECK_CA_FINGERPRINT_KEY, True),
+            (sig.PROV_CHECK_API_CERTIFICATE_KEY, True)])
+
+    def test_should_check_cert(self):
+        self.pb._should_proceed_cert = mock.MagicMock(return_value=True)
+        self.pb._is_verified = mock.MagicMock(return_value=True)
+        self.assertTrue(self.pb._should_check_cert())
+
+        self.pb._should_proceed_cert.return_value = False
+        self.assertFalse(self.pb._should_check_cert())
+
+        self.pb._is_verified.return_value = False
+        self.assertTrue(self.pb._should_check_cert())
+
     def test_should_proceed_cert(self):
         self.pb._provider_config = mock.Mock()
         self.pb._provider_config.get_ca_cert_path = mock.MagicMock(
@@ -129,15 +222,21 @@ class ProviderBootstrapperTest(BaseLeapTest):
         """
         old_content = "NOT THE NEW CERT"
         new_content = "NEW CERT"
-        new_cert_path = os.path.join(tempfile.mkdtemp(),
-                                     "mynewcert.pem")
+        path_prefix = tempfile.mkdtemp()
+        cert_dir = os.path.join(path_prefix, "leap", "providers",
+                                "somedomain", "keys", "ca")
+        mkdir_p(cert_dir)
+        new_cert_path = os.path.join(cert_dir, "cacert.pem")
 
         with open(new_cert_path, "w") as c:
             c.write(old_content)
+        os.chmod(new_cert_path, stat.S_IRUSR | stat.S_IWUSR)
 
         self.pb._provider_config = mock.Mock()
         self.pb._provider_config.get_ca_cert_path = mock.MagicMock(
             return_value=new_cert_path)
+        self.pb._provider_config.get_domain = mock.MagicMock(
+            return_value="somedomain")
         self.pb._domain = "somedomain"
 
         self.pb._should_proceed_cert = mock.MagicMock(
@@ -149,7 +248,9 @@ class ProviderBootstrapperTest(BaseLeapTest):
 
         with mock.patch('requests.models.Response.content',
                         new_callable=mock.PropertyMock) as \
-                content:
+                content, \
+                mock.patch.object(util, 'get_path_prefix',
+                                  return_value=path_prefix):
             content.return_value = new_content
             response_obj = Response()
             response_obj.raise_for_status = mock.MagicMock()
@@ -183,7 +284,7 @@ class ProviderBootstrapperTest(BaseLeapTest):
             return_value="")
         self.pb._domain = "somedomain"
 
-        self.pb._should_proceed_cert = mock.MagicMock(return_value=False)
+        self.pb._should_check_cert = mock.MagicMock(return_value=False)
 
         self.pb._check_ca_fingerprint()
         self.assertFalse(self.pb._provider_config.
@@ -417,6 +518,16 @@ class ProviderBootstrapperActiveTest(unittest.TestCase):
             p.write("A")
         return provider_path
 
+    def _get_provider_json_entry(self):
+        """
+        Returns the manifest entry of the provider.json written by the
+        bootstrapper, if any.
+
+        :rtype: dict or None
+        """
+        store = artifacts.get_store(self.pb._domain)
+        return store.get_entry("provider.json")
+
     @mock.patch(
         'leap.bitmask.config.providerconfig.ProviderConfig.get_domain',
         lambda x: where('testdomain.com'))
@@ -425,7 +536,18 @@ class ProviderBootstrapperActiveTest(unittest.TestCase):
         self._setup_providerbootstrapper(True)
 
         self.pb._download_provider_info()
-        self.assertTrue(ProviderConfig.save.called)
+        self.assertIsNotNone(self._get_provider_json_entry())
+
+    @deferred()
+    def test_fetch_provider_info_new_provider(self):
+        self._setup_provider_config_with("1", tempfile.mkdtemp())
+        self._setup_providerbootstrapper(True)
+        self.pb._session = agentfetcher.session()
+
+        d = self.pb._fetch_provider_info()
+        d.addCallback(
+            lambda _: self.assertIsNotNone(self._get_provider_json_entry()))
+        return d
 
     @mock.patch(
         'leap.bitmask.config.providerconfig.ProviderConfig.get_ca_cert_path',
@@ -441,7 +563,9 @@ class ProviderBootstrapperActiveTest(unittest.TestCase):
         self.pb._download_provider_info()
         # we check that it doesn't save the provider
         # config, because it's new enough
-        self.assertFalse(ProviderConfig.save.called)
+        self.assertIsNone(self._get_provider_json_entry())
+        with open(provider_path) as p:
+            self.assertEqual(p.read(), "A")
 
     @mock.patch(
         'leap.bitmask.config.providerconfig.ProviderConfig.get_domain',
@@ -457,7 +581,9 @@ class ProviderBootstrapperActiveTest(unittest.TestCase):
         self.pb._download_provider_info()
         # we check that it doesn't save the provider
         # config, because it's new enough
-        self.assertFalse(ProviderConfig.save.called)
+        self.assertIsNone(self._get_provider_json_entry())
+        with open(provider_path) as p:
+            self.assertEqual(p.read(), "A")
 
     @mock.patch(
         'leap.bitmask.config.providerconfig.ProviderConfig.get_ca_cert_path',
@@ -472,7 +598,9 @@ class ProviderBootstrapperActiveTest(unittest.TestCase):
 
         self.pb._download_provider_info()
         self.assertTrue(ProviderConfig.load.called)
-        self.assertTrue(ProviderConfig.save.called)
+        self.assertIsNotNone(self._get_provider_json_entry())
+        with open(provider_path) as p:
+            self.assertNotEqual(p.read(), "A")
 
     @mock.patch(
         'leap.bitmask.config.providerconfig.ProviderConfig.get_ca_cert_path',
@@ -506,7 +634,7 @@ class ProviderBootstrapperActiveTest(unittest.TestCase):
         self.pb._provider_config = ProviderConfig()
         self.pb._session.get = mock.MagicMock(return_value=Response())
 
-        self.pb._should_proceed_cert = mock.MagicMock(return_value=False)
+        self.pb._should_check_cert = mock.MagicMock(return_value=False)
         self.pb._check_api_certificate()
         self.assertFalse(self.pb._session.get.called)
 
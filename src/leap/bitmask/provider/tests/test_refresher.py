@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+# test_refresher.py
+# Copyright (C) 2014 LEAP
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Tests for the background refresh of the provider files.
+"""
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import mock
+
+from nose.twistedtools import deferred, reactor
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+
+from leap.bitmask import util
+from leap.bitmask.provider import artifacts
+from leap.bitmask.provider.refresher import ProviderRefresher, RefreshJob
+from leap.bitmask.services.mail.smtpconfig import SMTPConfig
+from leap.common.testing.basetest import BaseLeapTest
+
+# pylint: avoid unused import
+assert(reactor)
+
+DOMAIN = "example.org"
+NAME = "smtp-service.json"
+URL = "https://api.example.org:4430/1/config/smtp-service.json"
+
+sample_config = {
+    "serial": 1,
+    "version": 1,
+    "hosts": {
+        "walrus": {
+            "hostname": "smtp.example.org",
+            "ip_address": "1.2.3.4",
+            "port": 465
+        }
+    },
+    "locations": {}
+}
+
+
+def _response(status_code, content=""):
+    """
+    Returns a requests response.
+    """
+    res = Response()
+    res.status_code = status_code
+    res._content = content
+    res.headers = CaseInsensitiveDict({"etag": '"v2"'})
+    return res
+
+
+class ProviderRefresherTest(BaseLeapTest):
+    """
+    Tests for the ProviderRefresher class.
+    """
+
+    def setUp(self):
+        self.prefix = tempfile.mkdtemp()
+        patch = mock.patch.object(util, "get_path_prefix",
+                                  return_value=self.prefix)
+        patch.start()
+        self.addCleanup(patch.stop)
+        patch = mock.patch(
+            "leap.bitmask.provider.refresher.providerindex.refresh")
+        self.refresh = patch.start()
+        self.addCleanup(patch.stop)
+        patch = mock.patch("leap.bitmask.provider.refresher.configcache.put")
+        self.put = patch.start()
+        self.addCleanup(patch.stop)
+
+        self.store = artifacts.get_store(DOMAIN)
+        with self.store.transaction() as txn:
+            txn.write(NAME, "{}", url=URL, headers={"etag": '"v1"'})
+        self.refresher = ProviderRefresher(host_delay=0)
+        self.job = RefreshJob(DOMAIN, NAME, URL, "/cacert.pem", SMTPConfig,
+                              "1")
+
+    def tearDown(self):
+        shutil.rmtree(self.prefix)
+
+    def _read(self):
+        with open(os.path.join(self.prefix, "leap", "providers", DOMAIN,
+                               NAME)) as f:
+            return f.read()
+
+    def test_not_modified_is_fresh(self):
+        self.refresher._session.get = mock.MagicMock(
+            return_value=_response(304))
+        # written a while ago
+        self.assertFalse(self.store.is_fresh(NAME, 60,
+                                             now=time.time() + 120))
+
+        self.assertFalse(self.refresher._refresh(self.job))
+        args, kwargs = self.refresher._session.get.call_args
+        self.assertEqual(kwargs["headers"], {"if-none-match": '"v1"'})
+        self.assertTrue(self.store.is_fresh(NAME, 60))
+        self.assertEqual(self._read(), "{}")
+
+    def test_new_version_is_written(self):
+        content = json.dumps(sample_config)
+        self.refresher._session.get = mock.MagicMock(
+            return_value=_response(200, content))
+
+        self.assertTrue(self.refresher._refresh(self.job))
+        self.assertEqual(self._read(), content)
+        self.assertEqual(self.store.get_entry(NAME)["validators"],
+                         {"etag": '"v2"'})
+        self.assertTrue(self.put.called)
+        self.refresh.assert_called_once_with(DOMAIN)
+
+    def test_invalid_version_is_not_written(self):
+        self.refresher._session.get = mock.MagicMock(
+            return_value=_response(200, '{"hosts": "not a dict"}'))
+
+        self.assertFalse(self.refresher._refresh(self.job))
+        self.assertEqual(self._read(), "{}")
+        self.assertFalse(self.refresh.called)
+
+    @deferred(timeout=10)
+    def test_one_request_at_a_time_per_host(self):
+        lock = threading.Lock()
+        running = {}
+        overlaps = []
+
+        def get(url, **kwargs):
+            host = url.split("/")[2]
+            with lock:
+                if running.get(host):
+                    overlaps.append(host)
+                running[host] = True
+            time.sleep(0.05)
+            with lock:
+                running[host] = False
+            return _response(304)
+        self.refresher._session.get = get
+
+        jobs = [RefreshJob(DOMAIN, NAME, "https://%s/%d" % (host, i),
+                           None, SMTPConfig)
+                for host in ("a.example.org", "b.example.org")
+                for i in range(3)]
+        d = self.refresher._run_jobs(jobs)
+
+        def check(results):
+            self.assertEqual(overlaps, [])
+            self.assertEqual(self.refresher.checked, 6)
+            self.assertEqual(self.refresher.errors, 0)
+        d.addCallback(check)
+        return d
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
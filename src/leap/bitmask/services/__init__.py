@@ -21,17 +21,16 @@ import logging
 import os
 import sys
 
-from PySide import QtCore
-
-from leap.bitmask.config import flags
+from leap.bitmask.config import configcache, flags, providerindex
+from leap.bitmask.config.validatedconfig import ValidatedConfig
 from leap.bitmask.crypto.srpauth import SRPAuth
-from leap.bitmask.util.constants import REQUEST_TIMEOUT
+from leap.bitmask.provider import artifacts
+from leap.bitmask.util.constants import PROVIDER_FRESH_FOR, REQUEST_TIMEOUT
 from leap.bitmask.util.privilege_policies import is_missing_policy_permissions
 from leap.bitmask.util.request_helpers import get_content
 from leap.bitmask import util
 
 from leap.common.check import leap_assert
-from leap.common.config.baseconfig import BaseConfig
 from leap.common.files import get_mtime
 
 logger = logging.getLogger(__name__)
@@ -53,6 +52,9 @@ def get_service_display_name(service):
 
     :rtype: str
     """
+    # Only the GUI shows the services, the backend doesn't need Qt.
+    from PySide import QtCore
+
     # qt translator method helper
     _tr = QtCore.QObject().tr
 
@@ -88,6 +90,19 @@ def get_supported(services):
     return filter(lambda s: s in DEPLOYED, services)
 
 
+def _load_current_config(service_config, service_path, api_version):
+    """
+    Loads in `service_config` the config that is on disk, parsed when it
+    was written or the last time it was used.
+    """
+    cached = configcache.load(service_config.__class__, service_path,
+                              api_version)
+    if cached is not None:
+        service_config.copy_loaded(cached)
+    else:
+        service_config.load(service_path)
+
+
 def download_service_config(provider_config, service_config,
                             session,
                             download_if_needed=True):
@@ -112,16 +127,30 @@ def download_service_config(provider_config, service_config,
                                    "leap", "providers",
                                    provider_config.get_domain(),
                                    service_json))
-
-    if download_if_needed and mtime:
-        headers['if-modified-since'] = mtime
+    store = artifacts.get_store(provider_config.get_domain())
 
     api_version = provider_config.get_api_version()
+    service_config.set_api_version(api_version)
+    service_path = os.path.join("leap", "providers",
+                                provider_config.get_domain(), service_json)
+
+    if download_if_needed and store.is_fresh(service_json,
+                                             PROVIDER_FRESH_FOR):
+        # found current recently, by a login or by the background refresher.
+        logger.debug("{0} definition checked recently, not downloading "
+                     "it".format(service_name.upper()))
+        _load_current_config(service_config, service_path, api_version)
+        return
 
     config_uri = "%s/%s/config/%s-service.json" % (
         provider_config.get_api_uri(),
         api_version,
         service_name)
+
+    if download_if_needed and mtime:
+        # the ETag and Last-Modified it came with, if it wasn't touched since.
+        headers.update(store.get_conditional_headers(service_json, config_uri,
+                                                     mtime))
     logger.debug('Downloading %s config from: %s' % (
         service_name.upper(),
         config_uri))
@@ -149,23 +178,25 @@ def download_service_config(provider_config, service_config,
                       cookies=cookies)
     res.raise_for_status()
 
-    service_config.set_api_version(api_version)
-
     # Not modified
-    service_path = ("leap", "providers", provider_config.get_domain(),
-                    service_json)
     if res.status_code == 304:
         logger.debug(
             "{0} definition has not been modified".format(
                 service_name.upper()))
-        service_config.load(os.path.join(*service_path))
+        store.mark_fresh(service_json)
+        _load_current_config(service_config, service_path, api_version)
     else:
         service_definition, mtime = get_content(res)
         service_config.load(data=service_definition, mtime=mtime)
-        service_config.save(service_path)
+        with store.transaction() as txn:
+            txn.write(service_json, service_definition, mtime=mtime,
+                      headers=res.headers, url=config_uri)
+        configcache.put(service_config.__class__, service_path,
+                        service_config, api_version)
+        providerindex.refresh(provider_config.get_domain())
 
 
-class ServiceConfig(BaseConfig):
+class ServiceConfig(ValidatedConfig):
     """
     Base class used by the different service configs
     """
@@ -24,18 +24,18 @@ import requests
 
 from functools import partial
 
-from PySide import QtCore
-
 from twisted.python import log
-from twisted.internet import threads
 from twisted.internet.defer import CancelledError
 
+from leap.bitmask import util
+from leap.bitmask.config import flags
+from leap.bitmask.util import agentfetcher, httppool, threadpools
 from leap.common.check import leap_assert, leap_assert_type
 
 logger = logging.getLogger(__name__)
 
 
-class AbstractBootstrapper(QtCore.QObject):
+class AbstractBootstrapper(object):
     """
     Abstract Bootstrapper that implements the needed deferred callbacks
     """
@@ -43,6 +43,9 @@ class AbstractBootstrapper(QtCore.QObject):
     PASSED_KEY = "passed"
     ERROR_KEY = "error"
 
+    # Pool where the callback chains run, see util/threadpools.py
+    THREAD_POOL = threadpools.PROVIDER
+
     def __init__(self, signaler=None, bypass_checks=False):
         """
         Constructor for the abstract bootstrapper
@@ -55,8 +58,6 @@ class AbstractBootstrapper(QtCore.QObject):
                               certificates at bootstrap
         :type bypass_checks: bool
         """
-        QtCore.QObject.__init__(self)
-
         leap_assert(self._gui_errback.im_func ==
                     AbstractBootstrapper._gui_errback.im_func,
                     "Cannot redefine _gui_errback")
@@ -70,16 +71,26 @@ class AbstractBootstrapper(QtCore.QObject):
         # **************************************************** #
         # Dependency injection helpers, override this for more
         # granular testing
-        self._fetcher = requests
+        self._fetcher = agentfetcher if flags.TWISTED_FETCHER else requests
         # **************************************************** #
 
-        self._session = self._fetcher.session()
+        self._session = httppool.mount(self._fetcher.session())
         self._bypass_checks = bypass_checks
         self._signal_to_emit = None
         self._err_msg = None
         self._signaler = signaler
         self._cancel_signal = None
 
+    def cancel_requests(self):
+        """
+        Abort the requests in flight of this bootstrapper, if its fetcher
+        can. Called when a bootstrap is cancelled, so it doesn't wait for
+        a socket read to time out.
+        """
+        cancel = getattr(self._session, "cancel", None)
+        if cancel is not None:
+            cancel()
+
     def _gui_errback(self, failure):
         """
         Errback used to notify the GUI of a problem, it should be used
@@ -120,6 +131,16 @@ class AbstractBootstrapper(QtCore.QObject):
             log.err(failure)
             failure.trap(Exception)
 
+    def tr(self, text):
+        """
+        Translate a message, with the class name as context, like
+        QObject.tr does.
+
+        :param text: the text to translate
+        :type text: str
+        """
+        return util.tr(self.__class__.__name__, text)
+
     def _errback(self, failure, signal=None):
         """
         Regular errback used for the middle of the chain. If it's
@@ -163,12 +184,13 @@ class AbstractBootstrapper(QtCore.QObject):
                 signal.emit(data)
 
     def _callback_threader(self, cb, res, *args, **kwargs):
-        return threads.deferToThread(cb, res, *args, **kwargs)
+        return threadpools.defer_to_pool(self.THREAD_POOL,
+                                         cb, res, *args, **kwargs)
 
     def addCallbackChain(self, callbacks):
         """
-        Creates a callback/errback chain on another thread using
-        deferToThread and adds the _gui_errback to the end to notify
+        Creates a callback/errback chain on another thread, from the
+        THREAD_POOL pool, and adds the _gui_errback to the end to notify
         the GUI on an error.
 
         :param callbacks: List of tuples of callbacks and the signal
@@ -186,7 +208,7 @@ class AbstractBootstrapper(QtCore.QObject):
         d = None
         for cb, sig in callbacks:
             if d is None:
-                d = threads.deferToThread(cb)
+                d = threadpools.defer_to_pool(self.THREAD_POOL, cb)
             else:
                 d.addCallback(partial(self._callback_threader, cb))
             d.addErrback(self._errback, signal=sig)
@@ -25,6 +25,7 @@ from leap.bitmask.crypto.certs import download_client_cert
 from leap.bitmask.services import download_service_config
 from leap.bitmask.services.abstractbootstrapper import AbstractBootstrapper
 from leap.bitmask.services.eip.eipconfig import EIPConfig
+from leap.bitmask.util import threadpools
 from leap.common import certs as leap_certs
 from leap.common.check import leap_assert, leap_assert_type
 from leap.common.files import check_and_fix_urw_only
@@ -39,6 +40,8 @@ class EIPBootstrapper(AbstractBootstrapper):
     If a check fails, the subsequent checks are not executed
     """
 
+    THREAD_POOL = threadpools.EIP
+
     def __init__(self, signaler=None):
         """
         Constructor for the EIP bootstrapper object
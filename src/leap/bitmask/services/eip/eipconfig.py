@@ -54,6 +54,22 @@ def get_eipconfig_path(domain, relative=True):
     return path
 
 
+def get_client_cert_path(domain):
+    """
+    Returns the absolute path of the certificate used by openvpn for the
+    given provider.
+
+    :param domain: the domain of the provider.
+    :type domain: str
+    :returns: the path
+    :rtype: str
+    """
+    leap_assert(domain is not None, "get_client_cert_path: We need a domain")
+
+    return os.path.join(get_path_prefix(), "leap", "providers", domain,
+                        "keys", "client", "openvpn.pem")
+
+
 def load_eipconfig_if_needed(provider_config, eip_config, domain):
     """
     Utility function to prime a eip_config object from a loaded
@@ -284,10 +300,7 @@ class EIPConfig(ServiceConfig):
         leap_assert(providerconfig, "We need a provider")
         leap_assert_type(providerconfig, ProviderConfig)
 
-        cert_path = os.path.join(get_path_prefix(),
-                                 "leap", "providers",
-                                 providerconfig.get_domain(),
-                                 "keys", "client", "openvpn.pem")
+        cert_path = get_client_cert_path(providerconfig.get_domain())
 
         if not about_to_download:
             leap_assert(os.path.exists(cert_path),
@@ -23,6 +23,7 @@ import os
 import unittest
 
 from leap.bitmask.services.eip.eipconfig import EIPConfig
+from leap.bitmask.services.eip.eipconfig import get_client_cert_path
 from leap.bitmask.config.providerconfig import ProviderConfig
 from leap.common.testing.basetest import BaseLeapTest
 
@@ -295,6 +296,19 @@ class EIPConfigTest(BaseLeapTest):
 
         self.assertTrue(cert_path.endswith(expected_path))
 
+    def test_get_client_cert_path_matches_the_domain_one(self):
+        config = self._get_eipconfig()
+        provider_config = ProviderConfig()
+
+        # mock 'get_domain' so we don't need to load a config
+        provider_domain = 'test.provider.com'
+        provider_config.get_domain = Mock(return_value=provider_domain)
+
+        cert_path = config.get_client_cert_path(
+            provider_config, about_to_download=True)
+
+        self.assertEqual(cert_path, get_client_cert_path(provider_domain))
+
     def test_get_client_cert_path_fails(self):
         config = self._get_eipconfig()
         provider_config = ProviderConfig()
@@ -25,7 +25,7 @@ from leap.bitmask.crypto.certs import download_client_cert
 from leap.bitmask.services import download_service_config
 from leap.bitmask.services.abstractbootstrapper import AbstractBootstrapper
 from leap.bitmask.services.mail.smtpconfig import SMTPConfig
-from leap.bitmask.util import is_file
+from leap.bitmask.util import is_file, threadpools
 
 from leap.common import certs as leap_certs
 from leap.common.check import leap_assert
@@ -50,6 +50,8 @@ class SMTPBootstrapper(AbstractBootstrapper):
     PORT_KEY = "port"
     IP_KEY = "ip_address"
 
+    THREAD_POOL = threadpools.MAIL
+
     def __init__(self):
         AbstractBootstrapper.__init__(self)
 
@@ -26,7 +26,6 @@ from ssl import SSLError
 from sqlite3 import ProgrammingError as sqlite_ProgrammingError
 
 from u1db import errors as u1db_errors
-from twisted.internet import threads
 from zope.proxy import sameProxiedObjects
 from pysqlcipher.dbapi2 import ProgrammingError as sqlcipher_ProgrammingError
 
@@ -37,7 +36,7 @@ from leap.bitmask.services import download_service_config
 from leap.bitmask.services.abstractbootstrapper import AbstractBootstrapper
 from leap.bitmask.services.soledad.soledadconfig import SoledadConfig
 from leap.bitmask.util import first, is_file, is_empty_file, make_address
-from leap.bitmask.util import get_path_prefix
+from leap.bitmask.util import get_path_prefix, threadpools
 from leap.bitmask.platform_init import IS_WIN
 from leap.common.check import leap_assert, leap_assert_type, leap_check
 from leap.common.files import which
@@ -133,6 +132,8 @@ class SoledadBootstrapper(AbstractBootstrapper):
     MAX_INIT_RETRIES = 10
     MAX_SYNC_RETRIES = 10
 
+    THREAD_POOL = threadpools.SOLEDAD
+
     def __init__(self, signaler=None):
         AbstractBootstrapper.__init__(self, signaler)
 
@@ -320,7 +321,8 @@ class SoledadBootstrapper(AbstractBootstrapper):
                 self._keymanager.get_key(
                     address, openpgp.OpenPGPKey,
                     private=True, fetch_remote=False)
-                d = threads.deferToThread(self._do_soledad_sync)
+                d = threadpools.defer_to_pool(self.THREAD_POOL,
+                                              self._do_soledad_sync)
                 d.addErrback(self._soledad_sync_errback)
             except KeyNotFound:
                 logger.debug("Key not found. Generating key for %s" %
@@ -0,0 +1,490 @@
+# -*- coding: utf-8 -*-
+# signaler.py
+# Copyright (C) 2014 LEAP
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Signalers carry the signals of the backend, identified by a string key, to
+the frontend.
+
+AbstractSignaler has the keys and the coalescing of the signals, the Qt
+frontend uses signaler_qt.Signaler, that emits them as Qt signals, and the
+headless mode uses EventSignaler, a plain python event bus that doesn't need
+Qt at all.
+"""
+import logging
+import time
+
+from threading import Lock
+
+from twisted.internet import reactor
+
+logger = logging.getLogger(__name__)
+
+
+class SignalPolicy(object):
+    """
+    Coalescing policy for a signal that can be emitted too often.
+
+    The values signaled with a policy are not emitted right away, only the
+    latest one is kept and it's emitted on the next reactor iteration, or
+    later if needed to keep it below `max_hz` emissions per second.
+    """
+
+    def __init__(self, max_hz=None, drop_while_hidden=False):
+        """
+        Constructor for the SignalPolicy
+
+        :param max_hz: maximum emissions per second, None for no limit.
+        :type max_hz: float
+        :param drop_while_hidden: whether to drop the values signaled while
+                                  the frontend is hidden, the latest one is
+                                  emitted when it's shown again.
+        :type drop_while_hidden: bool
+        """
+        self.min_interval = 1.0 / max_hz if max_hz else 0
+        self.drop_while_hidden = drop_while_hidden
+
+
+class AbstractSignaler(object):
+    """
+    Base for the signalers, handles the signal keys and the coalescing
+    policies. Derived classes implement `_emit`.
+    """
+
+    # These will exist both in the backend AND the front end.
+    # The frontend might choose to not "interpret" all the signals
+    # from the backend, but the backend needs to have all the signals
+    # it's going to emit defined here
+    PROV_NAME_RESOLUTION_KEY = "prov_name_resolution"
+    PROV_HTTPS_CONNECTION_KEY = "prov_https_connection"
+    PROV_DOWNLOAD_PROVIDER_INFO_KEY = "prov_download_provider_info"
+    PROV_DOWNLOAD_CA_CERT_KEY = "prov_download_ca_cert"
+    PROV_CHECK_CA_FINGERPRINT_KEY = "prov_check_ca_fingerprint"
+    PROV_CHECK_API_CERTIFICATE_KEY = "prov_check_api_certificate"
+    PROV_PROBLEM_WITH_PROVIDER_KEY = "prov_problem_with_provider"
+    PROV_UNSUPPORTED_CLIENT = "prov_unsupported_client"
+    PROV_UNSUPPORTED_API = "prov_unsupported_api"
+    PROV_CANCELLED_SETUP = "prov_cancelled_setup"
+    PROV_GET_ALL_SERVICES = "prov_get_all_services"
+    PROV_GET_SUPPORTED_SERVICES = "prov_get_supported_services"
+    PROV_GET_DETAILS = "prov_get_details"
+
+    SRP_REGISTRATION_FINISHED = "srp_registration_finished"
+    SRP_REGISTRATION_FAILED = "srp_registration_failed"
+    SRP_REGISTRATION_TAKEN = "srp_registration_taken"
+    SRP_AUTH_OK = "srp_auth_ok"
+    SRP_AUTH_ERROR = "srp_auth_error"
+    SRP_AUTH_SERVER_ERROR = "srp_auth_server_error"
+    SRP_AUTH_CONNECTION_ERROR = "srp_auth_connection_error"
+    SRP_AUTH_BAD_USER_OR_PASSWORD = "srp_auth_bad_user_or_password"
+    SRP_LOGOUT_OK = "srp_logout_ok"
+    SRP_LOGOUT_ERROR = "srp_logout_error"
+    SRP_PASSWORD_CHANGE_OK = "srp_password_change_ok"
+    SRP_PASSWORD_CHANGE_ERROR = "srp_password_change_error"
+    SRP_PASSWORD_CHANGE_BADPW = "srp_password_change_badpw"
+    SRP_NOT_LOGGED_IN_ERROR = "srp_not_logged_in_error"
+    SRP_STATUS_LOGGED_IN = "srp_status_logged_in"
+    SRP_STATUS_NOT_LOGGED_IN = "srp_status_not_logged_in"
+
+    EIP_CONFIG_READY = "eip_config_ready"
+    EIP_CLIENT_CERTIFICATE_READY = "eip_client_certificate_ready"
+    EIP_CANCELLED_SETUP = "eip_cancelled_setup"
+
+    EIP_CONNECTED = "eip_connected"
+    EIP_DISCONNECTED = "eip_disconnected"
+    EIP_CONNECTION_DIED = "eip_connection_died"
+    EIP_CONNECTION_ABORTED = "eip_connection_aborted"
+    EIP_STOPPED = "eip_stopped"
+
+    EIP_NO_POLKIT_AGENT_ERROR = "eip_no_polkit_agent_error"
+    EIP_NO_TUN_KEXT_ERROR = "eip_no_tun_kext_error"
+    EIP_NO_PKEXEC_ERROR = "eip_no_pkexec_error"
+    EIP_OPENVPN_NOT_FOUND_ERROR = "eip_openvpn_not_found_error"
+    EIP_OPENVPN_ALREADY_RUNNING = "eip_openvpn_already_running"
+    EIP_ALIEN_OPENVPN_ALREADY_RUNNING = "eip_alien_openvpn_already_running"
+    EIP_VPN_LAUNCHER_EXCEPTION = "eip_vpn_launcher_exception"
+
+    EIP_GET_GATEWAYS_LIST = "eip_get_gateways_list"
+    EIP_GET_GATEWAYS_LIST_ERROR = "eip_get_gateways_list_error"
+    EIP_UNINITIALIZED_PROVIDER = "eip_uninitialized_provider"
+    EIP_GET_INITIALIZED_PROVIDERS = "eip_get_initialized_providers"
+
+    EIP_NETWORK_UNREACHABLE = "eip_network_unreachable"
+    EIP_PROCESS_RESTART_TLS = "eip_process_restart_tls"
+    EIP_PROCESS_RESTART_PING = "eip_process_restart_ping"
+
+    EIP_STATE_CHANGED = "eip_state_changed"
+    EIP_STATUS_CHANGED = "eip_status_changed"
+    EIP_PROCESS_FINISHED = "eip_process_finished"
+    EIP_TEAR_FW_DOWN = "eip_tear_fw_down"
+
+    EIP_CAN_START = "eip_can_start"
+    EIP_CANNOT_START = "eip_cannot_start"
+
+    SOLEDAD_BOOTSTRAP_FAILED = "soledad_bootstrap_failed"
+    SOLEDAD_BOOTSTRAP_FINISHED = "soledad_bootstrap_finished"
+    SOLEDAD_OFFLINE_FAILED = "soledad_offline_failed"
+    SOLEDAD_OFFLINE_FINISHED = "soledad_offline_finished"
+    SOLEDAD_INVALID_AUTH_TOKEN = "soledad_invalid_auth_token"
+
+    SOLEDAD_PASSWORD_CHANGE_OK = "soledad_password_change_ok"
+    SOLEDAD_PASSWORD_CHANGE_ERROR = "soledad_password_change_error"
+
+    SOLEDAD_CANCELLED_BOOTSTRAP = "soledad_cancelled_bootstrap"
+
+    KEYMANAGER_EXPORT_OK = "keymanager_export_ok"
+    KEYMANAGER_EXPORT_ERROR = "keymanager_export_error"
+    KEYMANAGER_KEYS_LIST = "keymanager_keys_list"
+
+    KEYMANAGER_IMPORT_IOERROR = "keymanager_import_ioerror"
+    KEYMANAGER_IMPORT_DATAMISMATCH = "keymanager_import_datamismatch"
+    KEYMANAGER_IMPORT_MISSINGKEY = "keymanager_import_missingkey"
+    KEYMANAGER_IMPORT_ADDRESSMISMATCH = "keymanager_import_addressmismatch"
+    KEYMANAGER_IMPORT_OK = "keymanager_import_ok"
+    KEYMANAGER_KEY_DETAILS = "keymanager_key_details"
+
+    IMAP_STOPPED = "imap_stopped"
+
+    BACKEND_BAD_CALL = "backend_bad_call"
+
+    # Coalescing policies for the signals that can be emitted too often,
+    # the rest of the signals are emitted right away.
+    SIGNAL_POLICIES = {
+        # the status is polled every second, and it's only shown in the
+        # main window.
+        EIP_STATUS_CHANGED: SignalPolicy(max_hz=1, drop_while_hidden=True),
+    }
+
+    # Every signal that the backend can emit
+    SIGNALS = (
+        PROV_NAME_RESOLUTION_KEY,
+        PROV_HTTPS_CONNECTION_KEY,
+        PROV_DOWNLOAD_PROVIDER_INFO_KEY,
+        PROV_DOWNLOAD_CA_CERT_KEY,
+        PROV_CHECK_CA_FINGERPRINT_KEY,
+        PROV_CHECK_API_CERTIFICATE_KEY,
+        PROV_PROBLEM_WITH_PROVIDER_KEY,
+        PROV_UNSUPPORTED_CLIENT,
+        PROV_UNSUPPORTED_API,
+        PROV_CANCELLED_SETUP,
+        PROV_GET_ALL_SERVICES,
+        PROV_GET_SUPPORTED_SERVICES,
+        PROV_GET_DETAILS,
+
+        SRP_REGISTRATION_FINISHED,
+        SRP_REGISTRATION_FAILED,
+        SRP_REGISTRATION_TAKEN,
+
+        EIP_CONFIG_READY,
+        EIP_CLIENT_CERTIFICATE_READY,
+        EIP_CANCELLED_SETUP,
+
+        EIP_CONNECTED,
+        EIP_DISCONNECTED,
+        EIP_CONNECTION_DIED,
+        EIP_CONNECTION_ABORTED,
+        EIP_STOPPED,
+
+        EIP_NO_POLKIT_AGENT_ERROR,
+        EIP_NO_TUN_KEXT_ERROR,
+        EIP_NO_PKEXEC_ERROR,
+        EIP_OPENVPN_NOT_FOUND_ERROR,
+        EIP_OPENVPN_ALREADY_RUNNING,
+        EIP_ALIEN_OPENVPN_ALREADY_RUNNING,
+        EIP_VPN_LAUNCHER_EXCEPTION,
+
+        EIP_GET_GATEWAYS_LIST,
+        EIP_GET_GATEWAYS_LIST_ERROR,
+        EIP_UNINITIALIZED_PROVIDER,
+        EIP_GET_INITIALIZED_PROVIDERS,
+
+        EIP_NETWORK_UNREACHABLE,
+        EIP_PROCESS_RESTART_TLS,
+        EIP_PROCESS_RESTART_PING,
+
+        EIP_STATE_CHANGED,
+        EIP_STATUS_CHANGED,
+        EIP_PROCESS_FINISHED,
+
+        EIP_CAN_START,
+        EIP_CANNOT_START,
+
+        SRP_AUTH_OK,
+        SRP_AUTH_ERROR,
+        SRP_AUTH_SERVER_ERROR,
+        SRP_AUTH_CONNECTION_ERROR,
+        SRP_AUTH_BAD_USER_OR_PASSWORD,
+        SRP_LOGOUT_OK,
+        SRP_LOGOUT_ERROR,
+        SRP_PASSWORD_CHANGE_OK,
+        SRP_PASSWORD_CHANGE_ERROR,
+        SRP_PASSWORD_CHANGE_BADPW,
+        SRP_NOT_LOGGED_IN_ERROR,
+        SRP_STATUS_LOGGED_IN,
+        SRP_STATUS_NOT_LOGGED_IN,
+
+        SOLEDAD_BOOTSTRAP_FAILED,
+        SOLEDAD_BOOTSTRAP_FINISHED,
+        SOLEDAD_OFFLINE_FAILED,
+        SOLEDAD_OFFLINE_FINISHED,
+        SOLEDAD_INVALID_AUTH_TOKEN,
+        SOLEDAD_CANCELLED_BOOTSTRAP,
+
+        SOLEDAD_PASSWORD_CHANGE_OK,
+        SOLEDAD_PASSWORD_CHANGE_ERROR,
+
+        KEYMANAGER_EXPORT_OK,
+        KEYMANAGER_EXPORT_ERROR,
+        KEYMANAGER_KEYS_LIST,
+
+        KEYMANAGER_IMPORT_IOERROR,
+        KEYMANAGER_IMPORT_DATAMISMATCH,
+        KEYMANAGER_IMPORT_MISSINGKEY,
+        KEYMANAGER_IMPORT_ADDRESSMISMATCH,
+        KEYMANAGER_IMPORT_OK,
+        KEYMANAGER_KEY_DETAILS,
+
+        IMAP_STOPPED,
+
+        BACKEND_BAD_CALL,
+    )
+
+    def __init__(self):
+        """
+        Constructor for the AbstractSignaler
+        """
+        self._policies = dict(self.SIGNAL_POLICIES)
+        self._frontend_visible = True
+
+        # Latest value for the coalesced signals waiting to be emitted, and
+        # last time they were emitted.
+        self._pending = {}
+        self._last_emitted = {}
+        self._pending_lock = Lock()
+
+        # Latest value dropped while the frontend was hidden, by signal.
+        self._hidden = {}
+
+    def signal(self, key, data=None):
+        """
+        Emits a signal based on the key provided, with the data if provided.
+
+        This can be called from any thread.
+
+        :param key: string identifying the signal to emit
+        :type key: str
+        :param data: object to send with the data
+        :type data: object
+
+        NOTE: The data object will be a serialized str in the backend,
+        and an unserialized object in the frontend, but for now we
+        just care about objects.
+        """
+        # for some reason emitting 'None' gives a segmentation fault.
+        if data is None:
+            data = ''
+
+        policy = self._policies.get(key)
+        if policy is None:
+            self._emit(key, data)
+            return
+
+        with self._pending_lock:
+            if policy.drop_while_hidden and not self._frontend_visible:
+                self._hidden[key] = data
+                return
+
+            scheduled = key in self._pending
+            self._pending[key] = data
+
+        if not scheduled:
+            reactor.callFromThread(self._schedule_flush, key, policy)
+
+    def _emit(self, key, data):
+        """
+        Emit the signal for the key provided. Derived classes should
+        implement this.
+
+        :param key: string identifying the signal to emit
+        :type key: str
+        :param data: object to send with the data
+        :type data: object
+        """
+        raise NotImplementedError()
+
+    def _schedule_flush(self, key, policy):
+        """
+        Schedule the emission of the latest value for a coalesced signal,
+        respecting the rate limit of its policy.
+
+        :param key: string identifying the signal to emit
+        :type key: str
+        :param policy: the policy for the signal
+        :type policy: SignalPolicy
+        """
+        elapsed = time.time() - self._last_emitted.get(key, 0)
+        delay = max(0, policy.min_interval - elapsed)
+        reactor.callLater(delay, self._flush, key, policy)
+
+    def _flush(self, key, policy):
+        """
+        Emit the latest value signaled for a coalesced signal.
+
+        :param key: string identifying the signal to emit
+        :type key: str
+        :param policy: the policy for the signal
+        :type policy: SignalPolicy
+        """
+        with self._pending_lock:
+            if key not in self._pending:
+                return
+            data = self._pending.pop(key)
+
+            if policy.drop_while_hidden and not self._frontend_visible:
+                self._hidden[key] = data
+                return
+
+        self._last_emitted[key] = time.time()
+        self._emit(key, data)
+
+    def set_policy(self, key, policy):
+        """
+        Set the coalescing policy for a signal.
+
+        :param key: string identifying the signal
+        :type key: str
+        :param policy: the policy to use, None to emit the signal right away.
+        :type policy: SignalPolicy or None
+        """
+        if policy is None:
+            self._policies.pop(key, None)
+        else:
+            self._policies[key] = policy
+
+    def set_frontend_visible(self, visible):
+        """
+        Let the signaler know if the frontend is visible, to drop the signals
+        that are not needed while it's hidden. When it's shown again, the
+        latest value dropped for each signal is signaled.
+
+        :param visible: whether the frontend is visible or not.
+        :type visible: bool
+        """
+        with self._pending_lock:
+            self._frontend_visible = visible
+            if not visible:
+                return
+            hidden = self._hidden
+            self._hidden = {}
+
+        for key, data in hidden.iteritems():
+            self.signal(key, data)
+
+
+class EventSignaler(AbstractSignaler):
+    """
+    Signaler that calls plain python callbacks, for the headless mode and
+    for the backend daemon.
+
+    The callbacks are always called from the reactor thread.
+    """
+
+    def __init__(self):
+        """
+        Constructor for the EventSignaler
+        """
+        AbstractSignaler.__init__(self)
+        self._callbacks = {}
+        self._all_callbacks = []
+        self._callbacks_lock = Lock()
+
+    def connect(self, key, callback):
+        """
+        Call `callback` with the data each time the signal is emitted.
+
+        :param key: string identifying the signal
+        :type key: str
+        :param callback: the function to call
+        :type callback: callable
+        """
+        if key not in self.SIGNALS:
+            raise ValueError("Unknown key for signal %s!" % (key,))
+
+        with self._callbacks_lock:
+            self._callbacks.setdefault(key, []).append(callback)
+
+    def connect_all(self, callback):
+        """
+        Call `callback` with the key and the data for every signal emitted.
+
+        :param callback: the function to call
+        :type callback: callable
+        """
+        with self._callbacks_lock:
+            self._all_callbacks.append(callback)
+
+    def disconnect(self, key, callback):
+        """
+        Stop calling `callback` for a signal.
+
+        :param key: string identifying the signal
+        :type key: str
+        :param callback: the function connected
+        :type callback: callable
+        """
+        with self._callbacks_lock:
+            callbacks = self._callbacks.get(key, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+
+    def _emit(self, key, data):
+        """
+        Schedule the callbacks for the key provided in the reactor thread.
+
+        :param key: string identifying the signal to emit
+        :type key: str
+        :param data: object to send with the data
+        :type data: object
+        """
+        if key not in self.SIGNALS:
+            logger.error("Unknown key for signal %s!" % (key,))
+            return
+
+        reactor.callFromThread(self._dispatch, key, data)
+
+    def _dispatch(self, key, data):
+        """
+        Call the callbacks connected to a signal.
+
+        :param key: string identifying the signal
+        :type key: str
+        :param data: object to send with the data
+        :type data: object
+        """
+        with self._callbacks_lock:
+            callbacks = list(self._callbacks.get(key, []))
+            all_callbacks = list(self._all_callbacks)
+
+        for callback in callbacks:
+            try:
+                callback(data)
+            except Exception as e:
+                logger.exception("Error in callback for %s: %r" % (key, e))
+
+        for callback in all_callbacks:
+            try:
+                callback(key, data)
+            except Exception as e:
+                logger.exception("Error in callback for %s: %r" % (key, e))
@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+# test_backend.py
+# Copyright (C) 2014 LEAP
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+tests for the backend command dispatching
+"""
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+import mock
+
+from Queue import Empty
+
+from twisted.internet import defer
+
+from leap.bitmask import backend
+from leap.bitmask.backend import Backend, CommandQueue
+from leap.common.testing.basetest import BaseLeapTest
+
+
+class FakeProvider(object):
+    """
+    Provider component that keeps its ongoing defer the way the real one
+    does, so it can be cancelled.
+    """
+
+    key = "provider"
+
+    def __init__(self):
+        self.calls = []
+        self.defer = None
+        self.during_call = None
+
+    def setup_provider(self, provider):
+        self.calls.append(("setup_provider", provider))
+        if self.during_call is not None:
+            self.during_call()
+        self.defer = defer.Deferred()
+        return self.defer
+
+    def cancel_setup_provider(self):
+        self.calls.append(("cancel_setup_provider",))
+        if self.defer is not None:
+            self.defer.cancel()
+
+    def get_details(self, domain, lang=None):
+        self.calls.append(("get_details", domain))
+
+
+def call_now(f, *args, **kwargs):
+    """
+    Stand-in for reactor.callFromThread that runs the call right away.
+    """
+    return f(*args, **kwargs)
+
+
+class CommandQueueTestCase(BaseLeapTest):
+    """
+    Tests for the CommandQueue class.
+    """
+
+    def setUp(self):
+        self.queue = CommandQueue()
+
+    def tearDown(self):
+        pass
+
+    def test_get_in_order(self):
+        self.queue.put(("provider", "get_details", None, "a"))
+        self.queue.put(("provider", "get_details", None, "b"))
+
+        self.assertEqual(self.queue.get()[1][3], "a")
+        self.assertEqual(self.queue.get()[1][3], "b")
+        self.assertRaises(Empty, self.queue.get)
+
+    def test_lanes_are_separate(self):
+        cancel = ("provider", "cancel_setup_provider", None)
+        self.queue.put(("provider", "setup_provider", None, "a"))
+        self.queue.put(cancel, CommandQueue.URGENT)
+
+        self.assertFalse(self.queue.empty(CommandQueue.URGENT))
+        self.assertEqual(self.queue.get(CommandQueue.URGENT)[1], cancel)
+        self.assertTrue(self.queue.empty(CommandQueue.URGENT))
+        self.assertFalse(self.queue.empty())
+
+    def test_collapse(self):
+        cmd = ("provider", "get_details", None, "a")
+        self.assertTrue(self.queue.put(cmd, collapse=True))
+        self.assertFalse(self.queue.put(cmd, collapse=True))
+        # different arguments are a different query
+        self.assertTrue(self.queue.put(("provider", "get_details", None, "b"),
+                                       collapse=True))
+        # without collapsing, duplicates are kept
+        self.assertTrue(self.queue.put(cmd))
+
+        self.queue.get()
+        self.queue.get()
+        self.queue.get()
+        self.assertTrue(self.queue.empty())
+
+    def test_discard(self):
+        self.queue.put(("provider", "setup_provider", None, "a"))
+        self.queue.put(("provider", "get_details", None, "a"))
+        self.queue.put(("eip", "setup_eip", None, "a"))
+        self.queue.put(("provider", "bootstrap", None, "a"))
+
+        removed = self.queue.discard("provider",
+                                     ("setup_provider", "bootstrap"))
+
+        self.assertEqual(removed, 2)
+        self.assertEqual(self.queue.get()[1][:2], ("provider", "get_details"))
+        self.assertEqual(self.queue.get()[1][:2], ("eip", "setup_eip"))
+        self.assertTrue(self.queue.empty())
+
+    def test_discard_keeps_urgent(self):
+        cancel = ("provider", "cancel_setup_provider", None)
+        self.queue.put(cancel, CommandQueue.URGENT)
+
+        self.assertEqual(
+            self.queue.discard("provider", ("cancel_setup_provider",)), 0)
+        self.assertFalse(self.queue.empty(CommandQueue.URGENT))
+
+
+class BackendDispatchTestCase(BaseLeapTest):
+    """
+    Tests for the dispatching of the commands in the Backend.
+    """
+
+    def setUp(self):
+        self.provider = FakeProvider()
+        self.backend = Backend(signaler=mock.MagicMock())
+        self.backend._components = {"provider": self.provider}
+        self.backend._running = True
+        # the worker is run by hand in the tests
+        self.backend._dispatching = True
+
+        patcher = mock.patch.object(backend.reactor, "callFromThread",
+                                    side_effect=call_now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        pass
+
+    def _ongoing(self):
+        return self.backend._ongoing_defers.get("provider", {})
+
+    def test_urgent_runs_before_pending(self):
+        self.backend._call_queue.put(("provider", "get_details", None, "a"))
+        self.backend._enqueue(("provider", "cancel_setup_provider", None))
+
+        # the cancel ran on arrival, the query still waits for the worker
+        self.assertEqual(self.provider.calls, [("cancel_setup_provider",)])
+
+        self.backend._worker()
+        self.assertEqual(self.provider.calls, [
+            ("cancel_setup_provider",),
+            ("get_details", "a"),
+        ])
+
+    def test_urgent_discards_superseded(self):
+        self.backend._call_queue.put(
+            ("provider", "setup_provider", None, "a"))
+        self.backend._call_queue.put(("provider", "get_details", None, "a"))
+
+        self.backend._enqueue(("provider", "cancel_setup_provider", None))
+        self.backend._worker()
+
+        self.assertEqual(self.provider.calls, [
+            ("cancel_setup_provider",),
+            ("get_details", "a"),
+        ])
+
+    def test_collapsible_enqueued_once(self):
+        cmd = ("provider", "get_details", None, "a")
+        self.backend._enqueue(cmd)
+        self.backend._enqueue(cmd)
+
+        self.backend._worker()
+        self.assertEqual(self.provider.calls, [("get_details", "a")])
+
+    def test_urgent_cancels_ongoing(self):
+        self.backend._enqueue(("provider", "setup_provider", None, "a"))
+        self.backend._worker()
+
+        d = self.provider.defer
+        self.assertIn(d, self._ongoing())
+        self.assertFalse(d.called)
+
+        self.backend._enqueue(("provider", "cancel_setup_provider", None))
+
+        self.assertTrue(d.called)
+        self.assertEqual(self._ongoing(), {})
+
+    def test_cancel_while_dispatching(self):
+        # the cancel comes while setup_provider runs, before its defer is
+        # returned and the provider knows about it
+        def cancel():
+            self.assertIsNone(self.provider.defer)
+            self.backend._enqueue(
+                ("provider", "cancel_setup_provider", None))
+
+        self.provider.during_call = cancel
+        self.backend._enqueue(("provider", "setup_provider", None, "a"))
+        self.backend._worker()
+
+        # the cancel ran again once the defer existed
+        self.assertEqual(self.provider.calls, [
+            ("setup_provider", "a"),
+            ("cancel_setup_provider",),
+            ("cancel_setup_provider",),
+        ])
+        self.assertTrue(self.provider.defer.called)
+        self.provider.defer.addErrback(
+            lambda f: f.trap(defer.CancelledError))
+        self.assertEqual(self._ongoing(), {})
+
+    def test_stop_while_dispatching(self):
+        self.provider.during_call = self.backend._stop
+        self.backend._enqueue(("provider", "setup_provider", None, "a"))
+        self.backend._worker()
+
+        self.assertTrue(self.provider.defer.called)
+        self.provider.defer.addErrback(
+            lambda f: f.trap(defer.CancelledError))
+        self.assertFalse(self.backend._running)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+# test_backend_ipc.py
+# Copyright (C) 2014 LEAP
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+tests for spawning the out of process backend
+"""
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+import mock
+
+from leap.bitmask import backend_ipc
+from leap.bitmask.backend_ipc import BackendProxy
+from leap.bitmask.util import leap_argparse
+from leap.common.testing.basetest import BaseLeapTest
+
+
+class DaemonCommandTestCase(BaseLeapTest):
+    """
+    Tests for the command that runs the backend daemon.
+    """
+
+    def setUp(self):
+        # the Qt signaler is not needed to build the command
+        self.proxy = BackendProxy.__new__(BackendProxy)
+
+    def tearDown(self):
+        pass
+
+    def test_runs_the_module(self):
+        with mock.patch.object(backend_ipc, "sys") as sys:
+            sys.executable = "/usr/bin/python"
+            del sys.frozen
+            command = self.proxy._get_daemon_command()
+
+        self.assertEqual(command, ["/usr/bin/python", "-m",
+                                   "leap.bitmask.backend_ipc"])
+
+    def test_frozen_runs_the_bundle(self):
+        with mock.patch.object(backend_ipc, "sys") as sys:
+            sys.executable = "/opt/bitmask/bitmask"
+            sys.frozen = True
+            command = self.proxy._get_daemon_command()
+
+        self.assertEqual(command, ["/opt/bitmask/bitmask", "--backend-daemon"])
+
+    def test_daemon_args_parsed(self):
+        parser = leap_argparse.build_parser()
+        opts, _ = parser.parse_known_args(
+            ["--backend-daemon", "--socket", "/tmp/backend.sock"])
+        self.assertTrue(opts.backend_daemon)
+
+        opts, _ = parser.parse_known_args([])
+        self.assertFalse(opts.backend_daemon)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+# test_signaler.py
+# Copyright (C) 2014 LEAP
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+tests for the signal coalescing policies
+"""
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+import mock
+
+from twisted.internet.task import Clock
+
+from leap.bitmask import signaler
+from leap.bitmask.signaler import AbstractSignaler, SignalPolicy
+from leap.common.testing.basetest import BaseLeapTest
+
+STATUS = AbstractSignaler.EIP_STATUS_CHANGED
+OTHER = AbstractSignaler.EIP_CONNECTED
+
+
+class RecordingSignaler(AbstractSignaler):
+    """
+    Signaler that keeps the signals emitted.
+    """
+
+    def __init__(self):
+        AbstractSignaler.__init__(self)
+        self.emitted = []
+
+    def _emit(self, key, data):
+        self.emitted.append((key, data))
+
+
+class SignalPolicyTestCase(BaseLeapTest):
+    """
+    Tests for the coalescing of the signals with a SignalPolicy.
+    """
+
+    def setUp(self):
+        self.clock = Clock()
+        # far from the epoch, like the real time
+        self.clock.advance(1000)
+
+        fake_reactor = mock.Mock()
+        fake_reactor.callFromThread.side_effect = \
+            lambda f, *args, **kwargs: f(*args, **kwargs)
+        fake_reactor.callLater.side_effect = self.clock.callLater
+
+        for patcher in (mock.patch.object(signaler, "reactor", fake_reactor),
+                        mock.patch.object(signaler.time, "time",
+                                          self.clock.seconds)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.signaler = RecordingSignaler()
+
+    def tearDown(self):
+        pass
+
+    def test_no_policy_emits_right_away(self):
+        self.signaler.set_policy(STATUS, None)
+        self.signaler.signal(STATUS, "a")
+        self.signaler.signal(STATUS, "b")
+
+        self.assertEqual(self.signaler.emitted, [(STATUS, "a"), (STATUS, "b")])
+
+    def test_last_value_wins(self):
+        self.signaler.set_policy(STATUS, SignalPolicy())
+        for value in ("a", "b", "c"):
+            self.signaler.signal(STATUS, value)
+        self.assertEqual(self.signaler.emitted, [])
+
+        # the next reactor iteration
+        self.clock.advance(0)
+        self.assertEqual(self.signaler.emitted, [(STATUS, "c")])
+
+        self.clock.advance(10)
+        self.assertEqual(self.signaler.emitted, [(STATUS, "c")])
+
+    def test_other_signals_not_coalesced(self):
+        self.signaler.set_policy(STATUS, SignalPolicy())
+        self.signaler.signal(STATUS, "a")
+        self.signaler.signal(OTHER)
+
+        self.assertEqual(self.signaler.emitted, [(OTHER, "")])
+        self.clock.advance(0)
+        self.assertEqual(self.signaler.emitted, [(OTHER, ""), (STATUS, "a")])
+
+    def test_max_hz(self):
+        self.signaler.set_policy(STATUS, SignalPolicy(max_hz=2))
+        self.signaler.signal(STATUS, "a")
+        self.clock.advance(0)
+        self.assertEqual(self.signaler.emitted, [(STATUS, "a")])
+
+        # within the interval, it waits for the rest of it
+        self.clock.advance(0.1)
+        self.signaler.signal(STATUS, "b")
+        self.signaler.signal(STATUS, "c")
+        self.clock.advance(0.3)
+        self.assertEqual(len(self.signaler.emitted), 1)
+
+        self.clock.advance(0.1)
+        self.assertEqual(self.signaler.emitted, [(STATUS, "a"), (STATUS, "c")])
+
+        # past the interval, it's emitted on the next iteration
+        self.clock.advance(1)
+        self.signaler.signal(STATUS, "d")
+        self.clock.advance(0)
+        self.assertEqual(self.signaler.emitted[-1], (STATUS, "d"))
+
+    def test_dropped_while_hidden(self):
+        self.signaler.set_policy(
+            STATUS, SignalPolicy(max_hz=1, drop_while_hidden=True))
+        self.signaler.set_frontend_visible(False)
+
+        self.signaler.signal(STATUS, "a")
+        self.signaler.signal(OTHER)
+        self.clock.advance(10)
+
+        self.assertEqual(self.signaler.emitted, [(OTHER, "")])
+
+    def test_latest_replayed_when_visible(self):
+        self.signaler.set_policy(
+            STATUS, SignalPolicy(max_hz=1, drop_while_hidden=True))
+        self.signaler.set_frontend_visible(False)
+        self.signaler.signal(STATUS, "a")
+        self.signaler.signal(STATUS, "b")
+
+        self.signaler.set_frontend_visible(True)
+        self.clock.advance(0)
+        self.assertEqual(self.signaler.emitted, [(STATUS, "b")])
+
+        # it's replayed only once
+        self.signaler.set_frontend_visible(False)
+        self.signaler.set_frontend_visible(True)
+        self.clock.advance(10)
+        self.assertEqual(self.signaler.emitted, [(STATUS, "b")])
+
+    def test_hidden_before_flush_is_replayed(self):
+        self.signaler.set_policy(
+            STATUS, SignalPolicy(drop_while_hidden=True))
+        self.signaler.signal(STATUS, "a")
+        # hidden after the value was scheduled, but before it was emitted
+        self.signaler.set_frontend_visible(False)
+        self.clock.advance(0)
+        self.assertEqual(self.signaler.emitted, [])
+
+        self.signaler.set_frontend_visible(True)
+        self.clock.advance(0)
+        self.assertEqual(self.signaler.emitted, [(STATUS, "a")])
+
+    def test_not_dropped_without_policy_flag(self):
+        self.signaler.set_policy(STATUS, SignalPolicy(max_hz=1))
+        self.signaler.set_frontend_visible(False)
+        self.signaler.signal(STATUS, "a")
+        self.clock.advance(0)
+
+        self.assertEqual(self.signaler.emitted, [(STATUS, "a")])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -20,6 +20,7 @@ Some small and handy functions.
 import datetime
 import itertools
 import os
+import sys
 
 from leap.bitmask.config import flags
 from leap.common.config import get_path_prefix as common_get_path_prefix
@@ -104,6 +105,25 @@ def is_empty_file(path):
     return os.stat(path).st_size is 0
 
 
+def tr(context, text):
+    """
+    Translate a text the way QObject.tr does for a class named `context`,
+    if Qt is loaded. In headless mode the text is returned as it is.
+
+    :param context: the translation context, usually the class name.
+    :type context: str
+    :param text: the text to translate.
+    :type text: str
+
+    :rtype: unicode or str
+    """
+    if "PySide.QtCore" not in sys.modules:
+        return text
+
+    from PySide import QtCore
+    return QtCore.QCoreApplication.translate(context, text)
+
+
 def make_address(user, provider):
     """
     Return a full identifier for an user, as a email-like
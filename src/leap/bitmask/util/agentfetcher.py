@@ -0,0 +1,454 @@
+# -*- coding: utf-8 -*-
+# agentfetcher.py
+# Copyright (C) 2014 LEAP
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+HTTP fetcher built on twisted.web.client.Agent.
+
+It can replace `requests` in the `_fetcher` injection point of the
+bootstrappers and SRPAuth:
+
+    self._fetcher = agentfetcher
+    self._session = self._fetcher.session()
+
+Its sessions have two interfaces:
+
+    - `fetch(method, url, ...)` returns a deferred with the response. It
+      runs in the reactor, with no thread, and cancelling the deferred
+      aborts the connection. Hundreds of fetches can be in flight at once.
+    - `get`, `post`, `put` and `delete` work like the ones of requests, for
+      the checks that run in a thread: they block that thread until the
+      response arrives. `cancel()` aborts everything in flight, so a
+      cancelled bootstrap doesn't wait for a socket read to time out. When
+      the reactor starts shutting down the waiting threads are woken up,
+      the reactor may be joining them.
+
+The provider.json download, the SRP login and the registration use
+`fetch()` when the session has it, so no thread waits for their responses.
+
+The responses and the errors are the ones of requests, so the code using
+them doesn't change, and GET follows redirects like requests does. The
+connections are kept alive in a pool per CA bundle.
+"""
+import logging
+import threading
+import urllib
+
+from StringIO import StringIO
+
+import requests
+
+from OpenSSL import SSL
+from requests.structures import CaseInsensitiveDict
+
+from twisted.internet import defer, reactor, ssl
+from twisted.internet.error import ConnectError, DNSLookupError
+from twisted.python.failure import Failure
+from twisted.web.client import (Agent, FileBodyProducer, HTTPConnectionPool,
+                                RedirectAgent, readBody)
+from twisted.web.http_headers import Headers
+from twisted.web.iweb import IPolicyForHTTPS
+from zope.interface import implementer
+
+logger = logging.getLogger(__name__)
+
+PEM_BEGIN = "-----BEGIN CERTIFICATE-----"
+
+# Idle connections to keep for each host.
+MAX_PER_HOST = 4
+
+
+class Response(object):
+    """
+    The response of a fetch, with the interface of a requests response.
+    """
+
+    def __init__(self, url, status_code, headers, content):
+        """
+        :param url: the url fetched.
+        :type url: str
+        :param status_code: the HTTP status code.
+        :type status_code: int
+        :param headers: the response headers.
+        :type headers: CaseInsensitiveDict
+        :param content: the body.
+        :type content: str
+        """
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    @property
+    def ok(self):
+        try:
+            self.raise_for_status()
+        except requests.exceptions.HTTPError:
+            return False
+        return True
+
+    @property
+    def text(self):
+        encoding = requests.utils.get_encoding_from_headers(self.headers)
+        return unicode(self.content, encoding or "utf-8", errors="replace")
+
+    def json(self):
+        return requests.compat.json.loads(self.content)
+
+    def raise_for_status(self):
+        """
+        Raises requests' HTTPError for the 4xx and 5xx codes.
+        """
+        if 400 <= self.status_code < 600:
+            raise requests.exceptions.HTTPError(
+                "%s Error for url: %s" % (self.status_code, self.url),
+                response=self)
+
+
+@implementer(IPolicyForHTTPS)
+class _VerifyPolicy(object):
+    """
+    TLS policy for a `verify` value of requests: False doesn't verify, True
+    uses the system CAs, and a path uses the CAs of that bundle.
+    """
+
+    def __init__(self, verify):
+        self._verify = verify
+        self._trust_root = None
+
+    def _get_trust_root(self):
+        if self._trust_root is None:
+            if self._verify is True:
+                self._trust_root = ssl.platformTrust()
+            else:
+                with open(self._verify) as f:
+                    pems = f.read().split(PEM_BEGIN)[1:]
+                self._trust_root = ssl.trustRootFromCertificates(
+                    [ssl.Certificate.loadPEM(PEM_BEGIN + pem)
+                     for pem in pems])
+        return self._trust_root
+
+    def creatorForNetloc(self, hostname, port):
+        if self._verify is False:
+            return ssl.CertificateOptions(verify=False)
+        return ssl.optionsForClientTLS(hostname.decode("ascii"),
+                                       trustRoot=self._get_trust_root())
+
+
+class AgentFetcher(object):
+    """
+    Agents, and their connection pools, for each CA bundle.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # {verify: (Agent, RedirectAgent)}
+        self._agents = {}
+        # set when the reactor starts shutting down
+        self.shutting_down = threading.Event()
+        # the events of the threads waiting for a response
+        self._waiting = set()
+        reactor.addSystemEventTrigger('before', 'shutdown', self.shutdown)
+
+    def add_waiting(self, event):
+        """
+        Register the event a thread waits on for a response, to be set
+        when the reactor shuts down.
+
+        :param event: the event the thread waits on.
+        :type event: threading.Event
+
+        :returns: False if the reactor is already shutting down, and the
+                  thread should not wait.
+        :rtype: bool
+        """
+        with self._lock:
+            if self.shutting_down.is_set():
+                return False
+            self._waiting.add(event)
+            return True
+
+    def remove_waiting(self, event):
+        """
+        Forget an event registered with add_waiting.
+        """
+        with self._lock:
+            self._waiting.discard(event)
+
+    def shutdown(self):
+        """
+        Wake up the threads waiting for a response. Called before the
+        reactor shuts down, it joins the pool threads then.
+        """
+        with self._lock:
+            self.shutting_down.set()
+            waiting = list(self._waiting)
+            self._waiting.clear()
+        for event in waiting:
+            event.set()
+
+    def get_agent(self, verify, redirect=False):
+        """
+        Return the agent for the requests verified with `verify`.
+
+        :param verify: the verify parameter of requests.
+        :type verify: bool or str
+        :param redirect: whether the agent follows the redirects.
+        :type redirect: bool
+
+        :rtype: Agent or RedirectAgent
+        """
+        if verify is None:
+            verify = True
+        with self._lock:
+            agents = self._agents.get(verify)
+            if agents is None:
+                pool = HTTPConnectionPool(reactor, persistent=True)
+                pool.maxPersistentPerHost = MAX_PER_HOST
+                agent = Agent(reactor, contextFactory=_VerifyPolicy(verify),
+                              pool=pool)
+                agents = self._agents[verify] = (agent, RedirectAgent(agent))
+            return agents[1] if redirect else agents[0]
+
+
+# The agents for this process
+_fetcher = AgentFetcher()
+
+
+def _convert_failure(failure, url, timed_out):
+    """
+    Raise the requests exception for a failed fetch.
+    """
+    if timed_out[0]:
+        raise requests.exceptions.Timeout("Timed out fetching %s" % (url,))
+    if failure.check(defer.CancelledError):
+        return failure
+    if failure.check(DNSLookupError, ConnectError):
+        raise requests.exceptions.ConnectionError(str(failure.value))
+    # the errors of a request on its way come wrapped, with their reasons.
+    reasons = getattr(failure.value, "reasons", None)
+    if reasons is not None:
+        if any(reason.check(defer.CancelledError) for reason in reasons):
+            raise defer.CancelledError()
+        if any(reason.check(SSL.Error) for reason in reasons):
+            raise requests.exceptions.SSLError(str(failure.value))
+        raise requests.exceptions.ConnectionError(str(failure.value))
+    return failure
+
+
+class AgentSession(object):
+    """
+    Session of the agent fetcher: its cookies, and the fetches in flight.
+    """
+
+    def __init__(self, fetcher=None):
+        """
+        :param fetcher: the agents to fetch with.
+        :type fetcher: AgentFetcher
+        """
+        self._fetcher = fetcher or _fetcher
+        self._lock = threading.Lock()
+        self._in_flight = set()
+        self.cookies = {}
+        self.headers = {}
+
+    def fetch(self, method, url, params=None, data=None, headers=None,
+              cookies=None, verify=True, timeout=None):
+        """
+        Fetch `url`. Must be called from the reactor thread.
+
+        The parameters are the ones of requests.
+
+        :returns: a deferred that fires with the Response. Cancelling it
+                  aborts the connection.
+        :rtype: Deferred
+        """
+        if isinstance(url, unicode):
+            url = url.encode("utf-8")
+        if params:
+            url = "%s?%s" % (url, urllib.urlencode(params))
+
+        all_headers = dict(self.headers)
+        all_headers.update(headers or {})
+        all_cookies = dict(self.cookies)
+        all_cookies.update(cookies or {})
+        if all_cookies:
+            all_headers["Cookie"] = "; ".join(
+                "%s=%s" % item for item in all_cookies.items())
+
+        body = None
+        if data is not None:
+            if isinstance(data, dict):
+                data = urllib.urlencode(data)
+                all_headers.setdefault(
+                    "Content-Type", "application/x-www-form-urlencoded")
+            body = FileBodyProducer(StringIO(data))
+
+        # requests.get follows the redirects, the other methods don't.
+        agent = self._fetcher.get_agent(verify, redirect=(method == "GET"))
+        d = agent.request(
+            method, url,
+            Headers(dict((k, [v]) for k, v in all_headers.items())), body)
+        d.addCallback(self._read_response, url)
+
+        timed_out = [False]
+        if timeout is not None:
+            def on_timeout():
+                timed_out[0] = True
+                d.cancel()
+            call = reactor.callLater(timeout, on_timeout)
+
+            def stop_timer(result):
+                if call.active():
+                    call.cancel()
+                return result
+            d.addBoth(stop_timer)
+        d.addErrback(_convert_failure, url, timed_out)
+
+        with self._lock:
+            self._in_flight.add(d)
+
+        def done(result):
+            with self._lock:
+                self._in_flight.discard(d)
+            return result
+        d.addBoth(done)
+        return d
+
+    def _read_response(self, response, url):
+        """
+        Read the body of `response`, keep its cookies, and build the
+        Response.
+        """
+        headers = CaseInsensitiveDict()
+        for name, values in response.headers.getAllRawHeaders():
+            headers[name] = ", ".join(values)
+        for cookie in response.headers.getRawHeaders("set-cookie", []):
+            name, _, value = cookie.split(";")[0].partition("=")
+            self.cookies[name.strip()] = value.strip()
+
+        # the url redirected to, if any.
+        request = getattr(response, "request", None)
+        if request is not None:
+            url = request.absoluteURI
+
+        d = readBody(response)
+        d.addCallback(lambda content: Response(url, response.code, headers,
+                                               content))
+        return d
+
+    def _blocking_fetch(self, method, url, **kwargs):
+        """
+        Fetch `url` from a thread that is not the reactor one, waiting for
+        the response.
+
+        It stops waiting when the reactor starts shutting down, the reactor
+        joins the pool threads then, and it would wait for this one.
+
+        :raises requests.exceptions.ConnectionError: if the reactor shuts
+                                                     down first.
+        """
+        done = threading.Event()
+        result = []
+
+        def fetch():
+            d = defer.maybeDeferred(self.fetch, method, url, **kwargs)
+
+            def got_result(value):
+                result.append(value)
+                done.set()
+            d.addBoth(got_result)
+
+        if self._fetcher.add_waiting(done):
+            try:
+                reactor.callFromThread(fetch)
+                done.wait()
+            finally:
+                self._fetcher.remove_waiting(done)
+        if not result:
+            self.cancel()
+            raise requests.exceptions.ConnectionError(
+                "Shutting down, not fetching %s" % (url,))
+        if isinstance(result[0], Failure):
+            result[0].raiseException()
+        return result[0]
+
+    def get(self, url, **kwargs):
+        return self._blocking_fetch("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self._blocking_fetch("POST", url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self._blocking_fetch("PUT", url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self._blocking_fetch("DELETE", url, **kwargs)
+
+    def cancel(self):
+        """
+        Abort the fetches in flight. Can be called from any thread.
+        """
+        with self._lock:
+            in_flight = list(self._in_flight)
+        for d in in_flight:
+            reactor.callFromThread(d.cancel)
+
+
+def can_fetch(session):
+    """
+    Return whether `session` can fetch without a thread, with fetch().
+
+    :rtype: bool
+    """
+    return isinstance(session, AgentSession)
+
+
+def call_in_reactor(f, *args, **kwargs):
+    """
+    Call `f` in the reactor thread, from any thread. It's the way to call
+    fetch() from the callbacks of a chain that runs partly in a pool.
+
+    :returns: a deferred that fires with the result of `f`. Cancelling it
+              cancels the deferred `f` returned.
+    :rtype: Deferred
+    """
+    running = []
+
+    def cancel(d):
+        if running:
+            running[0].cancel()
+
+    d = defer.Deferred(cancel)
+
+    def run():
+        if d.called:
+            # cancelled before it ran.
+            return
+        result = defer.maybeDeferred(f, *args, **kwargs)
+        running.append(result)
+        result.chainDeferred(d)
+
+    reactor.callFromThread(run)
+    return d
+
+
+def session():
+    """
+    Return a new session, like requests.session() does.
+
+    :rtype: AgentSession
+    """
+    return AgentSession()
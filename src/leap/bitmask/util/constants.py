@@ -17,4 +17,16 @@
 
 SIGNUP_TIMEOUT = 5
 REQUEST_TIMEOUT = 15
+# Seconds a provider that passed the setup checks is trusted without
+# checking it again, while its files don't change.
+PROVIDER_VERIFIED_TTL = 24 * 60 * 60
+# Seconds between two background refreshes of the provider files.
+PROVIDER_REFRESH_INTERVAL = 30 * 60
+# Seconds a provider file found current by the server is used without
+# asking again.
+PROVIDER_FRESH_FOR = 60 * 60
+# Longest a resolved address is used, whatever the TTL of its record.
+DNS_MAX_TTL = 60 * 60
+# Seconds a name that failed to resolve is not looked up again.
+DNS_NEGATIVE_TTL = 30
 PASTEBIN_API_DEV_KEY = "09563100642af6085d641f749a1922b4"
@@ -0,0 +1,421 @@
+# -*- coding: utf-8 -*-
+# dnscache.py
+# Copyright (C) 2014 LEAP
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Process wide cache of the DNS lookups.
+
+The provider, api and nickserver hosts are resolved once, and their
+addresses used while the TTL of their records lasts:
+
+    d = dnscache.resolve("api.example.org")             # in the reactor
+    address = dnscache.resolve_blocking("example.org")  # in a thread
+
+In the reactor, the lookups are done with twisted.names, with no thread,
+asking the name servers of /etc/resolv.conf. When twisted.names can't answer
+(there is no resolv.conf, the servers time out or fail) the name is looked
+up with libc, in the DNS thread pool. A lookup that fails is remembered for
+DNS_NEGATIVE_TTL seconds, and the lookups of a name on their way at the same
+time are done once. The threads look up the names that aren't cached with
+libc, themselves.
+
+The requests sent through the shared HTTP pool (see httppool.py) resolve
+their hosts here, and so does twisted, for the agent fetcher, once
+`install()` is called.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+
+from twisted.internet import defer, reactor
+from twisted.internet.abstract import isIPAddress
+from twisted.internet.error import DNSLookupError
+from twisted.internet.interfaces import IResolverSimple
+from twisted.python.failure import Failure
+from zope.interface import implementer
+
+from leap.bitmask.util import threadpools
+from leap.bitmask.util.constants import DNS_MAX_TTL, DNS_NEGATIVE_TTL
+
+logger = logging.getLogger(__name__)
+
+RESOLV_CONF = "/etc/resolv.conf"
+HOSTS = "/etc/hosts"
+
+# Seconds to wait for each try of a twisted.names lookup before falling
+# back to libc, that has its own timeouts.
+LOOKUP_TIMEOUT = (1, 3)
+# Seconds to use the addresses libc resolves, it doesn't tell their TTL.
+DEFAULT_TTL = 5 * 60
+
+
+def _create_resolver():
+    """
+    Return the twisted.names resolver to look up the names with, or None if
+    there are no name servers to ask and libc has to do it.
+
+    Must be called from the reactor thread.
+
+    :rtype: IResolver or None
+    """
+    if not os.path.isfile(RESOLV_CONF):
+        # windows, or no name servers configured.
+        return None
+    from twisted.names import client, hosts, resolve
+    # without the cache of twisted.names, the one here is enough.
+    return resolve.ResolverChain([hosts.Resolver(HOSTS),
+                                  client.Resolver(RESOLV_CONF)])
+
+
+def _normalize(name):
+    """
+    Return `name` as the str the resolvers look up.
+    """
+    if isinstance(name, unicode):
+        name = name.encode("idna")
+    return name.lower()
+
+
+def _not_found(name):
+    """
+    Return the error of a name that can't be resolved, the one
+    socket.gethostbyname raises.
+
+    :rtype: socket.gaierror
+    """
+    return socket.gaierror(socket.EAI_NONAME,
+                           "Could not resolve %s" % (name,))
+
+
+@implementer(IResolverSimple)
+class DNSCache(object):
+    """
+    Thread safe cache of the IPv4 address of each host name.
+    """
+
+    def __init__(self, resolver=None, max_ttl=DNS_MAX_TTL,
+                 negative_ttl=DNS_NEGATIVE_TTL):
+        """
+        :param resolver: the twisted.names resolver to look up the names
+                         with, one that asks the system name servers by
+                         default.
+        :type resolver: IResolver or None
+        :param max_ttl: longest an address is used, whatever its TTL.
+        :type max_ttl: int
+        :param negative_ttl: seconds a name that failed to resolve is not
+                             looked up again.
+        :type negative_ttl: int
+        """
+        self._resolver = resolver
+        self._resolver_created = resolver is not None
+        self._max_ttl = max_ttl
+        self._negative_ttl = negative_ttl
+
+        self._lock = threading.Lock()
+        # {name: (expiration time, address or None if it failed)}
+        self._entries = {}
+        # {name: list of Deferred}, waiting for the lookup on its way
+        self._waiting = {}
+
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.fallbacks = 0
+        self.failures = 0
+
+    def _get_resolver(self):
+        if not self._resolver_created:
+            self._resolver = _create_resolver()
+            self._resolver_created = True
+        return self._resolver
+
+    def _get_cached(self, name):
+        """
+        Return the entry of `name`, if it didn't expire, and count the hit
+        or the miss.
+
+        :returns: the address, None if the name failed to resolve, or
+                  False if it isn't cached.
+        :rtype: str or None or bool
+        """
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None or entry[0] <= time.time():
+                self._entries.pop(name, None)
+                self.misses += 1
+                return False
+            if entry[1] is None:
+                self.negative_hits += 1
+            else:
+                self.hits += 1
+            return entry[1]
+
+    def _store(self, name, address, ttl):
+        """
+        Cache the address of `name` for `ttl` seconds, capped to max_ttl.
+        A None address caches a failure for negative_ttl seconds.
+        """
+        if address is None:
+            ttl = self._negative_ttl
+            with self._lock:
+                self.failures += 1
+        ttl = min(ttl, self._max_ttl)
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._entries[name] = (time.time() + ttl, address)
+
+    def resolve(self, name):
+        """
+        Look up the IPv4 address of `name`.
+
+        Must be called from the reactor thread.
+
+        :param name: the host name.
+        :type name: str or unicode
+
+        :returns: a defer that fires with the address, or fails with
+                  socket.gaierror if the name can't be resolved.
+        :rtype: Deferred
+        """
+        name = _normalize(name)
+        if isIPAddress(name):
+            return defer.succeed(name)
+
+        address = self._get_cached(name)
+        if address is None:
+            return defer.fail(_not_found(name))
+        if address:
+            return defer.succeed(address)
+
+        d = defer.Deferred()
+        waiting = self._waiting.get(name)
+        if waiting is not None:
+            with self._lock:
+                self.coalesced += 1
+            waiting.append(d)
+            return d
+
+        self._waiting[name] = [d]
+        lookup = self._lookup(name)
+        lookup.addBoth(self._lookup_done, name)
+        return d
+
+    def _lookup(self, name):
+        """
+        Look up `name` with twisted.names, or with libc when it can't.
+
+        :returns: a defer that fires with the address and its TTL.
+        :rtype: Deferred
+        """
+        resolver = self._get_resolver()
+        if resolver is None:
+            return self._lookup_libc(name)
+
+        from twisted.names.error import DNSNameError
+
+        def fallback(failure):
+            if failure.check(DNSNameError):
+                # the name servers say it doesn't exist.
+                return failure
+            logger.debug("Resolving %s with libc: %r" % (name, failure.value))
+            with self._lock:
+                self.fallbacks += 1
+            return self._lookup_libc(name)
+
+        d = resolver.lookupAddress(name, timeout=LOOKUP_TIMEOUT)
+        d.addCallback(self._get_address, name)
+        d.addErrback(fallback)
+        return d
+
+    def _get_address(self, result, name):
+        """
+        Return the first address of a twisted.names answer, and the lowest
+        TTL of the records that led to it.
+        """
+        from twisted.names import dns
+        answers, authority, additional = result
+        addresses = [record for record in answers if record.type == dns.A]
+        if not addresses:
+            raise ValueError("No address in the answer for %s" % (name,))
+        ttl = min(record.ttl for record in answers)
+        return addresses[0].payload.dottedQuad(), ttl
+
+    def _lookup_libc(self, name):
+        """
+        Look up `name` with libc, in a thread.
+
+        :returns: a defer that fires with the address and its TTL.
+        :rtype: Deferred
+        """
+        d = threadpools.defer_to_pool(threadpools.DNS, socket.gethostbyname,
+                                      name)
+        d.addCallback(lambda address: (address, DEFAULT_TTL))
+        return d
+
+    def _lookup_done(self, result, name):
+        """
+        Cache the result of the lookup of `name`, and pass it to the ones
+        waiting for it.
+        """
+        if isinstance(result, Failure):
+            logger.debug("Could not resolve %s: %r" % (name, result.value))
+            self._store(name, None, self._negative_ttl)
+        else:
+            address, ttl = result
+            self._store(name, address, ttl)
+
+        for d in self._waiting.pop(name, []):
+            if d.called:
+                # cancelled
+                continue
+            if isinstance(result, Failure):
+                d.errback(_not_found(name))
+            else:
+                d.callback(result[0])
+
+    def resolve_blocking(self, name):
+        """
+        Look up the IPv4 address of `name`, waiting for it.
+
+        The names that aren't cached are looked up with libc, in the calling
+        thread. It never waits on the reactor: the pool threads that call it
+        are joined by the reactor when it shuts down.
+
+        :param name: the host name.
+        :type name: str or unicode
+
+        :returns: the address.
+        :rtype: str
+
+        :raises socket.gaierror: if the name can't be resolved.
+        """
+        name = _normalize(name)
+        if isIPAddress(name):
+            return name
+
+        address = self._get_cached(name)
+        if address is None:
+            raise _not_found(name)
+        if address:
+            return address
+        try:
+            address = socket.gethostbyname(name)
+        except socket.error:
+            self._store(name, None, self._negative_ttl)
+            raise _not_found(name)
+        self._store(name, address, DEFAULT_TTL)
+        return address
+
+    def getHostByName(self, name, timeout=None):
+        """
+        Resolve `name` for twisted, see IResolverSimple.
+
+        :returns: a defer that fires with the address, or fails with
+                  DNSLookupError.
+        :rtype: Deferred
+        """
+        def lookup_error(failure):
+            failure.trap(socket.error)
+            raise DNSLookupError(name)
+
+        d = self.resolve(name)
+        d.addErrback(lookup_error)
+        return d
+
+    def clear(self):
+        """
+        Forget every cached address.
+        """
+        with self._lock:
+            self._entries = {}
+
+    def get_stats(self):
+        """
+        Return the counters of the cache.
+
+        :rtype: dict
+        """
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "negative_hits": self.negative_hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "fallbacks": self.fallbacks,
+                "failures": self.failures,
+            }
+
+    def report(self):
+        """
+        Return a human readable report with the counters of the cache.
+
+        :rtype: str
+        """
+        stats = self.get_stats()
+        names = ("entries", "hits", "negative_hits", "misses", "coalesced",
+                 "fallbacks", "failures")
+        header = " ".join("%13s" % (name,) for name in names)
+        lines = ["dns cache", header, "-" * len(header),
+                 " ".join("%13d" % (stats[name],) for name in names)]
+        return "\n".join(lines) + "\n"
+
+
+# The cache for this process
+cache = DNSCache()
+
+
+def resolve(name):
+    """
+    Look up the address of `name` in the process cache, see
+    DNSCache.resolve.
+    """
+    return cache.resolve(name)
+
+
+def resolve_blocking(name):
+    """
+    Look up the address of `name` in the process cache, waiting for it. See
+    DNSCache.resolve_blocking.
+    """
+    return cache.resolve_blocking(name)
+
+
+def get_stats():
+    """
+    Return the counters of the process cache, see DNSCache.get_stats.
+    """
+    return cache.get_stats()
+
+
+def report():
+    """
+    Return the report of the process cache, see DNSCache.report.
+    """
+    return cache.report()
+
+
+def install():
+    """
+    Make twisted resolve the hosts it connects to through the process cache.
+
+    Twisted then connects to IPv4 addresses only, like the rest of the
+    client does.
+    """
+    reactor.installResolver(cache)
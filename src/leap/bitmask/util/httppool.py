@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+# httppool.py
+# Copyright (C) 2014 LEAP
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Process wide pool of keep-alive HTTP connections.
+
+The bootstrappers and SRPAuth each have their own requests session, for
+their own cookies, but their connections come from the same pool:
+
+    self._session = httppool.mount(self._fetcher.session())
+
+A login talks to the same provider api host several times (provider.json,
+eip config, client cert, smtp config, soledad config), and with the pool
+the TLS handshake is done once instead of once per session.
+
+The connections are pooled by (host, CA bundle): a connection verified
+against a CA bundle is never used for a request verified against another
+one. Python 2 can't resume TLS sessions, keeping the connections alive is
+what saves the handshakes.
+
+The new connections resolve their host with the process dns cache (see
+dnscache.py), instead of asking libc every time.
+"""
+import logging
+import os
+
+from threading import Lock
+
+from requests import Session
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.packages.urllib3.connectionpool import (HTTPConnectionPool,
+                                                      HTTPSConnectionPool)
+
+from leap.bitmask.util import dnscache
+from leap.bitmask.util.compat import requests_has_max_retries
+
+logger = logging.getLogger(__name__)
+
+
+def _resolving_connection(base):
+    """
+    Return a subclass of the urllib3 connection class `base` that resolves
+    its host with the dns cache.
+    """
+    class ResolvingConnection(base):
+        def _new_conn(self):
+            # the certificate and SNI still use the host name, only the
+            # socket is opened to the address.
+            host = self.host
+            self.host = dnscache.resolve_blocking(host)
+            try:
+                return base._new_conn(self)
+            finally:
+                self.host = host
+    return ResolvingConnection
+
+
+class _ResolvingHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _resolving_connection(HTTPConnectionPool.ConnectionCls)
+
+
+class _ResolvingHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _resolving_connection(HTTPSConnectionPool.ConnectionCls)
+
+
+def _resolve_with_cache(manager):
+    """
+    Make the connections of the urllib3 PoolManager `manager` resolve their
+    host with the dns cache.
+    """
+    manager.pool_classes_by_scheme = {
+        "http": _ResolvingHTTPConnectionPool,
+        "https": _ResolvingHTTPSConnectionPool,
+    }
+
+
+class ConnectionPool(object):
+    """
+    Thread safe set of connection pools, one for each host and CA bundle.
+    """
+
+    # Hosts to keep connections to, for each CA bundle.
+    MAX_HOSTS = 10
+    # Connections open to each host at most, a request waits for one of
+    # them to be free rather than opening another.
+    MAX_PER_HOST = 4
+
+    def __init__(self, max_hosts=MAX_HOSTS, max_per_host=MAX_PER_HOST):
+        """
+        :param max_hosts: hosts to keep connections to, for each CA bundle.
+        :type max_hosts: int
+        :param max_per_host: connections open to each host at most.
+        :type max_per_host: int
+        """
+        self._max_hosts = max_hosts
+        self._max_per_host = max_per_host
+        self._lock = Lock()
+        # {verify: urllib3 PoolManager}
+        self._managers = {}
+        # {(verify, max_retries): HTTPAdapter}
+        self._adapters = {}
+        self.sessions = 0
+
+    def _get_adapter(self, verify, max_retries):
+        """
+        Return the adapter that sends the requests verified with `verify`,
+        with `max_retries`. The adapters for the same `verify` share their
+        connections.
+        """
+        if isinstance(verify, basestring):
+            verify = os.path.abspath(verify)
+        key = (verify, max_retries)
+        with self._lock:
+            adapter = self._adapters.get(key)
+            if adapter is not None:
+                return adapter
+
+            kwargs = {}
+            if requests_has_max_retries:
+                kwargs["max_retries"] = max_retries
+            # Blocking, so the limit is enforced. The responses are always
+            # read whole, a connection is not held while waiting for another.
+            adapter = HTTPAdapter(pool_connections=self._max_hosts,
+                                  pool_maxsize=self._max_per_host,
+                                  pool_block=True, **kwargs)
+            manager = self._managers.get(verify)
+            if manager is None:
+                _resolve_with_cache(adapter.poolmanager)
+                self._managers[verify] = adapter.poolmanager
+            else:
+                adapter.poolmanager = manager
+            self._adapters[key] = adapter
+            return adapter
+
+    def mount(self, session, max_retries=0):
+        """
+        Make `session` send its requests through this pool.
+
+        :param session: the session.
+        :type session: requests.Session
+        :param max_retries: times to retry a failed connection.
+        :type max_retries: int
+
+        :returns: the same session.
+        :rtype: requests.Session
+        """
+        if not isinstance(session, Session):
+            # the other fetchers pool their connections themselves.
+            return session
+        adapter = _PooledAdapter(self, max_retries)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        with self._lock:
+            self.sessions += 1
+        return session
+
+    def get_stats(self):
+        """
+        Return the usage of the connections to each host.
+
+        :returns: a dict for each host and CA bundle, with the number of
+                  connections opened to it and of requests sent.
+        :rtype: list of dict
+        """
+        with self._lock:
+            managers = self._managers.items()
+
+        stats = []
+        for verify, manager in managers:
+            for key in manager.pools.keys():
+                pool = manager.pools.get(key)
+                if pool is None:
+                    continue
+                stats.append({
+                    "host": pool.host,
+                    "port": pool.port,
+                    "verify": verify,
+                    "connections": pool.num_connections,
+                    "requests": pool.num_requests,
+                })
+        return stats
+
+    def clear(self):
+        """
+        Close every connection of the pool.
+        """
+        with self._lock:
+            managers = self._managers.values()
+            self._managers = {}
+            self._adapters = {}
+        for manager in managers:
+            manager.clear()
+
+
+class _PooledAdapter(BaseAdapter):
+    """
+    Requests transport adapter that sends through a ConnectionPool.
+    """
+
+    def __init__(self, pool, max_retries):
+        """
+        :param pool: the pool to send through.
+        :type pool: ConnectionPool
+        :param max_retries: times to retry a failed connection.
+        :type max_retries: int
+        """
+        BaseAdapter.__init__(self)
+        self._pool = pool
+        self._max_retries = max_retries
+
+    def send(self, request, stream=False, timeout=None, verify=True,
+             cert=None, proxies=None):
+        adapter = self._pool._get_adapter(verify, self._max_retries)
+        return adapter.send(request, stream=stream, timeout=timeout,
+                            verify=verify, cert=cert, proxies=proxies)
+
+    def close(self):
+        # the connections are shared, closing a session must not close them.
+        pass
+
+
+# The pool for this process
+pool = ConnectionPool()
+
+
+def mount(session, max_retries=0):
+    """
+    Make `session` send its requests through the process pool, see
+    ConnectionPool.mount.
+    """
+    return pool.mount(session, max_retries)
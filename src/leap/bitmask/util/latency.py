@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+# latency.py
+# Copyright (C) 2014 LEAP
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+In-process latency histograms.
+
+The backend records here how long each command waits in the queue, how long
+the component takes to return a defer, and how long until that defer fires.
+The report, along with the stats of the thread pools and of the dns cache,
+can be written on demand sending SIGUSR1 to the process, and at shutdown,
+when the app is launched with --latency-report.
+"""
+import logging
+import signal
+
+from threading import Lock
+
+from twisted.internet import reactor
+
+from leap.bitmask.util import dnscache, threadpools
+
+logger = logging.getLogger(__name__)
+
+# Phases of a backend command
+QUEUED = "queued"
+CALL = "call"
+FIRED = "fired"
+
+PHASES = (QUEUED, CALL, FIRED)
+
+
+class Histogram(object):
+    """
+    Latency histogram with exponential buckets, from 0.1ms to ~100s.
+    """
+
+    BUCKETS = [0.0001 * 2 ** i for i in xrange(21)]
+
+    def __init__(self):
+        """
+        Initializes an empty histogram.
+        """
+        # The last bucket holds everything above the last bound.
+        self._counts = [0] * (len(self.BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        """
+        Record a new value.
+
+        :param value: the latency, in seconds.
+        :type value: float
+        """
+        index = len(self.BUCKETS)
+        for i, bound in enumerate(self.BUCKETS):
+            if value <= bound:
+                index = i
+                break
+
+        self._counts[index] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    @property
+    def mean(self):
+        """
+        Mean of the recorded values.
+
+        :rtype: float
+        """
+        if self.count == 0:
+            return 0.0
+        return self.total / self.count
+
+    def percentile(self, percent):
+        """
+        Return the upper bound of the bucket holding the given percentile.
+
+        :param percent: the percentile to get, between 0 and 100.
+        :type percent: float
+
+        :rtype: float
+        """
+        if self.count == 0:
+            return 0.0
+
+        threshold = self.count * percent / 100.0
+        accumulated = 0
+        for i, count in enumerate(self._counts):
+            accumulated += count
+            if accumulated >= threshold:
+                if i < len(self.BUCKETS):
+                    return min(self.BUCKETS[i], self.max)
+                break
+        return self.max
+
+
+class LatencyStats(object):
+    """
+    Histograms for the backend commands, grouped by component, method and
+    phase.
+    """
+
+    def __init__(self):
+        self._histograms = {}
+        self._lock = Lock()
+
+    def record(self, component, method, phase, value):
+        """
+        Record a latency for a command.
+
+        This can be called from any thread.
+
+        :param component: the key for the component.
+        :type component: str
+        :param method: the method of the component.
+        :type method: str
+        :param phase: one of PHASES.
+        :type phase: str
+        :param value: the latency, in seconds.
+        :type value: float
+        """
+        key = (component, method, phase)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.add(value)
+
+    def get(self, component, method, phase):
+        """
+        Return the histogram for a command phase.
+
+        :rtype: Histogram or None
+        """
+        return self._histograms.get((component, method, phase))
+
+    def report(self):
+        """
+        Return a human readable report with all the histograms. Times are
+        in milliseconds.
+
+        :rtype: str
+        """
+        header = "%-40s %-7s %7s %9s %9s %9s %9s" % (
+            "command", "phase", "count", "mean", "p50", "p90", "max")
+        lines = [header, "-" * len(header)]
+
+        with self._lock:
+            for key in sorted(self._histograms):
+                component, method, phase = key
+                h = self._histograms[key]
+                lines.append("%-40s %-7s %7d %9.1f %9.1f %9.1f %9.1f" % (
+                    "%s.%s" % (component, method), phase, h.count,
+                    h.mean * 1000, h.percentile(50) * 1000,
+                    h.percentile(90) * 1000, h.max * 1000))
+
+        return "\n".join(lines) + "\n"
+
+
+# Stats for the backend of this process
+backend_stats = LatencyStats()
+
+
+def write_report(path):
+    """
+    Write the backend latency report, along with the thread pools and dns
+    cache stats, to a file.
+
+    :param path: the file to write the report to.
+    :type path: str
+    """
+    try:
+        with open(path, "w") as f:
+            f.write(backend_stats.report())
+            f.write("\n")
+            f.write(threadpools.report())
+            f.write("\n")
+            f.write(dnscache.report())
+        logger.debug("Latency report written to %s" % (path,))
+    except IOError as e:
+        logger.error("Could not write latency report: {0!r}".format(e))
+
+
+def install_report_handler(path):
+    """
+    Write the backend latency report to `path` when the process receives
+    SIGUSR1, and when the reactor shuts down.
+
+    :param path: the file to write the report to.
+    :type path: str
+    """
+    def handler(*args):
+        reactor.callFromThread(write_report, path)
+
+    # There is no SIGUSR1 on windows
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, handler)
+
+    reactor.addSystemEventTrigger('before', 'shutdown', write_report, path)
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+# lazyimport.py
+# Copyright (C) 2014 LEAP
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Lazy imports for the heavy dependencies.
+
+Soledad (sqlcipher, u1db), the keymanager (gnupg) and leap.mail take a lot
+of time and memory to load, and an EIP only user never needs them. A
+module declared with `lazy_import` is imported the first time one of its
+attributes is used:
+
+    soledad_client = lazy_import("leap.soledad.client")
+    ...
+    if failure.check(soledad_client.NoStorageSecret):
+
+HEAVY_MODULES lists the packages that must not be loaded at startup, the
+startup budget test checks them.
+"""
+import importlib
+import sys
+
+# Packages that only the mail and soledad components need.
+HEAVY_MODULES = (
+    "gnupg",
+    "leap.keymanager",
+    "leap.mail",
+    "leap.soledad",
+)
+
+
+class LazyModule(object):
+    """
+    Stands for a module, and imports it on the first attribute access.
+    """
+
+    def __init__(self, name):
+        """
+        :param name: the full name of the module.
+        :type name: str
+        """
+        self.__name = name
+        self.__module = None
+
+    def __load(self):
+        """
+        Import the module, if it wasn't yet, and return it.
+
+        The import lock makes this safe to call from several threads.
+        """
+        if self.__module is None:
+            self.__module = importlib.import_module(self.__name)
+        return self.__module
+
+    def __getattr__(self, attr):
+        return getattr(self.__load(), attr)
+
+    def __repr__(self):
+        state = "loaded" if self.__module is not None else "not loaded"
+        return "<lazy module %r (%s)>" % (self.__name, state)
+
+
+def lazy_import(name):
+    """
+    Return a stand-in for the module `name`, that imports it only when it
+    gets used.
+
+    :param name: the full name of the module.
+    :type name: str
+    :rtype: LazyModule
+    """
+    return LazyModule(name)
+
+
+def loaded_heavy_modules():
+    """
+    Return the heavy modules that are already loaded.
+
+    :rtype: list of str
+    """
+    return sorted(name for name in sys.modules
+                  if sys.modules[name] is not None and
+                  any(name == heavy or name.startswith(heavy + ".")
+                      for heavy in HEAVY_MODULES))
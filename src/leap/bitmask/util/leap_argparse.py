@@ -67,6 +67,48 @@ def build_parser():
                         help='Skips the provider checks in the wizard (use '
                              'for testing purposes only).')
 
+    parser.add_argument('--backend-process', default=False,
+                        action="store_true", dest="backend_process",
+                        help='Runs the backend in a separate process, '
+                             'talking to the interface through a local '
+                             'socket.')
+    # The frontend runs the bundle binary with this to get its backend
+    # daemon, when there is no interpreter to run backend_ipc with.
+    parser.add_argument('--backend-daemon', default=False,
+                        action="store_true", dest="backend_daemon",
+                        help=argparse.SUPPRESS)
+
+    parser.add_argument('--latency-report', metavar="/path/to/report",
+                        nargs='?', action="store", dest="latency_report",
+                        help='Writes the latency of the backend commands, '
+                             'and the thread pools usage, to the given file '
+                             'when receiving SIGUSR1 and at shutdown.')
+
+    parser.add_argument('--headless', default=False,
+                        action="store_true", dest="headless",
+                        help='Runs only the backend, without interface and '
+                             'without loading Qt. The signals go to the '
+                             'log.')
+
+    parser.add_argument('--twisted-fetcher', default=False,
+                        action="store_true", dest="twisted_fetcher",
+                        help='Fetches the provider files and talks to the '
+                             'api with the Twisted HTTP client instead of '
+                             'requests, so the cancelled setups and logins '
+                             'drop their connections at once.')
+
+    parser.add_argument('--control-socket', metavar="/path/to/socket",
+                        nargs='?', action="store", dest="control_socket",
+                        help='In headless mode, listens on this Unix socket '
+                             'for a client to drive the backend.')
+
+    parser.add_argument('--profile-startup', metavar="/path/to/report.json",
+                        nargs='?', action="store", dest="profile_startup",
+                        help='Writes the time spent in each phase of the '
+                             'startup, and importing each module, to the '
+                             'given file as json, once the main window '
+                             'is shown.')
+
     # openvpn options
     parser.add_argument('--openvpn-verbosity', nargs='?',
                         type=int,
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+# qtreactor.py
+# Copyright (C) 2014 LEAP
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Integration of the Twisted reactor with the Qt event loop.
+
+Qt runs the main loop. The reactor waits for its sockets and timers in a
+thread, and hands the work over to the main thread through a queued Qt
+signal. Nothing polls: when there is nothing to do, both loops sleep.
+
+Usage:
+    qtreactor.install()  # before anything imports the reactor
+    ...
+    qtreactor.interleave(app)
+    app.exec_()
+"""
+import errno
+import logging
+import os
+import signal
+
+try:
+    import fcntl
+except ImportError:
+    # windows, there the signals can wait for the next event.
+    fcntl = None
+
+from PySide import QtCore
+
+from twisted.internet import _threadedselect
+
+logger = logging.getLogger(__name__)
+
+# The waker has to live while the app runs
+_waker = None
+
+
+def install():
+    """
+    Install the reactor.
+
+    This has to be called before anything imports twisted.internet.reactor.
+    """
+    _threadedselect.install()
+
+
+class _Waker(QtCore.QObject):
+    """
+    Runs in the main thread the functions handed over by the reactor thread.
+    """
+
+    wakeup = QtCore.Signal(object)
+
+    def __init__(self):
+        QtCore.QObject.__init__(self)
+        self.wakeup.connect(self._run, QtCore.Qt.QueuedConnection)
+
+    def __call__(self, func):
+        """
+        Schedule `func` to run in the main thread.
+
+        This is called from the reactor thread.
+
+        :param func: the function to run.
+        :type func: callable
+        """
+        self.wakeup.emit(func)
+
+    def _run(self, func):
+        func()
+
+
+class _SignalWaker(object):
+    """
+    Reader that wakes the reactor up when the process gets a signal.
+
+    Python runs the signal handlers only when the main thread runs some
+    python code, and the main thread sleeps inside Qt. Writing to this pipe
+    on each signal (see signal.set_wakeup_fd) gets python to run.
+    """
+
+    def __init__(self):
+        self._read_fd, self._write_fd = os.pipe()
+        for fd in (self._read_fd, self._write_fd):
+            flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+            fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+    def install(self):
+        """
+        Make this the wakeup fd for the signals.
+        """
+        signal.set_wakeup_fd(self._write_fd)
+
+    def fileno(self):
+        return self._read_fd
+
+    def doRead(self):
+        try:
+            while os.read(self._read_fd, 64):
+                pass
+        except OSError as e:
+            if e.errno != errno.EAGAIN:
+                raise
+
+    def connectionLost(self, reason):
+        os.close(self._read_fd)
+        os.close(self._write_fd)
+
+    def logPrefix(self):
+        return "qtreactor-signals"
+
+
+def _install_signal_waker(reactor):
+    """
+    Wake up the reactor on signals, unless Twisted already set a wakeup fd
+    for them.
+
+    :param reactor: the running reactor.
+    """
+    if not hasattr(signal, "set_wakeup_fd") or fcntl is None:
+        return
+
+    # set_wakeup_fd returns the previous one, put it back if there was one.
+    previous = signal.set_wakeup_fd(-1)
+    if previous != -1:
+        signal.set_wakeup_fd(previous)
+        return
+
+    waker = _SignalWaker()
+    waker.install()
+    reactor.addReader(waker)
+
+
+def interleave(app):
+    """
+    Interleave the reactor with the Qt event loop of `app`. The reactor runs
+    once `app.exec_()` is called, and stopping the reactor quits the app.
+
+    :param app: the Qt application.
+    :type app: QtCore.QCoreApplication
+    """
+    global _waker
+    from twisted.internet import reactor
+
+    _waker = _Waker()
+    reactor.interleave(_waker)
+    reactor.addSystemEventTrigger('after', 'shutdown', app.quit)
+    _install_signal_waker(reactor)
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+# querycache.py
+# Copyright (C) 2014 LEAP
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Cache for the results of the backend queries.
+
+A result is valid while the files it was computed from stay the same (same
+mtime and size) and it's not older than a maximum age, for the results that
+also depend on time, like the validity of a certificate.
+"""
+import logging
+import os
+import time
+
+from threading import Lock
+
+logger = logging.getLogger(__name__)
+
+
+def fingerprint(paths):
+    """
+    Return a value that changes whenever any of the files changes.
+
+    :param paths: the absolute paths of the files.
+    :type paths: iterable of str
+
+    :rtype: tuple
+    """
+    result = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            result.append((path, st.st_mtime, st.st_size))
+        except OSError:
+            # a missing file is a state too, it may show up later.
+            result.append((path, None, None))
+    return tuple(result)
+
+
+class QueryCache(object):
+    """
+    Thread safe cache of query results, keyed by query and invalidated when
+    their files change.
+    """
+
+    # Maximum age of a result, in seconds.
+    DEFAULT_MAX_AGE = 60
+
+    def __init__(self, max_age=DEFAULT_MAX_AGE):
+        """
+        :param max_age: how long a result can be used, in seconds.
+        :type max_age: float
+        """
+        self._max_age = max_age
+        self._entries = {}
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, paths, compute, *args, **kwargs):
+        """
+        Return the cached result for `key`, or compute it and cache it if
+        there is no valid one.
+
+        :param key: identifies the query and its arguments.
+        :type key: hashable
+        :param paths: the absolute paths of the files the result depends on.
+        :type paths: iterable of str
+        :param compute: the function that computes the result, it's called
+                        with the rest of the arguments.
+        :type compute: callable
+        """
+        stamp = fingerprint(paths)
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                cached_stamp, cached_at, result = entry
+                if cached_stamp == stamp and now - cached_at < self._max_age:
+                    self.hits += 1
+                    return result
+            self.misses += 1
+
+        result = compute(*args, **kwargs)
+
+        with self._lock:
+            self._entries[key] = (stamp, now, result)
+        return result
+
+    def invalidate(self, key=None):
+        """
+        Forget the result for `key`, or every result if no key is given.
+
+        :param key: identifies the query and its arguments.
+        :type key: hashable
+        """
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
@@ -16,36 +16,27 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 """
-Request helpers for backward compatible "parsing" of requests
+Request helpers for the responses of requests
 """
 import time
-import json
 
 from dateutil import parser as dateparser
 
 
 def get_content(request):
     """
-    Returns the content by trying to get it from the json
-    property/function or from content, in that order.
-    Also returns the mtime for that content if available
+    Returns the content of the response as it came, and its mtime if
+    available.
+
+    The content is not parsed here: the configs and the callers parse it
+    once, when they load it.
 
     :param request: request as it is given by requests
     :type request: Response
 
     :rtype: tuple (contents, mtime)
     """
-
-    contents = ""
-    mtime = None
-
-    if request and request.content and request.json:
-        if callable(request.json):
-            contents = json.dumps(request.json())
-        else:
-            contents = json.dumps(request.json)
-    else:
-        contents = request.content
+    contents = request.content
 
     mtime = None
     last_modified = request.headers.get('last-modified', None)
@@ -17,10 +17,19 @@
 
 """
 Utility to check the needed requirements.
+
+Once every requirement is satisfied, the result is cached, keyed by the
+requirements and the mtimes of the directories in sys.path: installing,
+upgrading or removing a package changes the directory that holds it. The
+next launches skip the scan of the installed distributions until any of
+them changes.
 """
 
+import hashlib
+import json
 import os
 import logging
+import sys
 
 from pkg_resources import (DistributionNotFound,
                            get_distribution,
@@ -28,8 +37,12 @@ from pkg_resources import (DistributionNotFound,
                            resource_stream,
                            VersionConflict)
 
+from leap.bitmask.util import get_path_prefix
+
 logger = logging.getLogger(__name__)
 
+CACHE_FILE = "requirements.json"
+
 
 def get_requirements():
     """
@@ -64,14 +77,92 @@ def get_requirements():
     return requirements
 
 
-def check_requirements():
+def get_cache_path():
+    """
+    Return the path of the file where the check result is cached.
+
+    :rtype: str
+    """
+    return os.path.join(get_path_prefix(), "leap", CACHE_FILE)
+
+
+def get_cache_key(requirements):
+    """
+    Return a key that changes when the requirements change or a package is
+    installed, upgraded or removed.
+
+    :param requirements: the requirements to check.
+    :type requirements: list of str
+    :rtype: str
+    """
+    digest = hashlib.sha256()
+    for requirement in requirements:
+        digest.update(requirement + "\n")
+
+    for path in sys.path:
+        try:
+            mtime = os.stat(path or os.curdir).st_mtime
+        except OSError:
+            mtime = None
+        digest.update("%s %r\n" % (path, mtime))
+
+    return digest.hexdigest()
+
+
+def _is_cached(key):
+    """
+    Return whether the cache says the requirements for `key` are satisfied.
+
+    :type key: str
+    :rtype: bool
+    """
+    try:
+        with open(get_cache_path()) as f:
+            return json.load(f).get("key") == key
+    except (IOError, OSError, ValueError, AttributeError):
+        return False
+
+
+def _save_cache(key):
+    """
+    Remember that the requirements for `key` are satisfied.
+
+    :type key: str
+    """
+    path = get_cache_path()
+    tmp_path = "%s.%d" % (path, os.getpid())
+    try:
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(tmp_path, "w") as f:
+            json.dump({"key": key}, f)
+        os.rename(tmp_path, path)
+    except (IOError, OSError) as e:
+        logger.warning("Could not cache the requirements check: %r" % (e,))
+
+
+def check_requirements(use_cache=True):
     """
     This function check the dependencies declared in the
     requirement(s) file(s) and logs the results.
+
+    :param use_cache: whether to skip the check if nothing changed since
+                      the last one that found everything in place.
+    :type use_cache: bool
+
+    :returns: whether all the requirements are satisfied.
+    :rtype: bool
     """
     logger.debug("Checking requirements...")
     requirements = get_requirements()
 
+    key = get_cache_key(requirements)
+    if use_cache and _is_cached(key):
+        logger.debug("Requirements unchanged since the last check, OK")
+        return True
+
+    satisfied = True
     for package in requirements:
         try:
             get_distribution(package)
@@ -90,13 +181,20 @@ def check_requirements():
 
             result = "%s ... %s" % (package, msg)
             logger.error(result)
+            satisfied = False
         except DistributionNotFound:
             msg = "Error: package not found!"
             result = "%s ... %s" % (package, msg)
             logger.error(result)
+            satisfied = False
         else:
             msg = "OK"
             result = "%s ... %s" % (package, msg)
             logger.debug(result)
 
     logger.debug('Done')
+
+    # only a good result is cached, the errors have to show up each time.
+    if satisfied and requirements:
+        _save_cache(key)
+    return satisfied
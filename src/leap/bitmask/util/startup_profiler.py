@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+# startup_profiler.py
+# Copyright (C) 2014 LEAP
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Startup timeline profiler.
+
+app.main records its phases here. With --profile-startup, the time spent
+importing each module is recorded too, and everything is written as json
+once the main window is painted for the first time:
+
+    {
+        "version": "0.6.0",
+        "started_at": 1402569015.25,     # epoch, the app module import
+        "total": 2.34,                   # seconds until the report
+        "phases": [
+            {"name": "parse_args", "start": 0.01, "duration": 0.02},
+            ...
+        ],
+        "imports": [
+            {"module": "leap.bitmask.gui.mainwindow", "start": 0.9,
+             "duration": 0.6, "self": 0.05},
+            ...
+        ]
+    }
+
+The times are in seconds, relative to `started_at`. The duration of an
+import includes the modules it imports, `self` does not.
+"""
+import __builtin__
+import json
+import logging
+import sys
+import threading
+import time
+
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class StartupProfiler(object):
+    """
+    Records the startup phases and, once enabled, the module imports.
+    """
+
+    def __init__(self):
+        self.started_at = time.time()
+        self._phases = []
+        self._imports = []
+        self._path = None
+        self._original_import = None
+        self._main_thread = threading.current_thread()
+
+        # time spent in the nested imports, one entry per import running
+        self._children_time = []
+
+    @property
+    def enabled(self):
+        """
+        Whether the profiler will write a report.
+
+        :rtype: bool
+        """
+        return self._path is not None
+
+    def _now(self):
+        return time.time() - self.started_at
+
+    def enable(self, path):
+        """
+        Start recording the imports, and write the report to `path` when
+        `finish` is called.
+
+        :param path: the file for the report.
+        :type path: str
+        """
+        self._path = path
+        if self._original_import is None:
+            self._original_import = __builtin__.__import__
+            __builtin__.__import__ = self._import
+
+    def _import(self, name, *args, **kwargs):
+        """
+        Replacement for __import__ that times the imports that load new
+        modules.
+        """
+        if threading.current_thread() is not self._main_thread:
+            return self._original_import(name, *args, **kwargs)
+
+        loaded = len(sys.modules)
+        start = time.time()
+        self._children_time.append(0.0)
+        try:
+            return self._original_import(name, *args, **kwargs)
+        finally:
+            duration = time.time() - start
+            children = self._children_time.pop()
+            if self._children_time:
+                self._children_time[-1] += duration
+
+            if len(sys.modules) > loaded:
+                self._imports.append({
+                    "module": name,
+                    "start": start - self.started_at,
+                    "duration": duration,
+                    "self": duration - children,
+                })
+
+    def add_phase(self, name, start, end):
+        """
+        Record a phase that already happened.
+
+        :param name: the name of the phase.
+        :type name: str
+        :param start: when it started, epoch.
+        :type start: float
+        :param end: when it ended, epoch.
+        :type end: float
+        """
+        self._phases.append({
+            "name": name,
+            "start": start - self.started_at,
+            "duration": end - start,
+        })
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Context manager that records the time spent in its block as a phase.
+
+        :param name: the name of the phase.
+        :type name: str
+        """
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add_phase(name, start, time.time())
+
+    def mark(self, name):
+        """
+        Record an instant, as a phase with no duration.
+
+        :param name: the name of the event.
+        :type name: str
+        """
+        now = time.time()
+        self.add_phase(name, now, now)
+
+    def get_report(self):
+        """
+        Return the report.
+
+        :rtype: dict
+        """
+        from leap.bitmask import __version__ as VERSION
+        return {
+            "version": VERSION,
+            "started_at": self.started_at,
+            "total": self._now(),
+            "phases": list(self._phases),
+            "imports": sorted(self._imports, key=lambda i: i["start"]),
+        }
+
+    def finish(self):
+        """
+        Stop recording the imports and write the report, if enabled.
+        """
+        if self._original_import is not None:
+            __builtin__.__import__ = self._original_import
+            self._original_import = None
+
+        if not self.enabled:
+            return
+
+        path, self._path = self._path, None
+        try:
+            with open(path, "w") as f:
+                json.dump(self.get_report(), f, indent=2, sort_keys=True)
+            logger.debug("Startup profile written to %s" % (path,))
+        except IOError as e:
+            logger.error("Could not write startup profile: {0!r}".format(e))
+
+
+# The profiler for this process, app.main uses it
+profiler = StartupProfiler()
+
+
+def finish_on_first_paint(widget):
+    """
+    Finish the profile when `widget` is painted for the first time.
+
+    :param widget: the main window.
+    :type widget: QtGui.QWidget
+    """
+    from PySide import QtCore
+
+    class _FirstPaintFilter(QtCore.QObject):
+        def eventFilter(self, obj, event):
+            if event.type() == QtCore.QEvent.Paint:
+                obj.removeEventFilter(self)
+                profiler.mark("first_paint")
+                profiler.finish()
+            return False
+
+    # keep a reference, the widget doesn't own the filter
+    widget._startup_paint_filter = _FirstPaintFilter()
+    widget.installEventFilter(widget._startup_paint_filter)
@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+# test_agentfetcher.py
+# Copyright (C) 2014 LEAP
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+tests for the agent fetcher
+"""
+import socket
+import threading
+import time
+
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+import requests
+
+from nose.twistedtools import deferred, reactor
+from twisted.internet import defer, threads
+from twisted.python.threadpool import ThreadPool
+
+from leap.bitmask.util import agentfetcher
+from leap.common.testing.basetest import BaseLeapTest
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """
+    Answers the tests requests.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def _answer(self, code, body, headers=()):
+        self.send_response(code)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/slow":
+            time.sleep(2)
+        if self.path == "/missing":
+            self._answer(404, "not found")
+            return
+        if self.path == "/moved":
+            self._answer(301, "", [("Location", "/provider.json")])
+            return
+        cookie = self.headers.get("Cookie", "")
+        self._answer(200, '{"cookie": "%s"}' % (cookie,),
+                     [("Set-Cookie", "_session_id=1; path=/"),
+                      ("ETag", '"abc"')])
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self._answer(200, self.rfile.read(length))
+
+    def log_message(self, *args):
+        pass
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class AgentFetcherTestCase(BaseLeapTest):
+    """
+    Tests for the agent fetcher sessions.
+    """
+
+    def setUp(self):
+        self.server = _ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.url = "http://127.0.0.1:%d" % (self.server.server_port,)
+        self.session = agentfetcher.session()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    @deferred(timeout=5)
+    def test_fetch(self):
+        d = self.session.fetch("GET", self.url + "/provider.json")
+
+        def check(res):
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(res.headers["etag"], '"abc"')
+            self.assertEqual(res.json(), {"cookie": ""})
+            self.assertEqual(self.session.cookies, {"_session_id": "1"})
+            # the next request sends the cookie back
+            return self.session.fetch("GET", self.url)
+
+        def check_cookie(res):
+            self.assertEqual(res.json(), {"cookie": "_session_id=1"})
+        d.addCallback(check)
+        d.addCallback(check_cookie)
+        return d
+
+    @deferred(timeout=5)
+    def test_blocking_post_from_thread(self):
+        d = threads.deferToThread(self.session.post, self.url,
+                                  data={"login": "user"})
+
+        def check(res):
+            self.assertEqual(res.content, "login=user")
+        d.addCallback(check)
+        return d
+
+    @deferred(timeout=5)
+    def test_raise_for_status(self):
+        d = self.session.fetch("GET", self.url + "/missing")
+
+        def check(res):
+            self.assertRaises(requests.exceptions.HTTPError,
+                              res.raise_for_status)
+        d.addCallback(check)
+        return d
+
+    @deferred(timeout=5)
+    def test_ok_and_text(self):
+        d = self.session.fetch("GET", self.url + "/missing")
+
+        def check(res):
+            self.assertFalse(res.ok)
+            self.assertEqual(res.text, u"not found")
+            return self.session.fetch("GET", self.url)
+
+        d.addCallback(check)
+        d.addCallback(lambda res: self.assertTrue(res.ok))
+        return d
+
+    @deferred(timeout=5)
+    def test_get_follows_redirects(self):
+        d = self.session.fetch("GET", self.url + "/moved")
+
+        def check(res):
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(res.url, self.url + "/provider.json")
+        d.addCallback(check)
+        return d
+
+    @deferred(timeout=5)
+    def test_stops_waiting_on_shutdown(self):
+        fetcher = agentfetcher.AgentFetcher()
+        session = agentfetcher.AgentSession(fetcher)
+        pool = ThreadPool(minthreads=0, maxthreads=1)
+        pool.start()
+        d = threads.deferToThreadPool(reactor, pool, session.get,
+                                      self.url + "/slow")
+        started = time.time()
+        time.sleep(0.2)
+
+        # what the reactor does on shutdown, the thread must not wait for it
+        fetcher.shutdown()
+        pool.stop()
+        self.assertTrue(time.time() - started < 1.5)
+
+        def check(failure):
+            failure.trap(requests.exceptions.ConnectionError)
+        d.addCallbacks(lambda _: self.fail("Not stopped"), check)
+        return d
+
+    @deferred(timeout=5)
+    def test_cancel(self):
+        d = threads.deferToThread(self.session.get, self.url + "/slow")
+        started = time.time()
+        threads.deferToThread(time.sleep, 0.2).addCallback(
+            lambda _: self.session.cancel())
+
+        def check(failure):
+            failure.trap(defer.CancelledError)
+            self.assertTrue(time.time() - started < 1.5)
+        d.addCallbacks(lambda _: self.fail("Not cancelled"), check)
+        return d
+
+    @deferred(timeout=5)
+    def test_timeout(self):
+        d = self.session.fetch("GET", self.url + "/slow", timeout=0.2)
+
+        def check(failure):
+            failure.trap(requests.exceptions.Timeout)
+        d.addCallbacks(lambda _: self.fail("No timeout"), check)
+        return d
+
+    @deferred(timeout=5)
+    def test_connection_error(self):
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+        sock.close()
+        d = self.session.fetch("GET", "http://127.0.0.1:%d/" % (port,))
+
+        def check(failure):
+            failure.trap(requests.exceptions.ConnectionError)
+        d.addCallbacks(lambda _: self.fail("Connected"), check)
+        return d
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+# test_dnscache.py
+# Copyright (C) 2014 LEAP
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+tests for the dns cache
+"""
+import socket
+import threading
+import time
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+import mock
+
+from nose.twistedtools import deferred, reactor
+from twisted.internet import defer, threads
+from twisted.internet.error import DNSLookupError
+from twisted.names import dns
+from twisted.names.error import DNSNameError, DNSQueryTimeoutError
+from twisted.python.threadpool import ThreadPool
+
+from leap.bitmask.util import dnscache
+from leap.bitmask.util.dnscache import DNSCache
+from leap.common.testing.basetest import BaseLeapTest
+
+# pylint: avoid unused import
+assert(reactor)
+
+NAME = "api.example.org"
+
+
+def _answer(address, ttl, cname_ttl=None):
+    """
+    Return a twisted.names answer with the address of NAME.
+    """
+    answers = []
+    if cname_ttl is not None:
+        answers.append(dns.RRHeader(NAME, dns.CNAME, ttl=cname_ttl,
+                                    payload=dns.Record_CNAME("example.org")))
+    answers.append(dns.RRHeader("example.org", dns.A, ttl=ttl,
+                                payload=dns.Record_A(address, ttl)))
+    return answers, [], []
+
+
+class DNSCacheTestCase(BaseLeapTest):
+    """
+    Tests for the DNSCache class.
+    """
+
+    def setUp(self):
+        self.resolver = mock.MagicMock()
+        self._answer_with(_answer("1.2.3.4", 300))
+        self.cache = DNSCache(resolver=self.resolver, max_ttl=600,
+                              negative_ttl=30)
+        self.now = 1000
+        patch = mock.patch.object(dnscache.time, "time",
+                                  side_effect=lambda: self.now)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        pass
+
+    def _answer_with(self, answer):
+        """
+        Make every lookup return `answer`, or fail with it if it's an
+        exception.
+        """
+        def lookup(name, timeout=None):
+            if isinstance(answer, Exception):
+                return defer.fail(answer)
+            return defer.succeed(answer)
+        self.resolver.lookupAddress.side_effect = lookup
+
+    def _resolve(self, name=NAME):
+        """
+        Return the result of a lookup that fires right away.
+        """
+        result = []
+        self.cache.resolve(name).addBoth(result.append)
+        return result[0]
+
+    def test_addresses_are_cached_for_their_ttl(self):
+        self._answer_with(_answer("1.2.3.4", 300, cname_ttl=100))
+
+        self.assertEqual(self._resolve(), "1.2.3.4")
+        self.now += 99
+        self.assertEqual(self._resolve(), "1.2.3.4")
+        self.assertEqual(self.resolver.lookupAddress.call_count, 1)
+
+        # the cname expired
+        self.now += 1
+        self.assertEqual(self._resolve(), "1.2.3.4")
+        self.assertEqual(self.resolver.lookupAddress.call_count, 2)
+
+        stats = self.cache.get_stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 2)
+
+    def test_ttl_is_capped(self):
+        self._answer_with(_answer("1.2.3.4", 86400))
+        self._resolve()
+        self.now += 600
+        self._resolve()
+        self.assertEqual(self.resolver.lookupAddress.call_count, 2)
+
+    def test_failures_are_cached(self):
+        self._answer_with(DNSNameError())
+
+        failure = self._resolve()
+        self.assertTrue(failure.check(socket.gaierror))
+        self.now += 29
+        failure = self._resolve()
+        self.assertTrue(failure.check(socket.gaierror))
+        self.assertEqual(self.resolver.lookupAddress.call_count, 1)
+
+        self.now += 1
+        self._answer_with(_answer("1.2.3.4", 300))
+        self.assertEqual(self._resolve(), "1.2.3.4")
+
+        stats = self.cache.get_stats()
+        self.assertEqual(stats["negative_hits"], 1)
+        self.assertEqual(stats["failures"], 1)
+
+    def test_lookups_on_their_way_are_shared(self):
+        lookup = defer.Deferred()
+        self.resolver.lookupAddress.side_effect = None
+        self.resolver.lookupAddress.return_value = lookup
+
+        results = []
+        for i in range(3):
+            self.cache.resolve(NAME).addCallback(results.append)
+        self.assertEqual(results, [])
+
+        lookup.callback(_answer("1.2.3.4", 300))
+        self.assertEqual(results, ["1.2.3.4"] * 3)
+        self.assertEqual(self.resolver.lookupAddress.call_count, 1)
+        self.assertEqual(self.cache.get_stats()["coalesced"], 2)
+
+    def test_falls_back_to_libc(self):
+        self._answer_with(DNSQueryTimeoutError(NAME))
+        self.cache._lookup_libc = mock.MagicMock(
+            return_value=defer.succeed(("5.6.7.8", dnscache.DEFAULT_TTL)))
+
+        self.assertEqual(self._resolve(), "5.6.7.8")
+        self.cache._lookup_libc.assert_called_once_with(NAME)
+        self.assertEqual(self.cache.get_stats()["fallbacks"], 1)
+
+    def test_addresses_and_unicode_names(self):
+        self.assertEqual(self._resolve("10.0.0.1"), "10.0.0.1")
+        self.assertFalse(self.resolver.lookupAddress.called)
+
+        self._resolve(u"API.example.org")
+        self.assertEqual(self.resolver.lookupAddress.call_args[0][0], NAME)
+
+    def test_twisted_gets_lookup_errors(self):
+        self._answer_with(DNSNameError())
+        result = []
+        self.cache.getHostByName(NAME).addErrback(result.append)
+        self.assertTrue(result[0].check(DNSLookupError))
+
+    def test_resolve_blocking(self):
+        self.cache.resolve(NAME)
+        self.assertEqual(self.cache.resolve_blocking(NAME), "1.2.3.4")
+        self.assertEqual(self.cache.resolve_blocking("10.0.0.1"), "10.0.0.1")
+
+        with mock.patch.object(dnscache.socket, "gethostbyname",
+                               side_effect=socket.gaierror()) as lookup:
+            for i in range(2):
+                self.assertRaises(socket.gaierror,
+                                  self.cache.resolve_blocking,
+                                  "missing.example.org")
+            lookup.assert_called_once_with("missing.example.org")
+        self.assertEqual(self.resolver.lookupAddress.call_count, 1)
+
+    @deferred(timeout=10)
+    def test_pools_stop_during_a_lookup(self):
+        started = threading.Event()
+
+        def gethostbyname(name):
+            started.set()
+            time.sleep(0.2)
+            return "1.2.3.4"
+
+        patch = mock.patch.object(dnscache.socket, "gethostbyname",
+                                  side_effect=gethostbyname)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+        pool = ThreadPool(minthreads=0, maxthreads=1)
+        pool.start()
+        d = threads.deferToThreadPool(reactor, pool,
+                                      self.cache.resolve_blocking, NAME)
+        started.wait(5)
+        # what the reactor does on shutdown, the lookup must not wait for it
+        pool.stop()
+        d.addCallback(self.assertEqual, "1.2.3.4")
+        return d
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+# test_httppool.py
+# Copyright (C) 2014 LEAP
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+tests for the shared http connection pool
+"""
+import threading
+import time
+
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+import requests
+
+from leap.bitmask.util.httppool import ConnectionPool
+from leap.common.testing.basetest import BaseLeapTest
+
+
+class _KeepAliveHandler(BaseHTTPRequestHandler):
+    """
+    Answers every GET with a small body, keeping the connection open.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if self.path == "/slow":
+            time.sleep(0.2)
+        body = "ok"
+        self.send_response(200)
+        if self.path == "/login":
+            self.send_header("Set-Cookie", "_session_id=1")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    """
+    Serves each kept alive connection in its own thread.
+    """
+    daemon_threads = True
+
+
+class ConnectionPoolTestCase(BaseLeapTest):
+    """
+    Tests for the ConnectionPool.
+    """
+
+    def setUp(self):
+        self.server = _ThreadingHTTPServer(("127.0.0.1", 0),
+                                           _KeepAliveHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.url = "http://127.0.0.1:%d" % (self.server.server_port,)
+        self.pool = ConnectionPool()
+
+    def tearDown(self):
+        self.pool.clear()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _get_stats(self, verified):
+        # a verified request has the path of the CA bundle, or True.
+        return [s for s in self.pool.get_stats()
+                if bool(s["verify"]) == verified]
+
+    def test_sessions_share_connections(self):
+        first = self.pool.mount(requests.session())
+        second = self.pool.mount(requests.session(), max_retries=30)
+        first.get(self.url + "/provider.json")
+        second.get(self.url + "/eip-service.json")
+        first.get(self.url + "/smtp-service.json")
+
+        stats = self._get_stats(True)
+        self.assertEqual(len(stats), 1)
+        self.assertEqual(stats[0]["connections"], 1)
+        self.assertEqual(stats[0]["requests"], 3)
+        self.assertEqual(self.pool.sessions, 2)
+
+    def test_pooled_by_ca_bundle(self):
+        session = self.pool.mount(requests.session())
+        session.get(self.url, verify=True)
+        session.get(self.url, verify=False)
+
+        self.assertEqual(self._get_stats(True)[0]["connections"], 1)
+        self.assertEqual(self._get_stats(False)[0]["connections"], 1)
+
+    def test_sessions_keep_their_cookies(self):
+        first = self.pool.mount(requests.session())
+        second = self.pool.mount(requests.session())
+        first.get(self.url + "/login")
+        second.get(self.url + "/provider.json")
+
+        self.assertEqual(first.cookies.get("_session_id"), "1")
+        self.assertIsNone(second.cookies.get("_session_id"))
+
+    def test_closing_a_session_keeps_the_connections(self):
+        first = self.pool.mount(requests.session())
+        first.get(self.url)
+        first.close()
+        second = self.pool.mount(requests.session())
+        second.get(self.url)
+
+        self.assertEqual(self._get_stats(True)[0]["connections"], 1)
+
+    def test_max_per_host_enforced(self):
+        self.pool = ConnectionPool(max_per_host=1)
+        statuses = []
+
+        def get():
+            session = self.pool.mount(requests.session())
+            statuses.append(session.get(self.url + "/slow").status_code)
+
+        threads = [threading.Thread(target=get) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+
+        # the requests waited for the connection instead of opening more
+        self.assertEqual(statuses, [200, 200, 200])
+        stats = self._get_stats(True)[0]
+        self.assertEqual(stats["connections"], 1)
+        self.assertEqual(stats["requests"], 3)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
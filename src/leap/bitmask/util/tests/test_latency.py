@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+# test_latency.py
+# Copyright (C) 2014 LEAP
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+tests for the latency histograms
+"""
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from leap.bitmask.util import latency
+from leap.common.testing.basetest import BaseLeapTest
+
+
+class HistogramTestCase(BaseLeapTest):
+    """
+    Tests for the Histogram class.
+    """
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_empty(self):
+        h = latency.Histogram()
+        self.assertEqual(h.count, 0)
+        self.assertEqual(h.mean, 0.0)
+        self.assertEqual(h.percentile(50), 0.0)
+
+    def test_values(self):
+        h = latency.Histogram()
+        for value in (0.001, 0.002, 0.003, 0.5):
+            h.add(value)
+
+        self.assertEqual(h.count, 4)
+        self.assertAlmostEqual(h.mean, 0.5060 / 4)
+        self.assertEqual(h.max, 0.5)
+
+        # the percentile is the upper bound of its bucket
+        self.assertTrue(0.002 <= h.percentile(50) <= 0.004)
+        self.assertEqual(h.percentile(100), 0.5)
+
+    def test_above_last_bucket(self):
+        h = latency.Histogram()
+        h.add(1000)
+        self.assertEqual(h.percentile(50), 1000)
+
+
+class LatencyStatsTestCase(BaseLeapTest):
+    """
+    Tests for the LatencyStats class.
+    """
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_record_groups_by_command_and_phase(self):
+        stats = latency.LatencyStats()
+        stats.record("eip", "start", latency.QUEUED, 0.001)
+        stats.record("eip", "start", latency.QUEUED, 0.002)
+        stats.record("eip", "start", latency.FIRED, 1)
+
+        self.assertEqual(stats.get("eip", "start", latency.QUEUED).count, 2)
+        self.assertEqual(stats.get("eip", "start", latency.FIRED).count, 1)
+        self.assertIsNone(stats.get("eip", "stop", latency.QUEUED))
+
+    def test_report(self):
+        stats = latency.LatencyStats()
+        stats.record("authenticate", "login", latency.CALL, 0.01)
+        report = stats.report()
+        self.assertIn("authenticate.login", report)
+        self.assertIn(latency.CALL, report)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+# test_lazyimport.py
+# Copyright (C) 2014 LEAP
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+tests for the lazy imports, and the startup import budget
+"""
+import subprocess
+import sys
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from leap.bitmask.util import lazyimport
+from leap.common.testing.basetest import BaseLeapTest
+
+# Starts the backend the way an EIP only session does, and prints the heavy
+# modules that got loaded. It runs in a new interpreter, this one has
+# probably loaded them already.
+EIP_ONLY_STARTUP = """
+from leap.bitmask import app
+from leap.bitmask.backend import Backend
+from leap.bitmask.signaler import EventSignaler
+from leap.bitmask.util.lazyimport import loaded_heavy_modules
+
+Backend(signaler=EventSignaler())
+print ",".join(loaded_heavy_modules())
+"""
+
+
+class LazyModuleTestCase(BaseLeapTest):
+    """
+    Tests for the LazyModule class.
+    """
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_not_imported_until_used(self):
+        module = lazyimport.lazy_import("colorsys")
+        sys.modules.pop("colorsys", None)
+        self.assertNotIn("colorsys", sys.modules)
+        self.assertEqual(module.rgb_to_hsv(0, 0, 0), (0, 0, 0))
+        self.assertIn("colorsys", sys.modules)
+
+    def test_missing_attribute(self):
+        module = lazyimport.lazy_import("colorsys")
+        self.assertRaises(AttributeError, getattr, module, "nothing_here")
+
+    def test_loaded_heavy_modules(self):
+        sys.modules["leap.soledad.fake_for_test"] = sys
+        sys.modules["leap.soledadish"] = sys
+        try:
+            loaded = lazyimport.loaded_heavy_modules()
+            self.assertIn("leap.soledad.fake_for_test", loaded)
+            self.assertNotIn("leap.soledadish", loaded)
+        finally:
+            del sys.modules["leap.soledad.fake_for_test"]
+            del sys.modules["leap.soledadish"]
+
+
+class StartupBudgetTestCase(BaseLeapTest):
+    """
+    The heavy modules must not load when starting with EIP only.
+    """
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_eip_only_startup_loads_no_heavy_modules(self):
+        process = subprocess.Popen(
+            [sys.executable, "-c", EIP_ONLY_STARTUP],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        out, err = process.communicate()
+        self.assertEqual(process.returncode, 0, err)
+        loaded = out.strip().splitlines()[-1] if out.strip() else ""
+        self.assertEqual(loaded, "", "Loaded at startup: %s" % (loaded,))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
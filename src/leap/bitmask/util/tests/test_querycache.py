@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+# test_querycache.py
+# Copyright (C) 2014 LEAP
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+tests for the backend query cache
+"""
+import os
+import tempfile
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from leap.bitmask.util import querycache
+from leap.common.testing.basetest import BaseLeapTest
+
+
+class QueryCacheTestCase(BaseLeapTest):
+    """
+    Tests for the QueryCache class.
+    """
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.write(fd, "{}")
+        os.close(fd)
+        self.calls = 0
+
+    def tearDown(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _compute(self, value):
+        self.calls += 1
+        return value
+
+    def test_cached_while_file_unchanged(self):
+        cache = querycache.QueryCache()
+        self.assertEqual(cache.get("key", [self.path], self._compute, 1), 1)
+        self.assertEqual(cache.get("key", [self.path], self._compute, 2), 1)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(cache.hits, 1)
+
+    def test_file_change_invalidates(self):
+        cache = querycache.QueryCache()
+        cache.get("key", [self.path], self._compute, 1)
+        with open(self.path, "w") as f:
+            f.write('{"changed": true}')
+        self.assertEqual(cache.get("key", [self.path], self._compute, 2), 2)
+
+    def test_missing_file(self):
+        cache = querycache.QueryCache()
+        os.remove(self.path)
+        cache.get("key", [self.path], self._compute, 1)
+        self.assertEqual(cache.get("key", [self.path], self._compute, 2), 1)
+
+    def test_max_age(self):
+        cache = querycache.QueryCache(max_age=0)
+        cache.get("key", [self.path], self._compute, 1)
+        self.assertEqual(cache.get("key", [self.path], self._compute, 2), 2)
+
+    def test_invalidate(self):
+        cache = querycache.QueryCache()
+        cache.get("key", [self.path], self._compute, 1)
+        cache.invalidate("key")
+        self.assertEqual(cache.get("key", [self.path], self._compute, 2), 2)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+# test_requirement_checker.py
+# Copyright (C) 2014 LEAP
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+tests for the cached requirements check
+"""
+import os
+import shutil
+import tempfile
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+import mock
+
+from leap.bitmask.util import requirement_checker
+from leap.common.testing.basetest import BaseLeapTest
+
+
+class RequirementCheckerTestCase(BaseLeapTest):
+    """
+    Tests for the requirements check cache.
+    """
+
+    def setUp(self):
+        self.prefix = tempfile.mkdtemp()
+        self.requirements = ["mock"]
+
+        patches = [
+            mock.patch.object(requirement_checker, "get_path_prefix",
+                              return_value=self.prefix),
+            mock.patch.object(requirement_checker, "get_requirements",
+                              side_effect=lambda: self.requirements),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+        get_distribution = mock.patch.object(
+            requirement_checker, "get_distribution",
+            wraps=requirement_checker.get_distribution)
+        self.get_distribution = get_distribution.start()
+        self.addCleanup(get_distribution.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.prefix)
+
+    def test_second_check_is_cached(self):
+        self.assertTrue(requirement_checker.check_requirements())
+        self.assertEqual(self.get_distribution.call_count, 1)
+
+        self.assertTrue(requirement_checker.check_requirements())
+        self.assertEqual(self.get_distribution.call_count, 1)
+
+    def test_changed_requirements_check_again(self):
+        requirement_checker.check_requirements()
+        self.requirements = ["mock", "zope.interface"]
+        requirement_checker.check_requirements()
+        self.assertEqual(self.get_distribution.call_count, 3)
+
+    def test_failure_is_not_cached(self):
+        self.requirements = ["surely-not-installed-package"]
+        self.assertFalse(requirement_checker.check_requirements())
+        self.assertFalse(os.path.exists(
+            requirement_checker.get_cache_path()))
+
+    def test_without_cache(self):
+        requirement_checker.check_requirements()
+        requirement_checker.check_requirements(use_cache=False)
+        self.assertEqual(self.get_distribution.call_count, 2)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+# test_startup_profiler.py
+# Copyright (C) 2014 LEAP
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+tests for the startup profiler
+"""
+import __builtin__
+import json
+import os
+import sys
+import tempfile
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from leap.bitmask.util.startup_profiler import StartupProfiler
+from leap.common.testing.basetest import BaseLeapTest
+
+
+class StartupProfilerTestCase(BaseLeapTest):
+    """
+    Tests for the StartupProfiler class.
+    """
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+        self.profiler = StartupProfiler()
+
+    def tearDown(self):
+        self.profiler.finish()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _read_report(self):
+        with open(self.path) as f:
+            return json.load(f)
+
+    def test_disabled_writes_nothing(self):
+        with self.profiler.phase("parse_args"):
+            pass
+        os.remove(self.path)
+        self.profiler.finish()
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_phases_in_report(self):
+        self.profiler.enable(self.path)
+        with self.profiler.phase("parse_args"):
+            pass
+        self.profiler.mark("first_paint")
+        self.profiler.finish()
+
+        report = self._read_report()
+        names = [phase["name"] for phase in report["phases"]]
+        self.assertEqual(names, ["parse_args", "first_paint"])
+        self.assertEqual(report["phases"][1]["duration"], 0)
+        self.assertTrue(report["total"] >= report["phases"][1]["start"])
+
+    def test_records_new_imports_only(self):
+        sys.modules.pop("colorsys", None)
+        self.profiler.enable(self.path)
+        import colorsys
+        import os.path
+        self.profiler.finish()
+
+        modules = [i["module"] for i in self._read_report()["imports"]]
+        self.assertIn("colorsys", modules)
+        self.assertNotIn("os.path", modules)
+        assert(colorsys and os.path)
+
+    def test_finish_restores_import(self):
+        original = __builtin__.__import__
+        self.profiler.enable(self.path)
+        self.assertNotEqual(__builtin__.__import__, original)
+        self.profiler.finish()
+        self.assertEqual(__builtin__.__import__, original)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+# test_versioncache.py
+# Copyright (C) 2014 LEAP
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+tests for the version cache
+"""
+import os
+import shutil
+import tempfile
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from leap.bitmask.util import versioncache
+from leap.common.testing.basetest import BaseLeapTest
+
+COMMIT_A = "a" * 40
+COMMIT_B = "b" * 40
+
+
+class VersionCacheTestCase(BaseLeapTest):
+    """
+    Tests for the version cache.
+    """
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.git_dir = os.path.join(self.root, ".git")
+        os.makedirs(os.path.join(self.git_dir, "refs", "heads"))
+        self._write(".git/HEAD", "ref: refs/heads/master\n")
+        self._write(".git/refs/heads/master", COMMIT_A + "\n")
+        self.calls = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def _write(self, path, content):
+        with open(os.path.join(self.root, path), "w") as f:
+            f.write(content)
+
+    def _compute(self):
+        self.calls += 1
+        return {"version": "0.6.%d" % (self.calls,), "full": COMMIT_A}
+
+    def test_cached_while_head_unchanged(self):
+        first = versioncache.get_versions(self.root, self._compute)
+        second = versioncache.get_versions(self.root, self._compute)
+        self.assertEqual(first, second)
+        self.assertEqual(self.calls, 1)
+
+    def test_new_commit_invalidates(self):
+        versioncache.get_versions(self.root, self._compute)
+        self._write(".git/refs/heads/master", COMMIT_B + "\n")
+        versions = versioncache.get_versions(self.root, self._compute)
+        self.assertEqual(versions["version"], "0.6.2")
+
+    def test_new_tag_invalidates(self):
+        versioncache.get_versions(self.root, self._compute)
+        # git tag 0.6.0, on the same HEAD
+        os.makedirs(os.path.join(self.git_dir, "refs", "tags"))
+        self._write(".git/refs/tags/0.6.0", COMMIT_A + "\n")
+        versions = versioncache.get_versions(self.root, self._compute)
+        self.assertEqual(versions["version"], "0.6.2")
+
+        # git pack-refs moves it to the packed refs
+        os.remove(os.path.join(self.git_dir, "refs", "tags", "0.6.0"))
+        self._write(".git/packed-refs", "%s refs/tags/0.6.0\n" % (COMMIT_A,))
+        versions = versioncache.get_versions(self.root, self._compute)
+        self.assertEqual(versions["version"], "0.6.3")
+        versions = versioncache.get_versions(self.root, self._compute)
+        self.assertEqual(versions["version"], "0.6.3")
+
+    def test_packed_and_detached_head(self):
+        os.remove(os.path.join(self.git_dir, "refs", "heads", "master"))
+        self._write(".git/packed-refs",
+                    "# pack-refs with: peeled\n"
+                    "%s refs/heads/master\n" % (COMMIT_B,))
+        self.assertEqual(versioncache.get_head(self.git_dir), COMMIT_B)
+
+        self._write(".git/HEAD", COMMIT_A + "\n")
+        self.assertEqual(versioncache.get_head(self.git_dir), COMMIT_A)
+
+    def test_no_checkout_computes_always(self):
+        shutil.rmtree(self.git_dir)
+        versioncache.get_versions(self.root, self._compute)
+        versioncache.get_versions(self.root, self._compute)
+        self.assertEqual(self.calls, 2)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+# test_wire.py
+# Copyright (C) 2014 LEAP
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+tests for the backend wire format
+"""
+import datetime
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from leap.bitmask.util import wire
+from leap.common.testing.basetest import BaseLeapTest
+
+
+class Details(object):
+    """
+    Plain data object used to test registered types.
+    """
+    def __init__(self):
+        self.domain = u"example.org"
+        self.services = [u"openvpn", u"mx"]
+
+    @property
+    def services_string(self):
+        return ", ".join(self.services)
+
+
+class PlainObject(object):
+    """
+    Plain data object that is not registered.
+    """
+    def __init__(self):
+        self.address = u"user@example.org"
+        self.key_id = "0123456789ABCDEF"
+
+
+class WireTestCase(BaseLeapTest):
+    """
+    Tests for the wire serialization.
+    """
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def _roundtrip(self, obj):
+        return wire.unpack(wire.pack(obj))
+
+    def test_basic_types(self):
+        data = {u"passed": True, u"error": u"", u"count": 42}
+        self.assertEqual(self._roundtrip(data), data)
+
+    def test_unicode_and_bytes(self):
+        self.assertEqual(self._roundtrip(u"ñandú"), u"ñandú")
+        self.assertEqual(self._roundtrip("\x00\xff"), "\x00\xff")
+
+    def test_tuples_become_lists(self):
+        data = [(u"example.org", True)]
+        self.assertEqual(self._roundtrip(data), [[u"example.org", True]])
+
+    def test_set(self):
+        data = set([u"openvpn", u"mx"])
+        self.assertEqual(self._roundtrip(data), data)
+
+    def test_datetime(self):
+        data = datetime.datetime(2014, 6, 12, 10, 30, 15, 500)
+        self.assertEqual(self._roundtrip(data), data)
+
+    def test_registered_type(self):
+        wire.register_type(Details)
+        details = self._roundtrip(Details())
+        self.assertIsInstance(details, Details)
+        self.assertEqual(details.services_string, u"openvpn, mx")
+
+    def test_unregistered_type(self):
+        obj = self._roundtrip([PlainObject()])[0]
+        self.assertIsInstance(obj, wire.RemoteObject)
+        self.assertEqual(obj.address, u"user@example.org")
+        self.assertEqual(obj.key_id, "0123456789ABCDEF")
+
+    def test_unserializable(self):
+        self.assertRaises(TypeError, wire.pack, object())
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+# threadpools.py
+# Copyright (C) 2014 LEAP
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Named, bounded thread pools for the backend subsystems.
+
+Each subsystem runs its blocking work in its own pool instead of the global
+reactor one, so a slow soledad sync can't starve the EIP or the login.
+"""
+import logging
+import threading
+import time
+
+from twisted.internet import reactor, threads
+from twisted.python.threadpool import ThreadPool
+
+logger = logging.getLogger(__name__)
+
+# Pool names
+BACKEND = "backend"
+PROVIDER = "provider"
+AUTH = "auth"
+EIP = "eip"
+SOLEDAD = "soledad"
+MAIL = "mail"
+REFRESH = "refresh"
+DNS = "dns"
+
+# Maximum number of threads for each pool.
+POOL_SIZES = {
+    # the backend worker runs the commands one at a time.
+    BACKEND: 1,
+    PROVIDER: 2,
+    AUTH: 2,
+    EIP: 2,
+    SOLEDAD: 2,
+    # stopping imap waits in a thread for another one to finish.
+    MAIL: 4,
+    # the background refresh of the provider files, see provider/refresher
+    REFRESH: 4,
+    # the lookups libc does for the dns cache, see util/dnscache
+    DNS: 2,
+}
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _daemon_thread(*args, **kwargs):
+    """
+    Thread factory for the pools, their threads should not keep the process
+    alive.
+    """
+    thread = threading.Thread(*args, **kwargs)
+    thread.daemon = True
+    return thread
+
+
+class _ComponentThreadPool(ThreadPool):
+    """
+    ThreadPool that runs its workers in daemon threads.
+    """
+    threadFactory = staticmethod(_daemon_thread)
+
+
+class PoolStats(object):
+    """
+    Usage statistics for a thread pool.
+    """
+
+    def __init__(self, size):
+        """
+        :param size: the maximum number of threads of the pool.
+        :type size: int
+        """
+        self.size = size
+        self.active = 0
+        self.queued = 0
+        self.completed = 0
+        self.max_wait = 0.0
+        self._lock = threading.Lock()
+
+    def task_queued(self):
+        with self._lock:
+            self.queued += 1
+
+    def task_started(self, wait):
+        """
+        :param wait: the time the task waited for a thread, in seconds.
+        :type wait: float
+        """
+        with self._lock:
+            self.queued -= 1
+            self.active += 1
+            self.max_wait = max(self.max_wait, wait)
+
+    def task_finished(self):
+        with self._lock:
+            self.active -= 1
+            self.completed += 1
+
+    def as_dict(self):
+        """
+        :rtype: dict
+        """
+        with self._lock:
+            return {
+                "size": self.size,
+                "active": self.active,
+                "queued": self.queued,
+                "completed": self.completed,
+                "max_wait": self.max_wait,
+            }
+
+
+def _get_pool(name):
+    """
+    Return the pool and its stats for the given name, creating it if needed.
+
+    :param name: the name of the pool, one of POOL_SIZES.
+    :type name: str
+
+    :rtype: tuple (ThreadPool, PoolStats)
+    """
+    with _pools_lock:
+        entry = _pools.get(name)
+        if entry is None:
+            size = POOL_SIZES[name]
+            pool = _ComponentThreadPool(minthreads=0, maxthreads=size,
+                                        name="bitmask-%s" % (name,))
+            pool.start()
+            reactor.addSystemEventTrigger('during', 'shutdown', pool.stop)
+            entry = _pools[name] = (pool, PoolStats(size))
+        return entry
+
+
+def defer_to_pool(name, f, *args, **kwargs):
+    """
+    Run a function in the named pool, and return a defer with its result.
+    Works like twisted.internet.threads.deferToThread.
+
+    :param name: the name of the pool, one of POOL_SIZES.
+    :type name: str
+    :param f: the function to run.
+    :type f: callable
+
+    :rtype: twisted.internet.defer.Deferred
+    """
+    pool, stats = _get_pool(name)
+    queued_at = time.time()
+    stats.task_queued()
+
+    def run():
+        stats.task_started(time.time() - queued_at)
+        try:
+            return f(*args, **kwargs)
+        finally:
+            stats.task_finished()
+
+    return threads.deferToThreadPool(reactor, pool, run)
+
+
+def get_stats():
+    """
+    Return the stats for every pool created so far.
+
+    :rtype: dict, {str: dict}
+    """
+    with _pools_lock:
+        entries = dict(_pools)
+    return dict((name, stats.as_dict())
+                for name, (_, stats) in entries.iteritems())
+
+
+def report():
+    """
+    Return a human readable report with the stats of the pools.
+
+    :rtype: str
+    """
+    header = "%-10s %5s %7s %7s %10s %12s" % (
+        "pool", "size", "active", "queued", "completed", "max wait ms")
+    lines = [header, "-" * len(header)]
+    for name, stats in sorted(get_stats().iteritems()):
+        lines.append("%-10s %5d %7d %7d %10d %12.1f" % (
+            name, stats["size"], stats["active"], stats["queued"],
+            stats["completed"], stats["max_wait"] * 1000))
+    return "\n".join(lines) + "\n"
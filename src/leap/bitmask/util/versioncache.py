@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+# versioncache.py
+# Copyright (C) 2014 LEAP
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Cache for the version of a git checkout.
+
+In a git checkout, _version.get_versions runs `git describe` and
+`git rev-parse`. Their result is saved in the .git directory, keyed by the
+commit at HEAD, the index and the tags, and reused while those stay the
+same. They are read from the files, so a cache hit doesn't run git at all.
+
+Changes in the working tree that are not staged don't touch the index, so
+the "-dirty" suffix is the one computed when the commit or the index last
+changed.
+"""
+import hashlib
+import json
+import os
+
+CACHE_NAME = "bitmask-version.json"
+
+
+def _read_file(path):
+    """
+    Return the stripped content of a file, or None if it can't be read.
+
+    :type path: str
+    :rtype: str or None
+    """
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except (IOError, OSError):
+        return None
+
+
+def _git_dir(root):
+    """
+    Return the git directory of the checkout at `root`, or None.
+
+    :param root: the root of the source tree.
+    :type root: str
+    :rtype: str or None
+    """
+    git = os.path.join(root, ".git")
+    if os.path.isdir(git):
+        return git
+    # worktrees and submodules have a file pointing to the git directory.
+    content = _read_file(git)
+    if content is not None and content.startswith("gitdir:"):
+        return os.path.join(root, content[len("gitdir:"):].strip())
+    return None
+
+
+def _packed_ref(git_dir, ref):
+    """
+    Return the commit of `ref` from the packed refs, or None.
+    """
+    content = _read_file(os.path.join(git_dir, "packed-refs"))
+    if content is None:
+        return None
+    for line in content.splitlines():
+        parts = line.split()
+        if len(parts) == 2 and parts[1] == ref:
+            return parts[0]
+    return None
+
+
+def get_head(git_dir):
+    """
+    Return the commit at HEAD, reading the git files.
+
+    :param git_dir: the git directory.
+    :type git_dir: str
+    :rtype: str or None
+    """
+    head = _read_file(os.path.join(git_dir, "HEAD"))
+    if head is None or not head.startswith("ref:"):
+        # detached HEAD, or nothing at all.
+        return head
+    ref = head[len("ref:"):].strip()
+    commit = _read_file(os.path.join(git_dir, ref))
+    if commit is None:
+        commit = _packed_ref(git_dir, ref)
+    return commit
+
+
+def _get_tags_digest(git_dir):
+    """
+    Return a digest of the tags of the checkout, that changes when a tag is
+    added, moved or removed.
+
+    :param git_dir: the git directory.
+    :type git_dir: str
+    :rtype: str
+    """
+    # the refs of a worktree are in the main git directory.
+    common_dir = _read_file(os.path.join(git_dir, "commondir"))
+    if common_dir is not None:
+        git_dir = os.path.join(git_dir, common_dir)
+
+    digest = hashlib.sha1()
+    tags_dir = os.path.join(git_dir, "refs", "tags")
+    for path, dirs, files in sorted(os.walk(tags_dir)):
+        for name in sorted(files):
+            tag = os.path.join(path, name)
+            digest.update("%s %s\n" % (os.path.relpath(tag, tags_dir),
+                                        _read_file(tag)))
+    # the tags that aren't loose are packed.
+    try:
+        packed_mtime = os.stat(os.path.join(git_dir, "packed-refs")).st_mtime
+    except OSError:
+        packed_mtime = None
+    digest.update("packed-refs %s\n" % (packed_mtime,))
+    return digest.hexdigest()
+
+
+def _cache_key(git_dir):
+    """
+    Return the key for the current state of the checkout, or None if HEAD
+    can't be read.
+    """
+    head = get_head(git_dir)
+    if head is None:
+        return None
+    try:
+        index_mtime = os.stat(os.path.join(git_dir, "index")).st_mtime
+    except OSError:
+        index_mtime = None
+    return "%s:%s:%s" % (head, index_mtime, _get_tags_digest(git_dir))
+
+
+def get_versions(root, compute):
+    """
+    Return the versions for the source tree at `root`, computing them with
+    `compute` only if the cached ones are outdated.
+
+    Outside of a git checkout, `compute` doesn't run git, so it's simply
+    called.
+
+    :param root: the root of the source tree.
+    :type root: str
+    :param compute: the function that computes the versions, usually
+                    _version.get_versions.
+    :type compute: callable
+    :returns: the versions, with 'version' and 'full' keys.
+    :rtype: dict
+    """
+    git_dir = _git_dir(root)
+    key = None if git_dir is None else _cache_key(git_dir)
+    if key is None:
+        return compute()
+
+    cache_path = os.path.join(git_dir, CACHE_NAME)
+    try:
+        with open(cache_path) as f:
+            cached = json.load(f)
+        if cached.get("key") == key:
+            # json gives unicode back, the versions are plain strings.
+            return dict((str(name), str(value))
+                        for name, value in cached["versions"].items())
+    except (IOError, OSError, ValueError, KeyError, AttributeError):
+        pass
+
+    versions = compute()
+    tmp_path = "%s.%d" % (cache_path, os.getpid())
+    try:
+        with open(tmp_path, "w") as f:
+            json.dump({"key": key, "versions": versions}, f)
+        os.rename(tmp_path, cache_path)
+    except (IOError, OSError):
+        # a read only checkout, it'll run git next time too.
+        pass
+    return versions
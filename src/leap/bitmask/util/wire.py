@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+# wire.py
+# Copyright (C) 2014 LEAP
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Compact binary serialization for the messages exchanged between the
+frontend and the backend process.
+
+It uses msgpack, with some extension types for the objects that the backend
+sends along with its signals (sets, datetimes and plain data objects).
+"""
+import datetime
+import time
+
+import msgpack
+
+EXT_SET = 1
+EXT_DATETIME = 2
+EXT_OBJECT = 3
+
+# Classes that can be rebuilt on the receiving side, by qualified name.
+_registry = {}
+
+
+class RemoteObject(object):
+    """
+    Attribute holder used to rebuild the objects whose class is not
+    registered.
+    """
+    def __init__(self, name, attrs):
+        """
+        :param name: the qualified class name of the original object.
+        :type name: str
+        :param attrs: the attributes of the original object.
+        :type attrs: dict
+        """
+        self.__dict__.update(attrs)
+        self._remote_class = name
+
+    def __repr__(self):
+        return "<RemoteObject %s>" % (self._remote_class,)
+
+
+def _qualified_name(cls):
+    """
+    Return the qualified name for a class.
+
+    :param cls: the class
+    :type cls: type
+
+    :rtype: str
+    """
+    return "%s.%s" % (cls.__module__, cls.__name__)
+
+
+def register_type(cls):
+    """
+    Register a class so that its instances are rebuilt as instances of the
+    same class when unpacked. The class instances should be plain data
+    objects, since only their __dict__ travels through the wire.
+
+    Can be used as a class decorator.
+
+    :param cls: the class to register.
+    :type cls: type
+
+    :returns: the same class
+    :rtype: type
+    """
+    _registry[_qualified_name(cls)] = cls
+    return cls
+
+
+def _default(obj):
+    """
+    Hook for msgpack to serialize the types it does not know about.
+
+    :param obj: the object to serialize
+    :type obj: object
+
+    :rtype: msgpack.ExtType
+    """
+    if isinstance(obj, (set, frozenset)):
+        return msgpack.ExtType(EXT_SET, pack(list(obj)))
+
+    if isinstance(obj, datetime.datetime):
+        ts = time.mktime(obj.timetuple()) + obj.microsecond / 1e6
+        return msgpack.ExtType(EXT_DATETIME, pack(ts))
+
+    if hasattr(obj, '__dict__'):
+        name = _qualified_name(obj.__class__)
+        return msgpack.ExtType(EXT_OBJECT, pack([name, obj.__dict__]))
+
+    raise TypeError("Cannot serialize %r" % (obj,))
+
+
+def _ext_hook(code, data):
+    """
+    Hook for msgpack to deserialize our extension types.
+
+    :param code: the extension type code
+    :type code: int
+    :param data: the packed data for the extension
+    :type data: str
+
+    :rtype: object
+    """
+    if code == EXT_SET:
+        return set(unpack(data))
+
+    if code == EXT_DATETIME:
+        return datetime.datetime.fromtimestamp(unpack(data))
+
+    if code == EXT_OBJECT:
+        name, attrs = unpack(data)
+        cls = _registry.get(name)
+        if cls is None:
+            return RemoteObject(name, attrs)
+        # we don't call the constructor, we just restore the state
+        obj = cls.__new__(cls)
+        obj.__dict__.update(attrs)
+        return obj
+
+    return msgpack.ExtType(code, data)
+
+
+def pack(obj):
+    """
+    Serialize an object.
+
+    Notice that tuples are serialized as lists.
+
+    :param obj: the object to serialize
+    :type obj: object
+
+    :rtype: str
+    """
+    return msgpack.packb(obj, default=_default, use_bin_type=True)
+
+
+def unpack(data):
+    """
+    Deserialize data serialized with `pack`.
+
+    :param data: the serialized data
+    :type data: str
+
+    :rtype: object
+    """
+    return msgpack.unpackb(data, ext_hook=_ext_hook, encoding='utf-8')